@@ -175,6 +175,12 @@ export const alertApi = {
   resolve: (id: string, notes?: string) =>
     apiClient.post(`/alerts/logs/${id}/resolve`, { notes }),
   
+  bulkAcknowledge: (data: { alert_ids?: string[]; filter?: any; notes?: string }) =>
+    apiClient.post('/alerts/logs/acknowledge', data),
+  
+  bulkResolve: (data: { alert_ids?: string[]; filter?: any; notes?: string }) =>
+    apiClient.post('/alerts/logs/resolve', data),
+  
   // Stats
   getStats: () =>
     apiClient.get('/alerts/stats'),
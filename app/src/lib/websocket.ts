@@ -6,17 +6,38 @@ import { io, Socket } from 'socket.io-client';
 
 const WS_BASE_URL = import.meta.env.VITE_WS_URL || 'ws://localhost:8000/api/v1/ws';
 
+// Feed entry ids are "<ms>-<seq>"; later entries compare greater
+function isNewer(id: string, than: string): boolean {
+  const [ms, seq] = id.split('-').map(Number);
+  const [thanMs, thanSeq] = than.split('-').map(Number);
+  return ms > thanMs || (ms === thanMs && seq > thanSeq);
+}
+
+// Recent entry ids remembered per key to drop duplicates
+const SEEN_IDS = 500;
+
 class WebSocketManager {
   private sockets: Map<string, Socket> = new Map();
   private listeners: Map<string, Set<(data: any) => void>> = new Map();
-
-  connect(channel: string, token: string): Socket {
-    if (this.sockets.has(channel)) {
-      return this.sockets.get(channel)!;
+  // Last feed entry seen per key, sent on reconnect to get only what was missed
+  private lastIds: Map<string, string> = new Map();
+  // The server replays missed entries after joining the live feed, so the
+  // two can interleave and overlap; ids already seen are dropped
+  private seenIds: Map<string, Set<string>> = new Map();
+
+  connect(
+    channel: string,
+    token: string,
+    params: Record<string, string> = {},
+    key: string = channel
+  ): Socket {
+    if (this.sockets.has(key)) {
+      return this.sockets.get(key)!;
     }
 
     const socket = io(`${WS_BASE_URL}/${channel}`, {
-      auth: { token },
+      // Called again on every reconnection
+      auth: (cb) => cb({ token, ...params, last_id: this.lastIds.get(key) }),
       transports: ['websocket'],
       reconnection: true,
       reconnectionDelay: 1000,
@@ -31,30 +52,69 @@ class WebSocketManager {
       console.log(`Disconnected from ${channel} WebSocket`);
     });
 
+    // Refused connections are not retried automatically; only a full
+    // server (1013) is worth trying again, a bad token or too many tabs is not
+    socket.on('connect_error', (error: Error & { data?: { code?: number } }) => {
+      console.error(`Connection to ${channel} refused:`, error.message);
+      if (error.data?.code === 1013) {
+        setTimeout(() => socket.connect(), 5000 + Math.random() * 5000);
+      }
+    });
+
     socket.on('error', (error) => {
       console.error(`WebSocket error on ${channel}:`, error);
     });
 
     // Handle incoming messages
     socket.on('message', (data) => {
-      this.notifyListeners(channel, data);
+      if (data?.id && !this.markSeen(key, data.id)) {
+        return;
+      }
+      // A `resync` message means updates were missed: refetch in full
+      this.notifyListeners(key, data);
     });
 
-    this.sockets.set(channel, socket);
+    this.sockets.set(key, socket);
     return socket;
   }
 
-  disconnect(channel: string): void {
-    const socket = this.sockets.get(channel);
+  // Records an entry id; false if it was seen before
+  private markSeen(key: string, id: string): boolean {
+    let seen = this.seenIds.get(key);
+    if (!seen) {
+      seen = new Set();
+      this.seenIds.set(key, seen);
+    }
+    if (seen.has(id)) {
+      return false;
+    }
+    seen.add(id);
+    if (seen.size > SEEN_IDS) {
+      // Sets iterate in insertion order: forget the oldest
+      seen.delete(seen.values().next().value!);
+    }
+    const last = this.lastIds.get(key);
+    if (!last || isNewer(id, last)) {
+      this.lastIds.set(key, id);
+    }
+    return true;
+  }
+
+  disconnect(key: string): void {
+    const socket = this.sockets.get(key);
     if (socket) {
       socket.disconnect();
-      this.sockets.delete(channel);
+      this.sockets.delete(key);
+      this.lastIds.delete(key);
+      this.seenIds.delete(key);
     }
   }
 
   disconnectAll(): void {
     this.sockets.forEach((socket) => socket.disconnect());
     this.sockets.clear();
+    this.lastIds.clear();
+    this.seenIds.clear();
   }
 
   subscribe(channel: string, callback: (data: any) => void): () => void {
@@ -82,12 +142,10 @@ class WebSocketManager {
   }
 
   connectDetections(token: string, cameraId?: string): Socket {
-    const channel = cameraId ? `detections?camera_id=${cameraId}` : 'detections';
-    return this.connect(channel, token);
-  }
-
-  connectCameraStream(cameraId: string, token: string): Socket {
-    return this.connect(`cameras/${cameraId}/stream`, token);
+    if (!cameraId) {
+      return this.connect('detections', token);
+    }
+    return this.connect('detections', token, { camera_id: cameraId }, `detections:${cameraId}`);
   }
 
   connectSystem(token: string): Socket {
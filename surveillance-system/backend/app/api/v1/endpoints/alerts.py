@@ -1,24 +1,29 @@
 """Alert management endpoints."""
 
-from typing import List, Optional
+import base64
+import json
+from typing import List, Optional, Tuple
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import select, desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select, desc, func, tuple_, update
+from sqlalchemy.orm import aliased
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
-from app.core.redis import publish, cache_delete_pattern
+from app.core.redis import publish_alert_update
 from app.models.alert import AlertRule, AlertLog
+from app.models.audit import AuditLog
 from app.models.camera import Camera
 from app.models.subject import Subject
 from app.schemas.alert import (
     AlertRuleCreate, AlertRuleUpdate, AlertRuleResponse,
     AlertLogResponse, AlertAcknowledgeRequest, AlertResolveRequest,
-    AlertStatsResponse
+    AlertBulkRequest, AlertBulkResponse, AlertStatsResponse
 )
 from app.api.deps import get_current_user, require_permission
+from app.services.rules import notify_rule_change
 
 router = APIRouter()
 
@@ -71,6 +76,7 @@ async def create_alert_rule(
     db.add(db_rule)
     await db.commit()
     await db.refresh(db_rule)
+    await notify_rule_change(str(db_rule.rule_id), "created")
     
     return AlertRuleResponse.from_orm(db_rule)
 
@@ -128,6 +134,7 @@ async def update_alert_rule(
     
     await db.commit()
     await db.refresh(rule)
+    await notify_rule_change(str(rule_id), "updated")
     
     return AlertRuleResponse.from_orm(rule)
 
@@ -152,14 +159,41 @@ async def delete_alert_rule(
     
     await db.delete(rule)
     await db.commit()
+    await notify_rule_change(str(rule_id), "deleted")
     
     return None
 
 
+ACTIVE_STATUSES = ("open", "acknowledged", "escalated")
+
+
+def _list_order(alert):
+    """Alert list order; alerts without a priority come last, as priority 0."""
+    return func.coalesce(alert.priority, 0).desc(), alert.created_at.desc(), alert.alert_id.desc()
+
+
+def _encode_cursor(alert: AlertLog) -> str:
+    key = {"p": alert.priority or 0, "c": alert.created_at.isoformat(), "id": str(alert.alert_id)}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[int, datetime, UUID]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(key["p"]), datetime.fromisoformat(key["c"]), UUID(key["id"])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 @router.get("/logs", response_model=List[AlertLogResponse])
 async def list_alert_logs(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     status: Optional[str] = None,
     rule_id: Optional[UUID] = None,
     subject_id: Optional[UUID] = None,
@@ -167,41 +201,56 @@ async def list_alert_logs(
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """List alert logs with filtering."""
-    # Use the active_alerts view for better performance
-    from sqlalchemy import text
-    
-    query = text("""
-        SELECT * FROM active_alerts
-        WHERE 1=1
-        AND (:status IS NULL OR status = :status)
-        AND (:rule_id IS NULL OR rule_id = :rule_id)
-        AND (:subject_id IS NULL OR subject_id = :subject_id)
-        AND (:camera_id IS NULL OR camera_id = :camera_id)
-        ORDER BY priority DESC, created_at DESC
-        LIMIT :limit OFFSET :skip
-    """)
-    
-    result = await db.execute(query, {
-        "status": status,
-        "rule_id": str(rule_id) if rule_id else None,
-        "subject_id": str(subject_id) if subject_id else None,
-        "camera_id": str(camera_id) if camera_id else None,
-        "limit": limit,
-        "skip": skip
-    })
-    
+    """
+    List alert logs with filtering, highest priority and newest first.
+    Without a status only open, acknowledged and escalated alerts are
+    listed. Pass the X-Next-Cursor header of a page as `cursor` to fetch
+    the next one.
+    """
+    # Filter and page alert_logs alone, only adding the predicates in use,
+    # so the (status, coalesce(priority, 0), created_at) indexes can serve the order
+    page = select(AlertLog)
+    if status:
+        page = page.where(AlertLog.status == status)
+    else:
+        page = page.where(AlertLog.status.in_(ACTIVE_STATUSES))
+    if rule_id:
+        page = page.where(AlertLog.rule_id == rule_id)
+    if subject_id:
+        page = page.where(AlertLog.subject_id == subject_id)
+    if camera_id:
+        page = page.where(AlertLog.camera_id == camera_id)
+    if cursor:
+        page = page.where(
+            tuple_(func.coalesce(AlertLog.priority, 0), AlertLog.created_at, AlertLog.alert_id) < _decode_cursor(cursor)
+        )
+    elif skip:
+        page = page.offset(skip)
+    page = page.order_by(*_list_order(AlertLog)).limit(limit).subquery()
+    alert = aliased(AlertLog, page)
+
+    # Labels are joined for the page rows only
+    result = await db.execute(
+        select(alert, AlertRule.name, AlertRule.rule_type, Subject.label, Camera.name)
+        .outerjoin(AlertRule, AlertRule.rule_id == alert.rule_id)
+        .outerjoin(Subject, Subject.subject_id == alert.subject_id)
+        .outerjoin(Camera, Camera.camera_id == alert.camera_id)
+        .order_by(*_list_order(alert))
+    )
+    rows = result.all()
+
+    now = datetime.now(timezone.utc)
     alerts = []
-    for row in result:
+    for row, rule_name, rule_type, subject_label, camera_name in rows:
         alerts.append(AlertLogResponse(
             alert_id=row.alert_id,
             rule_id=row.rule_id,
-            rule_name=row.rule_name,
-            rule_type=row.rule_type,
+            rule_name=rule_name,
+            rule_type=rule_type,
             subject_id=row.subject_id,
-            subject_label=row.subject_label,
+            subject_label=subject_label,
             camera_id=row.camera_id,
-            camera_name=row.camera_name,
+            camera_name=camera_name,
             trigger_data=row.trigger_data,
             status=row.status,
             priority=row.priority,
@@ -210,12 +259,135 @@ async def list_alert_logs(
             resolved_at=row.resolved_at,
             notes=row.notes,
             created_at=row.created_at,
-            age_minutes=row.age_minutes
+            age_minutes=(now - row.created_at).total_seconds() / 60 if row.created_at else None
         ))
-    
+
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1][0])
+
     return alerts
 
 
+async def _bulk_update(
+    db: AsyncSession,
+    request: AlertBulkRequest,
+    from_statuses: Tuple[str, ...],
+    values: dict,
+    action: str,
+    current_user
+) -> List[UUID]:
+    """
+    Apply a status change to every matching alert in one UPDATE ... RETURNING
+    and record a single audit entry for it. Returns the ids changed.
+    """
+    if request.alert_ids is None and request.filter is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide alert_ids or a filter"
+        )
+    # An empty selection would otherwise match every open alert
+    if request.alert_ids is not None and not request.alert_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="alert_ids is empty"
+        )
+    if request.filter is not None and not request.filter.model_dump(exclude_none=True):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="filter sets no criteria"
+        )
+
+    query = update(AlertLog).where(AlertLog.status.in_(from_statuses))
+    if request.alert_ids:
+        query = query.where(AlertLog.alert_id.in_(request.alert_ids))
+    if request.filter is not None:
+        criteria = request.filter
+        if criteria.rule_id:
+            query = query.where(AlertLog.rule_id == criteria.rule_id)
+        if criteria.subject_id:
+            query = query.where(AlertLog.subject_id == criteria.subject_id)
+        if criteria.camera_id:
+            query = query.where(AlertLog.camera_id == criteria.camera_id)
+        if criteria.max_priority is not None:
+            query = query.where(AlertLog.priority <= criteria.max_priority)
+        if criteria.created_before:
+            query = query.where(AlertLog.created_at < criteria.created_before)
+    if request.notes:
+        values["notes"] = request.notes
+
+    result = await db.execute(
+        query.values(**values)
+        .returning(AlertLog.alert_id)
+        .execution_options(synchronize_session=False)
+    )
+    alert_ids = list(result.scalars())
+
+    db.add(AuditLog.create_log(
+        action=action,
+        resource_type="alert",
+        user_id=current_user.user_id,
+        user_role=current_user.role,
+        details={
+            "count": len(alert_ids),
+            "alert_ids": [str(alert_id) for alert_id in alert_ids],
+            "filter": request.filter.model_dump(mode="json", exclude_none=True) if request.filter else None
+        }
+    ))
+    await db.commit()
+    return alert_ids
+
+
+@router.post("/logs/acknowledge", response_model=AlertBulkResponse)
+async def bulk_acknowledge_alerts(
+    request: AlertBulkRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(require_permission("alerts:write"))
+):
+    """Acknowledge every open or escalated alert matching the ids or filter."""
+    alert_ids = await _bulk_update(
+        db, request, ("open", "escalated"),
+        {
+            "status": "acknowledged",
+            "acknowledged_by": current_user.user_id,
+            "acknowledged_at": func.now()
+        },
+        "bulk_acknowledge_alert",
+        current_user
+    )
+
+    if alert_ids:
+        await publish_alert_update({
+            "type": "bulk_acknowledged",
+            "alert_ids": [str(alert_id) for alert_id in alert_ids],
+            "acknowledged_by": str(current_user.user_id)
+        })
+
+    return AlertBulkResponse(updated=len(alert_ids), alert_ids=alert_ids)
+
+
+@router.post("/logs/resolve", response_model=AlertBulkResponse)
+async def bulk_resolve_alerts(
+    request: AlertBulkRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(require_permission("alerts:write"))
+):
+    """Resolve every unresolved alert matching the ids or filter."""
+    alert_ids = await _bulk_update(
+        db, request, ACTIVE_STATUSES,
+        {"status": "resolved", "resolved_at": func.now()},
+        "bulk_resolve_alert",
+        current_user
+    )
+
+    if alert_ids:
+        await publish_alert_update({
+            "type": "bulk_resolved",
+            "alert_ids": [str(alert_id) for alert_id in alert_ids]
+        })
+
+    return AlertBulkResponse(updated=len(alert_ids), alert_ids=alert_ids)
+
+
 @router.get("/logs/{alert_id}", response_model=AlertLogResponse)
 async def get_alert_log(
     alert_id: UUID,
@@ -264,7 +436,7 @@ async def acknowledge_alert(
     await db.refresh(alert)
     
     # Publish to WebSocket
-    await publish("alerts:updates", {
+    await publish_alert_update({
         "type": "acknowledged",
         "alert_id": str(alert_id),
         "acknowledged_by": str(current_user.user_id)
@@ -300,7 +472,7 @@ async def resolve_alert(
     await db.refresh(alert)
     
     # Publish to WebSocket
-    await publish("alerts:updates", {
+    await publish_alert_update({
         "type": "resolved",
         "alert_id": str(alert_id)
     })
@@ -8,7 +8,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select, func, desc, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.tracing import END_TO_END, STAGES, load_histograms, merge_histograms, quantile
 from app.models.camera import Camera
 from app.models.subject import Subject
 from app.models.sighting import Sighting
@@ -17,7 +19,8 @@ from app.schemas.analytics import (
     HeatmapRequest, HeatmapResponse, HeatmapDataPoint,
     StatisticsResponse, CameraStatsResponse,
     MovementFlowResponse, MovementFlow,
-    DemographicsResponse, ExportRequest
+    DemographicsResponse, ExportRequest,
+    StageLatency, CameraPipelineLatency, PipelineLatencyResponse
 )
 from app.api.deps import get_current_user, require_permission
 
@@ -194,6 +197,64 @@ async def get_camera_stats(
     )
 
 
+def _stage_latencies(histograms: Dict[str, Dict[str, Any]]) -> Dict[str, StageLatency]:
+    """Summaries in pipeline order, end-to-end figures last."""
+    order = list(STAGES) + list(END_TO_END.values())
+    latencies = {}
+    for stage in sorted(histograms, key=lambda s: order.index(s) if s in order else len(order)):
+        entry = histograms[stage]
+        percentiles = {
+            q: quantile(entry["buckets"], q / 100) for q in (50, 95, 99)
+        }
+        latencies[stage] = StageLatency(
+            count=entry["count"],
+            mean_ms=round(entry["sum"] / entry["count"] * 1000, 1) if entry["count"] else None,
+            **{
+                f"p{q}_ms": round(value * 1000, 1) if value is not None else None
+                for q, value in percentiles.items()
+            }
+        )
+    return latencies
+
+
+@router.get("/pipeline-latency", response_model=PipelineLatencyResponse)
+async def get_pipeline_latency(
+    camera_id: Optional[UUID] = None,
+    minutes: int = Query(15, ge=1, le=settings.TRACING_WINDOW_MINUTES),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Get per-stage and end-to-end pipeline latency per camera."""
+    histograms = await load_histograms(
+        camera_ids=[str(camera_id)] if camera_id else None,
+        minutes=minutes
+    )
+
+    names = {}
+    if histograms:
+        result = await db.execute(
+            select(Camera.camera_id, Camera.name)
+            .where(Camera.camera_id.in_([UUID(c) for c in histograms]))
+        )
+        names = {str(row.camera_id): row.name for row in result}
+
+    overall: Dict[str, Dict[str, Any]] = {}
+    cameras = []
+    for cam_id, stages in histograms.items():
+        merge_histograms(overall, stages)
+        cameras.append(CameraPipelineLatency(
+            camera_id=cam_id,
+            camera_name=names.get(cam_id),
+            stages=_stage_latencies(stages)
+        ))
+
+    return PipelineLatencyResponse(
+        window_minutes=minutes,
+        stages=_stage_latencies(overall),
+        cameras=cameras
+    )
+
+
 @router.get("/movement-flow", response_model=MovementFlowResponse)
 async def get_movement_flow(
     time_from: datetime,
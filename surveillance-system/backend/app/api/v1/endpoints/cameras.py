@@ -8,7 +8,7 @@ from sqlalchemy import select, desc, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
-from app.core.redis import cache_get, cache_set, cache_delete_pattern
+from app.core.redis import cache_get, cache_set, cache_delete, cache_get_tagged, cache_set_tagged, cache_invalidate
 from app.models.camera import Camera
 from app.models.sighting import Sighting
 from app.schemas.camera import (
@@ -16,9 +16,13 @@ from app.schemas.camera import (
     CameraTestRequest, CameraTestResponse
 )
 from app.api.deps import get_current_user, require_permission
+from app.services.scheduler import notify_camera_change
 
 router = APIRouter()
 
+# Tag of the cached camera lists, invalidated on every camera change
+CAMERA_LISTS = "cameras:list"
+
 
 @router.get("", response_model=List[CameraResponse])
 async def list_cameras(
@@ -31,9 +35,9 @@ async def list_cameras(
 ):
     """List all cameras with optional filtering."""
     # Check cache
-    cache_key = f"cameras:list:{skip}:{limit}:{is_active}:{health_status}"
-    cached = await cache_get(cache_key)
-    if cached:
+    cache_key = f"{CAMERA_LISTS}:{skip}:{limit}:{is_active}:{health_status}"
+    cached, generation = await cache_get_tagged(cache_key, CAMERA_LISTS)
+    if cached is not None:
         return cached
     
     # Build query
@@ -53,7 +57,7 @@ async def list_cameras(
     response = [CameraResponse.from_orm(c) for c in cameras]
     
     # Cache result
-    await cache_set(cache_key, [c.dict() for c in response], expire=60)
+    await cache_set_tagged(cache_key, [c.dict() for c in response], CAMERA_LISTS, generation, expire=60)
     
     return response
 
@@ -80,7 +84,8 @@ async def create_camera(
     await db.refresh(db_camera)
     
     # Invalidate cache
-    await cache_delete_pattern("cameras:list:*")
+    await cache_invalidate(CAMERA_LISTS)
+    await notify_camera_change(str(db_camera.camera_id), "created")
     
     return CameraResponse.from_orm(db_camera)
 
@@ -150,8 +155,9 @@ async def update_camera(
     await db.refresh(camera)
     
     # Invalidate cache
-    await cache_delete_pattern("cameras:list:*")
-    await cache_delete_pattern(f"camera:{camera_id}")
+    await cache_invalidate(CAMERA_LISTS)
+    await cache_delete(f"camera:{camera_id}")
+    await notify_camera_change(str(camera_id), "updated")
     
     return CameraResponse.from_orm(camera)
 
@@ -178,8 +184,9 @@ async def delete_camera(
     await db.commit()
     
     # Invalidate cache
-    await cache_delete_pattern("cameras:list:*")
-    await cache_delete_pattern(f"camera:{camera_id}")
+    await cache_invalidate(CAMERA_LISTS)
+    await cache_delete(f"camera:{camera_id}")
+    await notify_camera_change(str(camera_id), "deleted")
     
     return None
 
@@ -0,0 +1,177 @@
+"""
+Live view endpoints: LL-HLS playlists and media of the camera relay
+(see app.services.live).
+
+Fetching a camera's playlist keeps it watched; the relay worker starts
+pulling it on the first fetch and stops once fetches have stopped for
+LIVE_IDLE_GRACE seconds. Playlist requests with `_HLS_msn` (and
+`_HLS_part`) block until that segment or part is available. Media URIs
+are never reused, so media is served as immutable.
+"""
+
+import asyncio
+import re
+import time
+from typing import Callable, Dict, Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_current_user
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.redis import get_redis, get_redis_binary
+from app.models.camera import Camera
+from app.services.live import VIEWERS_KEY, init_key, segment_key, state_key
+
+router = APIRouter()
+
+PLAYLIST_TYPE = "application/vnd.apple.mpegurl"
+MEDIA_TYPE = "video/mp4"
+MEDIA_CACHE = "private, max-age=86400, immutable"
+
+# init<run>.mp4, <msn>.m4s or <msn>.<part>.m4s
+MEDIA_NAME = re.compile(r"^(?:init(\d+)\.mp4|(\d+)(?:\.(\d+))?\.m4s)$")
+
+# How often a waiting request looks at the live edge
+WAIT_INTERVAL = 0.1
+
+# State fields a playlist response needs
+PLAYLIST_FIELDS = ("msn", "part_target", "playlist")
+
+
+async def _state(camera_id: str) -> Optional[Dict[str, str]]:
+    """The camera's playlist and live edge, or None before it has a playlist."""
+    values = await get_redis().hmget(state_key(camera_id), *PLAYLIST_FIELDS)
+    if values[-1] is None:
+        return None
+    return dict(zip(PLAYLIST_FIELDS, values))
+
+
+async def _wait(camera_id: str, ready: Callable[[int, int], bool], timeout: float) -> Optional[Dict[str, str]]:
+    """
+    The camera's state once `ready` holds of its live edge (msn, parts),
+    or None after `timeout` seconds. Only the edge is polled; the playlist
+    is read once it is ready.
+    """
+    redis = get_redis()
+    deadline = time.monotonic() + timeout
+    while True:
+        msn, parts = await redis.hmget(state_key(camera_id), "msn", "parts")
+        if msn is not None and ready(int(msn), int(parts)):
+            state = await _state(camera_id)
+            if state is not None:
+                return state
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(WAIT_INTERVAL)
+
+
+def _reached(msn: int, part: Optional[int]) -> Callable[[int, int], bool]:
+    """Whether the playlist lists part `part` of segment `msn`, or the whole segment."""
+    def ready(edge: int, parts: int) -> bool:
+        if part is None:
+            return edge > msn
+        return edge > msn or (edge == msn and parts > part)
+    return ready
+
+
+@router.get("/{camera_id}/index.m3u8")
+async def live_playlist(
+    camera_id: UUID,
+    msn: Optional[int] = Query(None, alias="_HLS_msn", ge=0),
+    part: Optional[int] = Query(None, alias="_HLS_part", ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """LL-HLS media playlist of a camera's live view."""
+    camera_id = str(camera_id)
+    if part is not None and msn is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="_HLS_part requires _HLS_msn"
+        )
+    redis = get_redis()
+    await redis.zadd(VIEWERS_KEY, {camera_id: time.time()})
+
+    state = await _state(camera_id)
+    if state is None:
+        result = await db.execute(
+            select(Camera.camera_id).where(Camera.camera_id == UUID(camera_id), Camera.is_active == True)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Camera not found"
+            )
+    # Nothing below needs the database: give the connection back before
+    # waiting on the relay instead of holding it for the whole wait
+    await db.close()
+
+    if state is None:
+        state = await _wait(camera_id, lambda edge, parts: True, settings.LIVE_START_TIMEOUT)
+        if state is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Live view is starting",
+                headers={"Retry-After": "1"}
+            )
+
+    cache_control = "no-cache"
+    if msn is not None:
+        if msn > int(state["msn"]) + 2:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="_HLS_msn is too far ahead of the live edge"
+            )
+        state = await _wait(camera_id, _reached(msn, part), settings.LIVE_SEGMENT_SECONDS * 3)
+        if state is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Live view did not advance"
+            )
+        # A blocking reload's answer never changes
+        cache_control = f"private, max-age={int(float(state['part_target']) * 6) + 1}"
+
+    return Response(state["playlist"], media_type=PLAYLIST_TYPE, headers={"Cache-Control": cache_control})
+
+
+@router.get("/{camera_id}/{generation}/{name}")
+async def live_media(
+    camera_id: UUID,
+    generation: str,
+    name: str,
+    current_user = Depends(get_current_user)
+):
+    """An init section, segment or part of a camera's live view."""
+    camera_id = str(camera_id)
+    match = MEDIA_NAME.match(name)
+    if not match or not generation.isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Live media not found"
+        )
+    run, msn, part = match.groups()
+
+    redis = get_redis_binary()
+    if run is not None:
+        data = await redis.get(init_key(camera_id, generation, int(run)))
+    elif part is not None:
+        data = await redis.lindex(segment_key(camera_id, generation, int(msn)), int(part))
+    else:
+        # A segment is only served once complete, i.e. behind the live edge
+        edge_generation, edge = await get_redis().hmget(state_key(camera_id), "generation", "msn")
+        if edge_generation == generation and int(msn) >= int(edge):
+            data = None
+        else:
+            data = b"".join(await redis.lrange(segment_key(camera_id, generation, int(msn)), 0, -1)) or None
+
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Live media not found"
+        )
+    return Response(data, media_type=MEDIA_TYPE, headers={"Cache-Control": MEDIA_CACHE})
@@ -1,18 +1,22 @@
 """Subject management endpoints."""
 
+import hashlib
+from datetime import datetime
 from typing import List, Optional
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
 from sqlalchemy import select, desc, func, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
+from app.core.inference import get_inference_engine
 from app.core.minio_client import upload_subject_image, get_subject_image_url
-from app.core.redis import cache_get, cache_set, cache_delete_pattern
+from app.core.redis import cache_get, cache_set, cache_delete
 from app.models.subject import Subject
 from app.models.image import Image
 from app.models.sighting import Sighting
+from app.services.faces import FaceAnalyzer, crop_face, decode_image
 from app.schemas.subject import (
     SubjectCreate, SubjectUpdate, SubjectResponse, SubjectSearch,
     SubjectEnrollRequest, SubjectEnrollResponse,
@@ -168,7 +172,7 @@ async def update_subject(
     await db.refresh(subject)
     
     # Invalidate cache
-    await cache_delete_pattern(f"subject:{subject_id}")
+    await cache_delete(f"subject:{subject_id}")
     
     return SubjectResponse.from_orm(subject)
 
@@ -195,7 +199,7 @@ async def delete_subject(
     await db.commit()
     
     # Invalidate cache
-    await cache_delete_pattern(f"subject:{subject_id}")
+    await cache_delete(f"subject:{subject_id}")
     
     return None
 
@@ -253,12 +257,52 @@ async def enroll_subject(
             detail="Subject not found"
         )
     
-    # TODO: Process image with recognition service to generate embedding
-    # For now, return success
+    data = await image.read()
+    try:
+        frame = decode_image(data)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Uploaded file is not a valid image"
+        )
+    
+    analyzer = FaceAnalyzer(get_inference_engine())
+    faces = await analyzer.detect(frame)
+    if not faces:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="No face detected in image"
+        )
+    
+    # Enroll the most confident face
+    face = max(faces, key=lambda f: f.confidence)
+    embedding = (await analyzer.embed([crop_face(frame, face)]))[0].tolist()
+    
+    image_id = uuid4()
+    storage_path = await upload_subject_image(str(subject_id), str(image_id), data)
+    
+    db_image = Image(
+        image_id=image_id,
+        subject_id=subject_id,
+        storage_path=storage_path,
+        image_type="profile",
+        file_size_bytes=len(data),
+        checksum=hashlib.sha256(data).hexdigest(),
+        resolution=f"{frame.shape[1]}x{frame.shape[0]}",
+        quality_score=face.confidence,
+        bounding_box=face.to_dict(),
+        captured_at=datetime.utcnow()
+    )
+    subject.primary_embedding = embedding
+    db.add(db_image)
+    await db.commit()
+    
+    await cache_delete(f"subject:{subject_id}")
     
     return SubjectEnrollResponse(
         subject_id=subject_id,
         success=True,
+        embedding=embedding,
         message="Subject enrolled successfully"
     )
 
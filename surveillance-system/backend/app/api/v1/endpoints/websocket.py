@@ -1,58 +1,412 @@
-"""WebSocket endpoints for real-time updates."""
+"""
+WebSocket endpoints for real-time updates.
+
+Alerts and detections are served from capped Redis Streams (the feeds in
+app.core.redis). Each worker process has one reader task blocking on a
+single XREAD over every feed its sockets listen to; it decodes each entry
+once and puts the serialized frame, tagged with the entry id, on the queue
+of each local connection that wants it. Every connection runs a writer
+task draining its queue and a reader task answering pings, both blocked
+until there is work, so an idle socket costs neither a Redis connection
+nor a polling loop.
+
+A client reconnecting with `last_id` first receives the entries it missed,
+straight from the feed, before joining the live reader. If the feed was
+trimmed past its id, it gets a `resync` frame instead and should refetch
+the list in full.
+
+Every socket has a bounded send queue drained by its own writer task, so
+a broadcast costs the publisher one append per socket however slow the
+clients are (see `Connection`).
+
+Detection sockets may ask for a batching window (`batch_ms`). Sockets on
+the same feed sharing a window share a `DetectionBatcher`, which sends one
+frame per window with the detections that arrived during it, keeping only
+the latest update per subject and camera.
+
+A feed is read while at least one local connection listens to it.
+Detection sockets scoped to a camera listen to that camera's feed only, so
+a process whose viewers watch one camera never reads the rest of the
+site's detections.
+
+Sockets pass admission (app.core.admission) before anything else: a
+refused socket is closed with a close code telling why.
+
+System sockets receive the snapshots of the process's `HealthCollector`
+(app.services.system_health), sampled once per interval for all of them.
+"""
 
 import asyncio
 import json
-from typing import Set, Dict
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
 from uuid import UUID
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
+from fastapi import APIRouter, WebSocket, Depends, Query
 from fastapi.security import HTTPBearer
+import structlog
 
-from app.core.redis import get_redis, publish, subscribe
+from app.core.redis import (
+    ALERTS_FEED,
+    detections_feed,
+    entry_position,
+    feed_range,
+    feed_resumable,
+    feed_message,
+    feed_top,
+    get_redis_binary,
+    publish_alert_update,
+    publish_detections,
+)
+from app.core.admission import CLOSE_CODES, UNAUTHORIZED, admission, token_user_id
 from app.core.config import settings
+from app.core.socket_metrics import metrics
+from app.services.system_health import health
 from app.api.deps import get_current_user
 
+logger = structlog.get_logger()
+
 router = APIRouter()
 security = HTTPBearer()
 
-# Store active WebSocket connections
+# Entries fetched per XREAD / XRANGE call
+FEED_READ_COUNT = 200
+FEED_BLOCK_MS = 1000
+
+# "Try Again Later": sent when the disconnect policy drops a slow client
+CLOSE_SLOW_CONSUMER = 1013
+
+
+def _frame(message: dict) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+
+def _track_key(item: dict) -> str:
+    """What successive detections update: a subject at a camera, else the sighting itself."""
+    if item.get("subject_id"):
+        return f"{item.get('camera_id')}:{item['subject_id']}"
+    return item.get("sighting_id") or str(id(item))
+
+
+def _coalesce_key(message: dict) -> Optional[str]:
+    """
+    What a feed message supersedes under the coalesce policy: an earlier
+    detection of the same subject at the same camera. Detection batches
+    and alerts supersede nothing, so for them a full queue drops its
+    oldest frame instead.
+    """
+    data = message.get("data")
+    if message.get("type") == "detection" and isinstance(data, dict) and data.get("subject_id"):
+        return _track_key(data)
+    return None
+
+
+class DetectionBatcher:
+    """
+    Collects one feed's detections over a window for the sockets that
+    asked for that window, then sends them all one `detections` frame.
+    Updates for the same track within a window collapse into the latest
+    one, with `coalesced` counting how many it stands for. The timer only
+    runs while detections are pending.
+    """
+
+    def __init__(self, interval_ms: int):
+        self.interval_ms = interval_ms
+        self.connections: Set["Connection"] = set()
+        # track key -> latest detection, in order of last update
+        self.pending: Dict[str, dict] = {}
+        # Id of the newest entry in the pending batch
+        self.last_id: Optional[str] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    def add(self, message: dict) -> None:
+        self.last_id = message.get("id")
+        data = message.get("data")
+        for item in data if isinstance(data, list) else [data]:
+            key = _track_key(item)
+            previous = self.pending.pop(key, None)
+            if previous is not None:
+                item = {**item, "coalesced": previous.get("coalesced", 1) + 1}
+            self.pending[key] = item
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval_ms / 1000)
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        frame = _frame({"type": "detections", "id": self.last_id, "data": list(pending.values())})
+        for connection in self.connections:
+            # Each batch carries different tracks, so none supersedes another
+            connection.send(frame)
+
+    def close(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+
+
+class Connection:
+    """
+    An accepted socket and its bounded queue of frames to send. Publishers
+    only append to the queue; the writer task is the one waiting on the
+    network, so a slow client only ever holds up itself. When the queue is
+    full the channel's overflow policy decides what gives.
+    """
+
+    def __init__(self, websocket: WebSocket, channel: str, user_id: str, feed: Optional[str] = None):
+        self.websocket = websocket
+        self.channel = channel
+        self.user_id = user_id
+        # Feed this socket listens to, if any
+        self.feed = feed
+        # Set once caught up; entries up to `after` were already sent
+        self.live = False
+        self.after: Tuple[int, int] = (0, 0)
+        self.policy = settings.WS_ALERTS_OVERFLOW_POLICY if channel == "alerts" else settings.WS_OVERFLOW_POLICY
+        # (coalescing key, frame)
+        self.frames: Deque[Tuple[Optional[str], str]] = deque()
+        self.overflowed = False
+        self.batcher: Optional[DetectionBatcher] = None
+        self._ready = asyncio.Event()
+
+    def send(self, frame: str, key: Optional[str] = None) -> None:
+        """Queue a frame; `key` names what it updates, for the coalesce policy."""
+        if len(self.frames) >= settings.WS_SEND_QUEUE_SIZE:
+            if self.policy == "disconnect":
+                self.overflowed = True
+                self._ready.set()
+                return
+            self._make_room(key)
+            metrics.drop(self.channel, self.policy)
+        self.frames.append((key, frame))
+        self._ready.set()
+
+    def _make_room(self, key: Optional[str]) -> None:
+        if self.policy == "coalesce" and key is not None:
+            # The queued frame with the same key is stale once this one is sent
+            for index, (queued_key, _) in enumerate(self.frames):
+                if queued_key == key:
+                    del self.frames[index]
+                    return
+        self.frames.popleft()
+
+    async def write(self) -> None:
+        while True:
+            if not self.frames and not self.overflowed:
+                self._ready.clear()
+                await self._ready.wait()
+            if self.overflowed:
+                logger.info("Closing slow WebSocket consumer", channel=self.channel)
+                await self.websocket.close(code=CLOSE_SLOW_CONSUMER)
+                return
+            _, frame = self.frames.popleft()
+            await self.websocket.send_text(frame)
+
+    async def read(self) -> None:
+        while True:
+            data = await self.websocket.receive_text()
+            if data == "ping":
+                self.send("pong", key="pong")
+
+
 class ConnectionManager:
-    """Manage WebSocket connections."""
-    
+    """Local WebSocket connections and the shared feed reader serving them."""
+
     def __init__(self):
-        self.active_connections: Dict[str, Set[WebSocket]] = {
+        self.active_connections: Dict[str, Set[Connection]] = {
             "alerts": set(),
             "detections": set(),
-            "cameras": set(),
             "system": set()
         }
-    
-    async def connect(self, websocket: WebSocket, channel: str):
-        """Accept and store connection."""
+        # Feed -> local connections listening to it
+        self.listeners: Dict[str, Set[Connection]] = {}
+        # Feed -> id of the last entry the reader has dispatched
+        self.cursors: Dict[str, str] = {}
+        # (feed, window in ms) -> batcher shared by the sockets asking for it
+        self.batchers: Dict[Tuple[str, int], DetectionBatcher] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        channel: str,
+        token: Optional[str],
+        feed: Optional[str] = None,
+        batch_ms: int = 0,
+        last_id: Optional[str] = None
+    ) -> Optional[Connection]:
+        """
+        Accept and store connection; a feed connection is live once it has
+        caught up. Returns None if the socket was refused at admission.
+        """
         await websocket.accept()
-        if channel in self.active_connections:
-            self.active_connections[channel].add(websocket)
-    
-    def disconnect(self, websocket: WebSocket, channel: str):
-        """Remove connection."""
-        if channel in self.active_connections:
-            self.active_connections[channel].discard(websocket)
-    
-    async def broadcast(self, message: dict, channel: str):
-        """Broadcast message to all connections in channel."""
-        if channel not in self.active_connections:
+        user_id = token_user_id(token)
+        refused = await admission.admit(user_id) if user_id else UNAUTHORIZED
+        if refused:
+            metrics.reject(channel, refused)
+            logger.info("WebSocket refused", channel=channel, user_id=user_id, reason=refused)
+            await websocket.close(code=CLOSE_CODES[refused])
+            return None
+
+        connection = Connection(websocket, channel, user_id, feed)
+        metrics.start("websocket", self.gauges)
+        self.active_connections[channel].add(connection)
+        if not feed:
+            return connection
+
+        self.listeners.setdefault(feed, set()).add(connection)
+        try:
+            if feed not in self.cursors:
+                top = await feed_top(feed)
+                self.cursors.setdefault(feed, top)
+                self._wake.set()
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+            await self._catch_up(connection, last_id)
+        except Exception:
+            await self.disconnect(connection)
+            raise
+
+        if batch_ms:
+            interval_ms = min(max(batch_ms, settings.WS_BATCH_MIN_MS), settings.WS_BATCH_MAX_MS)
+            connection.batcher = self.batchers.setdefault((feed, interval_ms), DetectionBatcher(interval_ms))
+            connection.batcher.connections.add(connection)
+            # Tell the client which window it got
+            connection.send(_frame({"type": "batching", "interval_ms": interval_ms}))
+        connection.live = True
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        """Remove connection; a feed nobody listens to any more stops being read."""
+        if connection not in self.active_connections[connection.channel]:
+            return
+        self.active_connections[connection.channel].discard(connection)
+        await admission.release(connection.user_id)
+        batcher = connection.batcher
+        if batcher is not None:
+            batcher.connections.discard(connection)
+            if not batcher.connections:
+                batcher.close()
+                self.batchers.pop((connection.feed, batcher.interval_ms), None)
+        listeners = self.listeners.get(connection.feed)
+        if listeners is None:
+            return
+        listeners.discard(connection)
+        if not listeners:
+            del self.listeners[connection.feed]
+            self.cursors.pop(connection.feed, None)
+
+    async def serve(self, connection: Connection) -> None:
+        """Run a connection's writer and reader until either ends, then drop it."""
+        tasks = [
+            asyncio.create_task(connection.write()),
+            asyncio.create_task(connection.read())
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Disconnects and failed sends end up here
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.disconnect(connection)
+
+    def broadcast(self, message: dict, feed: str) -> None:
+        """Queue a feed entry for every live connection on the feed, serialized once."""
+        listeners = self.listeners.get(feed)
+        if not listeners:
             return
-        
-        disconnected = set()
-        for connection in self.active_connections[channel]:
+        position = entry_position(message["id"])
+        frame = None
+        batchers = set()
+        key = _coalesce_key(message)
+        for connection in listeners:
+            if not connection.live or position <= connection.after:
+                continue
+            connection.after = position
+            if connection.batcher is not None:
+                batchers.add(connection.batcher)
+                continue
+            if frame is None:
+                frame = _frame(message)
+            connection.send(frame, key)
+        for batcher in batchers:
+            batcher.add(message)
+
+    def gauges(self) -> Dict[str, Dict[str, int]]:
+        """Connections and send queue depths per channel, for the metrics flusher."""
+        return {
+            channel: {
+                "connections": len(connections),
+                "queued": sum(len(connection.frames) for connection in connections),
+                "max_queue": max((len(connection.frames) for connection in connections), default=0)
+            }
+            for channel, connections in self.active_connections.items()
+        }
+
+    async def _catch_up(self, connection: Connection, last_id: Optional[str]) -> None:
+        """Send what a resuming client missed, up to where the live reader is."""
+        feed = connection.feed
+        if last_id is None:
+            connection.after = entry_position(self.cursors[feed])
+            return
+        if not await feed_resumable(feed, last_id):
+            await connection.websocket.send_text(_frame({"type": "resync"}))
+            connection.after = entry_position(self.cursors[feed])
+            return
+
+        after = last_id
+        # The reader may move on while we read, so chase its cursor
+        while entry_position(after) < entry_position(self.cursors[feed]):
+            entries = await feed_range(feed, after, self.cursors[feed], FEED_READ_COUNT)
+            if not entries:
+                break
+            for entry_id, fields in entries:
+                after = entry_id
+                message = feed_message(after, fields)
+                if message is not None:
+                    # Not live yet, so written directly, at the client's pace
+                    await connection.websocket.send_text(_frame(message))
+        connection.after = max(entry_position(after), entry_position(self.cursors[feed]))
+
+    async def _read(self) -> None:
+        """Read every feed with local listeners in one blocking XREAD."""
+        redis = get_redis_binary()
+        while True:
+            if not self.cursors:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
             try:
-                await connection.send_json(message)
-            except Exception:
-                disconnected.add(connection)
-        
-        # Clean up disconnected clients
-        for conn in disconnected:
-            self.active_connections[channel].discard(conn)
+                response = await redis.xread(dict(self.cursors), count=FEED_READ_COUNT, block=FEED_BLOCK_MS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("WebSocket feed read failed, retrying", error=str(e))
+                await asyncio.sleep(1)
+                continue
+            for name, entries in response or []:
+                feed = name.decode()
+                for entry_id, fields in entries:
+                    if feed not in self.cursors:
+                        # Its last listener left during the read
+                        break
+                    self.cursors[feed] = entry_id.decode()
+                    message = feed_message(self.cursors[feed], fields)
+                    if message is not None:
+                        self.broadcast(message, feed)
+
+    async def close(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        for batcher in self.batchers.values():
+            batcher.close()
+        await admission.close()
+        await metrics.close()
 
 
 manager = ConnectionManager()
@@ -61,112 +415,47 @@ manager = ConnectionManager()
 @router.websocket("/alerts")
 async def alerts_websocket(
     websocket: WebSocket,
+    last_id: Optional[str] = Query(None),
     token: str = Query(...)
 ):
-    """WebSocket for real-time alert notifications."""
-    # TODO: Validate token
-    await manager.connect(websocket, "alerts")
-    
-    try:
-        # Subscribe to Redis channel
-        redis = get_redis()
-        pubsub = redis.pubsub()
-        await pubsub.subscribe("alerts:updates")
-        
-        while True:
-            # Check for Redis messages
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
-            if message:
-                data = json.loads(message["data"])
-                await websocket.send_json(data)
-            
-            # Check for client ping
-            try:
-                data = await asyncio.wait_for(
-                    websocket.receive_text(),
-                    timeout=0.1
-                )
-                if data == "ping":
-                    await websocket.send_text("pong")
-            except asyncio.TimeoutError:
-                pass
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "alerts")
-        await pubsub.unsubscribe("alerts:updates")
+    """
+    WebSocket for real-time alert notifications. Every frame carries the
+    feed entry `id`; reconnect with `last_id` to receive only what was
+    missed.
+    """
+    connection = await manager.connect(websocket, "alerts", token, ALERTS_FEED, last_id=last_id)
+    if connection:
+        await manager.serve(connection)
 
 
 @router.websocket("/detections")
 async def detections_websocket(
     websocket: WebSocket,
     camera_id: UUID = Query(None),
+    batch_ms: int = Query(0, ge=0),
+    last_id: Optional[str] = Query(None),
     token: str = Query(...)
 ):
-    """WebSocket for real-time detection updates."""
-    await manager.connect(websocket, "detections")
-    
-    try:
-        redis = get_redis()
-        pubsub = redis.pubsub()
-        await pubsub.subscribe("detections:updates")
-        
-        while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
-            if message:
-                data = json.loads(message["data"])
-                
-                # Filter by camera if specified
-                if camera_id and data.get("camera_id") != str(camera_id):
-                    continue
-                
-                await websocket.send_json(data)
-            
-            try:
-                data = await asyncio.wait_for(
-                    websocket.receive_text(),
-                    timeout=0.1
-                )
-                if data == "ping":
-                    await websocket.send_text("pong")
-            except asyncio.TimeoutError:
-                pass
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "detections")
-        await pubsub.unsubscribe("detections:updates")
-
-
-@router.websocket("/cameras/{camera_id}/stream")
-async def camera_stream_websocket(
-    websocket: WebSocket,
-    camera_id: UUID,
-    token: str = Query(...)
-):
-    """WebSocket for camera stream proxy (HLS/WebRTC signaling)."""
-    await manager.connect(websocket, "cameras")
-    
-    try:
-        while True:
-            # Receive signaling messages
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            # Handle different message types
-            if message.get("type") == "offer":
-                # TODO: Forward to WebRTC gateway
-                pass
-            elif message.get("type") == "ice-candidate":
-                # TODO: Forward ICE candidate
-                pass
-            
-            # Echo back for now
-            await websocket.send_json({
-                "type": "ack",
-                "camera_id": str(camera_id)
-            })
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "cameras")
+    """
+    WebSocket for real-time detection updates. With `batch_ms`, detections
+    arrive as one `detections` frame per window (clamped to
+    WS_BATCH_MIN_MS..WS_BATCH_MAX_MS) instead of one frame per message.
+    Resumes after `last_id` like the alerts socket.
+    """
+    connection = await manager.connect(
+        websocket, "detections", token, detections_feed(camera_id), batch_ms=batch_ms, last_id=last_id
+    )
+    if connection:
+        await manager.serve(connection)
+
+
+async def _send_health(snapshot: dict) -> None:
+    frame = _frame(snapshot)
+    for connection in manager.active_connections["system"]:
+        connection.send(frame, key="health")
+
+
+health.subscribe(_send_health)
 
 
 @router.websocket("/system")
@@ -174,37 +463,35 @@ async def system_websocket(
     websocket: WebSocket,
     token: str = Query(...)
 ):
-    """WebSocket for system health and status updates."""
-    await manager.connect(websocket, "system")
-    
+    """WebSocket for system health snapshots from this process's collector."""
+    connection = await manager.connect(websocket, "system", token)
+    if connection is None:
+        return
+    health.watch()
     try:
-        while True:
-            # Send periodic health updates
-            await websocket.send_json({
-                "type": "health",
-                "timestamp": datetime.utcnow().isoformat(),
-                "status": "healthy"
-            })
-            
-            # Wait for next update interval
-            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL)
-            
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, "system")
+        if health.latest:
+            connection.send(_frame(health.latest), key="health")
+        await manager.serve(connection)
+    finally:
+        health.unwatch()
 
 
 # Helper function to broadcast messages
 async def broadcast_alert(alert_data: dict):
     """Broadcast alert to all connected clients."""
-    await manager.broadcast({
+    await publish_alert_update({
         "type": "alert",
         "data": alert_data
-    }, "alerts")
+    })
 
 
 async def broadcast_detection(detection_data: dict):
-    """Broadcast detection to all connected clients."""
-    await manager.broadcast({
+    """Broadcast detection to clients watching all cameras or its camera."""
+    message = {
         "type": "detection",
         "data": detection_data
-    }, "detections")
+    }
+    entries = [(detections_feed(), message)]
+    if detection_data.get("camera_id"):
+        entries.append((detections_feed(detection_data["camera_id"]), message))
+    await publish_detections(entries)
@@ -0,0 +1,201 @@
+"""
+Socket.IO realtime gateway (see app.services.realtime).
+
+Served next to the API by the ASGI app in app.main. Clients connect to the
+alerts, detections or system namespace with `auth` carrying their token
+and, optionally:
+
+    camera_id   detections of one camera only
+    last_id     id of the last message seen; missed feed entries are
+                replayed once the socket has joined its room, or a `resync`
+                message is sent if the feed was trimmed past it
+    binary      receive raw msgpack entries as binary frames
+
+The system namespace receives the worker's system health snapshots.
+
+socket.io-client sends `auth` again on every reconnection, so a client
+keeping its last id there gets its connection state back after a drop or
+a backend restart.
+
+Connections pass admission (app.core.admission) first; a refused client
+gets a connect_error whose data carries the close code and reason.
+"""
+
+from typing import Dict, Optional
+from uuid import UUID
+
+import socketio
+import structlog
+
+from app.core.admission import CLOSE_CODES, UNAUTHORIZED, admission, token_user_id
+from app.core.config import settings
+from app.core.redis import ALERTS_FEED, detections_feed, feed_range, feed_resumable, get_redis
+from app.core.socket_metrics import metrics
+from app.services.realtime import (
+    ALERTS_NAMESPACE,
+    DETECTIONS_NAMESPACE,
+    EVENT,
+    ROOMS_KEY,
+    SYSTEM_NAMESPACE,
+    SYSTEM_ROOM,
+    feed_frame,
+    feed_room,
+)
+from app.services.system_health import health
+
+logger = structlog.get_logger()
+
+# Entries replayed per XRANGE call
+REPLAY_COUNT = 200
+
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    client_manager=socketio.AsyncRedisManager(settings.REDIS_URL),
+    cors_allowed_origins=settings.CORS_ORIGINS,
+    transports=["websocket"],
+)
+
+# Channel -> admitted sockets on this worker
+connections: Dict[str, int] = {}
+
+
+def _channel(namespace: str) -> str:
+    return namespace.rsplit("/", 1)[-1]
+
+
+def _gauges() -> Dict[str, Dict[str, int]]:
+    return {
+        f"socketio:{channel}": {"connections": count, "queued": 0, "max_queue": 0}
+        for channel, count in connections.items()
+    }
+
+
+def _refuse(namespace: str, reason: str):
+    metrics.reject(f"socketio:{_channel(namespace)}", reason)
+    logger.info("Socket.IO connection refused", namespace=namespace, reason=reason)
+    return socketio.exceptions.ConnectionRefusedError(
+        "Connection refused", {"code": CLOSE_CODES[reason], "reason": reason}
+    )
+
+
+def _authenticate(namespace: str, auth: Optional[dict]) -> str:
+    """User id of the token in `auth`, verified without the database."""
+    user_id = token_user_id((auth or {}).get("token"))
+    if not user_id:
+        raise _refuse(namespace, UNAUTHORIZED)
+    return user_id
+
+
+async def _admit(sid: str, namespace: str, user_id: str) -> None:
+    refused = await admission.admit(user_id)
+    if refused:
+        raise _refuse(namespace, refused)
+    await sio.save_session(sid, {"user_id": user_id}, namespace=namespace)
+    channel = _channel(namespace)
+    connections[channel] = connections.get(channel, 0) + 1
+    metrics.start("socketio", _gauges)
+
+
+async def _join(sid: str, namespace: str, room: str) -> None:
+    await sio.enter_room(sid, room, namespace=namespace)
+    async with sio.session(sid, namespace=namespace) as session:
+        session["room"] = room
+    await get_redis().hincrby(ROOMS_KEY, room, 1)
+
+
+async def _leave(sid: str, namespace: str) -> None:
+    session = await sio.get_session(sid, namespace=namespace)
+    if session.get("room"):
+        await get_redis().hincrby(ROOMS_KEY, session["room"], -1)
+    if session.get("user_id"):
+        connections[_channel(namespace)] -= 1
+        await admission.release(session["user_id"])
+
+
+async def _replay(sid: str, namespace: str, feed: str, last_id: Optional[str], binary: bool) -> None:
+    """Send a reconnecting client the feed entries it missed."""
+    if last_id is None:
+        return
+    if not await feed_resumable(feed, last_id):
+        await sio.emit(EVENT, {"type": "resync"}, to=sid, namespace=namespace, ignore_queue=True)
+        return
+    after = last_id
+    while True:
+        entries = await feed_range(feed, after, count=REPLAY_COUNT)
+        if not entries:
+            return
+        for entry_id, fields in entries:
+            after = entry_id
+            frame = feed_frame(entry_id, fields, binary)
+            if frame is not None:
+                await sio.emit(EVENT, frame, to=sid, namespace=namespace, ignore_queue=True)
+
+
+async def _follow(sid: str, namespace: str, feed: str, user_id: str, auth: dict) -> None:
+    """Admit the socket, join the feed's room and replay what it missed."""
+    await _admit(sid, namespace, user_id)
+    try:
+        binary = bool(auth.get("binary"))
+        # Joining first means nothing published during the replay is lost;
+        # entries sent both ways are dropped by the client, which dedupes by id
+        await _join(sid, namespace, feed_room(feed, binary))
+        await _replay(sid, namespace, feed, auth.get("last_id"), binary)
+    except Exception:
+        # No disconnect event follows a failed connect
+        await _leave(sid, namespace)
+        raise
+
+
+@sio.on("connect", namespace=ALERTS_NAMESPACE)
+async def connect_alerts(sid, environ, auth=None):
+    user_id = _authenticate(ALERTS_NAMESPACE, auth)
+    await _follow(sid, ALERTS_NAMESPACE, ALERTS_FEED, user_id, auth)
+
+
+@sio.on("connect", namespace=DETECTIONS_NAMESPACE)
+async def connect_detections(sid, environ, auth=None):
+    user_id = _authenticate(DETECTIONS_NAMESPACE, auth)
+    camera_id = auth.get("camera_id")
+    if camera_id:
+        try:
+            camera_id = str(UUID(str(camera_id)))
+        except ValueError:
+            raise socketio.exceptions.ConnectionRefusedError("Invalid camera_id")
+    await _follow(sid, DETECTIONS_NAMESPACE, detections_feed(camera_id), user_id, auth)
+
+
+@sio.on("connect", namespace=SYSTEM_NAMESPACE)
+async def connect_system(sid, environ, auth=None):
+    await _admit(sid, SYSTEM_NAMESPACE, _authenticate(SYSTEM_NAMESPACE, auth))
+    try:
+        await _join(sid, SYSTEM_NAMESPACE, SYSTEM_ROOM)
+    except Exception:
+        await _leave(sid, SYSTEM_NAMESPACE)
+        raise
+    health.watch()
+    if health.latest:
+        await sio.emit(EVENT, health.latest, to=sid, namespace=SYSTEM_NAMESPACE, ignore_queue=True)
+
+
+@sio.on("disconnect", namespace=ALERTS_NAMESPACE)
+async def disconnect_alerts(sid):
+    await _leave(sid, ALERTS_NAMESPACE)
+
+
+@sio.on("disconnect", namespace=DETECTIONS_NAMESPACE)
+async def disconnect_detections(sid):
+    await _leave(sid, DETECTIONS_NAMESPACE)
+
+
+@sio.on("disconnect", namespace=SYSTEM_NAMESPACE)
+async def disconnect_system(sid):
+    health.unwatch()
+    await _leave(sid, SYSTEM_NAMESPACE)
+
+
+async def _emit_health(snapshot: dict) -> None:
+    # Every worker samples for its own sockets, so the snapshot stays local
+    await sio.emit(EVENT, snapshot, room=SYSTEM_ROOM, namespace=SYSTEM_NAMESPACE, ignore_queue=True)
+
+
+health.subscribe(_emit_health)
@@ -11,6 +11,7 @@ from app.api.v1.endpoints import (
     alerts,
     analytics,
     users,
+    live,
     websocket
 )
 
@@ -25,4 +26,5 @@ api_router.include_router(sightings.router, prefix="/sightings", tags=["Sighting
 api_router.include_router(alerts.router, prefix="/alerts", tags=["Alerts"])
 api_router.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
 api_router.include_router(users.router, prefix="/users", tags=["Users"])
+api_router.include_router(live.router, prefix="/live", tags=["Live View"])
 api_router.include_router(websocket.router, prefix="/ws", tags=["WebSocket"])
@@ -0,0 +1,175 @@
+"""
+WebSocket admission control.
+
+Sockets are admitted at connect time, before they cost the process
+anything: the token is checked by signature and expiry only (no database
+round trip), then the connection is counted against WS_MAX_CONNECTIONS
+overall and WS_MAX_CONNECTIONS_PER_USER per user. Both caps hold across
+all API processes, raw WebSockets and Socket.IO alike: every process keeps
+its own counts in a Redis hash that expires unless refreshed, and a script
+sums all processes' hashes and takes the slot atomically. A process that
+dies stops counting once its hash expires.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from jose import JWTError, jwt
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.core.socket_metrics import PROCESS
+
+logger = structlog.get_logger()
+
+KEY_PREFIX = "ws:admission:"
+PROCESSES_KEY = "ws:admission:processes"
+
+# Close codes of rejected sockets (Socket.IO clients get them as connect_error data)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_USER_LIMIT = 4429
+# "Try Again Later"
+CLOSE_CAPACITY = 1013
+
+UNAUTHORIZED = "unauthorized"
+USER_LIMIT = "user_limit"
+CAPACITY = "capacity"
+
+CLOSE_CODES = {
+    UNAUTHORIZED: CLOSE_UNAUTHORIZED,
+    USER_LIMIT: CLOSE_USER_LIMIT,
+    CAPACITY: CLOSE_CAPACITY,
+}
+
+# KEYS: this process's hash, then the other processes' hashes
+# ARGV: user id, global cap, per-user cap, TTL in seconds
+ADMIT_SCRIPT = """
+local total, mine = 0, 0
+for i, key in ipairs(KEYS) do
+    local values = redis.call('HMGET', key, 'total', ARGV[1])
+    total = total + tonumber(values[1] or 0)
+    mine = mine + tonumber(values[2] or 0)
+end
+if total >= tonumber(ARGV[2]) then
+    return 'capacity'
+end
+if mine >= tonumber(ARGV[3]) then
+    return 'user_limit'
+end
+redis.call('HINCRBY', KEYS[1], 'total', 1)
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return ''
+"""
+
+RELEASE_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], 'total', -1)
+if redis.call('HINCRBY', KEYS[1], ARGV[1], -1) <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+
+def token_user_id(token: Optional[str]) -> Optional[str]:
+    """User id of a valid access token, checked without the database."""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != "access":
+        return None
+    return payload.get("sub")
+
+
+class Admission:
+    """This process's admitted sockets, counted in Redis against the caps."""
+
+    def __init__(self):
+        self.key = f"{KEY_PREFIX}{PROCESS}"
+        # user id -> sockets admitted by this process
+        self.users: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ttl(self) -> int:
+        return int(settings.TRACING_FLUSH_INTERVAL * 3) + 1
+
+    async def admit(self, user_id: str) -> Optional[str]:
+        """Take a connection slot for the user; returns why not, if refused."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        redis = get_redis()
+        await redis.sadd(PROCESSES_KEY, PROCESS)
+        others = [f"{KEY_PREFIX}{process}" for process in await redis.smembers(PROCESSES_KEY) if process != PROCESS]
+        refused = await redis.eval(
+            ADMIT_SCRIPT,
+            1 + len(others),
+            self.key,
+            *others,
+            user_id,
+            settings.WS_MAX_CONNECTIONS,
+            settings.WS_MAX_CONNECTIONS_PER_USER,
+            self.ttl
+        )
+        if refused:
+            return refused
+        self.users[user_id] = self.users.get(user_id, 0) + 1
+        return None
+
+    async def release(self, user_id: str) -> None:
+        count = self.users.get(user_id, 0) - 1
+        if count < 0:
+            return
+        if count:
+            self.users[user_id] = count
+        else:
+            del self.users[user_id]
+        try:
+            await get_redis().eval(RELEASE_SCRIPT, 1, self.key, user_id)
+        except Exception as e:
+            logger.warning("Failed to release WebSocket slot", user_id=user_id, error=str(e))
+
+    async def refresh(self) -> None:
+        """Keep this process's counts alive and forget processes that died."""
+        redis = get_redis()
+        if not await redis.expire(self.key, self.ttl) and self.users:
+            # Expired while Redis was unreachable: put the counts back
+            pipe = redis.pipeline(transaction=True)
+            pipe.hset(self.key, mapping={"total": sum(self.users.values()), **self.users})
+            pipe.expire(self.key, self.ttl)
+            await pipe.execute()
+
+        processes = sorted(await redis.smembers(PROCESSES_KEY))
+        pipe = redis.pipeline(transaction=False)
+        for process in processes:
+            pipe.exists(f"{KEY_PREFIX}{process}")
+        alive = await pipe.execute()
+        expired = [process for process, exists in zip(processes, alive) if not exists and process != PROCESS]
+        if expired:
+            await redis.srem(PROCESSES_KEY, *expired)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRACING_FLUSH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Failed to refresh WebSocket admission counts", error=str(e))
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.users = {}
+        try:
+            await get_redis().delete(self.key)
+            await get_redis().srem(PROCESSES_KEY, PROCESS)
+        except Exception as e:
+            logger.warning("Failed to clear WebSocket admission counts", error=str(e))
+
+
+admission = Admission()
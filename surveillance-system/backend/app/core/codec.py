@@ -0,0 +1,127 @@
+"""
+Binary message codec for pipeline traffic over Redis Streams and pub/sub.
+
+Messages are msgpack envelopes {"t": kind, "v": version, "d": payload}.
+Bytes stay bytes, float32 arrays (embeddings) travel as raw little-endian
+blobs, UUIDs as 16 raw bytes and datetimes as msgpack timestamps.
+Readers upgrade older schema versions so producers and consumers can be
+deployed independently.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Tuple
+from uuid import UUID
+
+import msgpack
+import numpy as np
+
+EXT_FLOAT32_ARRAY = 1
+EXT_UUID = 2
+
+# Current schema version and required payload fields per message kind
+SCHEMAS: Dict[str, Tuple[int, Tuple[str, ...]]] = {
+    "frame": (1, ("camera_id", "frame_id", "captured_at", "image")),
+    "face": (1, ("camera_id", "frame_id", "captured_at", "bbox", "detection_confidence", "face")),
+    "sighting": (1, ("sighting",)),
+    "detection": (1, ("data",)),
+    "detections": (1, ("data",)),
+    "sampling_rates": (1, ("rates",)),
+    "action": (1, ("channel", "target", "alerts")),
+    "alert_update": (1, ("type",)),
+}
+
+# (kind, version) -> function upgrading a payload to version + 1
+UPGRADES: Dict[Tuple[str, int], Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+
+
+class CodecError(ValueError):
+    """Raised for malformed messages or unsupported schema versions."""
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        if obj.ndim != 1:
+            raise TypeError("Only 1-D arrays can be encoded")
+        return msgpack.ExtType(EXT_FLOAT32_ARRAY, obj.astype("<f4", copy=False).tobytes())
+    if isinstance(obj, UUID):
+        return msgpack.ExtType(EXT_UUID, obj.bytes)
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot encode {type(obj).__name__}")
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == EXT_FLOAT32_ARRAY:
+        return np.frombuffer(data, dtype="<f4")
+    if code == EXT_UUID:
+        return UUID(bytes=data)
+    return msgpack.ExtType(code, data)
+
+
+def encode(kind: str, payload: Dict[str, Any]) -> bytes:
+    """Pack a payload under the current schema version of `kind`."""
+    try:
+        version, required = SCHEMAS[kind]
+    except KeyError:
+        raise CodecError(f"Unknown message kind: {kind}")
+
+    missing = [name for name in required if name not in payload]
+    if missing:
+        raise CodecError(f"{kind} message missing fields: {', '.join(missing)}")
+
+    return msgpack.packb(
+        {"t": kind, "v": version, "d": payload},
+        default=_default,
+        use_bin_type=True,
+        datetime=False
+    )
+
+
+def decode(data: bytes) -> Tuple[str, Dict[str, Any]]:
+    """Unpack a message, upgrading it to the current schema. Returns (kind, payload)."""
+    try:
+        envelope = msgpack.unpackb(data, ext_hook=_ext_hook, timestamp=3, raw=False)
+        kind, version, payload = envelope["t"], envelope["v"], envelope["d"]
+        if not isinstance(kind, str) or not isinstance(payload, dict):
+            raise TypeError("kind must be a string and payload a map")
+        if not isinstance(version, int) or isinstance(version, bool):
+            raise TypeError(f"version must be an integer, not {type(version).__name__}")
+    except (ValueError, KeyError, TypeError, msgpack.UnpackException) as e:
+        raise CodecError(f"Malformed message: {e}")
+
+    if kind not in SCHEMAS:
+        raise CodecError(f"Unknown message kind: {kind}")
+
+    current, _ = SCHEMAS[kind]
+    if version > current:
+        raise CodecError(f"{kind} schema v{version} is newer than supported v{current}")
+
+    while version < current:
+        try:
+            payload = UPGRADES[(kind, version)](payload)
+        except KeyError:
+            raise CodecError(f"No upgrade path for {kind} schema v{version}")
+        version += 1
+
+    return kind, payload
+
+
+def to_jsonable(value: Any) -> Any:
+    """Convert decoded payload values to JSON-compatible types for browsers."""
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return None
+    return value
@@ -3,7 +3,7 @@ Application configuration using Pydantic Settings.
 Loads configuration from environment variables.
 """
 
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import Field, validator
 from pydantic_settings import BaseSettings
 
@@ -27,6 +27,7 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
     REDIS_POOL_SIZE: int = Field(default=50, env="REDIS_POOL_SIZE")
+    CACHE_GC_INTERVAL: int = Field(default=600, env="CACHE_GC_INTERVAL")  # seconds between stale cache sweeps
     
     # MinIO
     MINIO_ENDPOINT: str = Field(default="localhost:9000", env="MINIO_ENDPOINT")
@@ -66,12 +67,92 @@ class Settings(BaseSettings):
     DETECTION_THRESHOLD: float = Field(default=0.7, env="DETECTION_THRESHOLD")
     RECOGNITION_THRESHOLD: float = Field(default=0.6, env="RECOGNITION_THRESHOLD")
     EMBEDDING_DIMENSION: int = 512
-    
+
+    # Inference Engine (ONNX Runtime, CPU)
+    INFERENCE_WORKERS: int = Field(default=0, env="INFERENCE_WORKERS")  # 0 = one per physical core
+    INFERENCE_API_WORKERS: int = Field(default=1, env="INFERENCE_API_WORKERS")
+    INFERENCE_SLOTS_PER_WORKER: int = Field(default=2, env="INFERENCE_SLOTS_PER_WORKER")
+    DETECTION_INPUT_SIZE: int = Field(default=640, env="DETECTION_INPUT_SIZE")
+    DETECTION_BATCH_SIZE: int = Field(default=1, env="DETECTION_BATCH_SIZE")
+    DETECTION_INTRA_OP_THREADS: int = Field(default=0, env="DETECTION_INTRA_OP_THREADS")  # 0 = all SMT siblings of the core
+    DETECTION_INTER_OP_THREADS: int = Field(default=1, env="DETECTION_INTER_OP_THREADS")
+    DETECTION_NMS_THRESHOLD: float = Field(default=0.45, env="DETECTION_NMS_THRESHOLD")
+    RECOGNITION_INPUT_SIZE: int = 112
+    RECOGNITION_BATCH_SIZE: int = Field(default=32, env="RECOGNITION_BATCH_SIZE")
+    RECOGNITION_INTRA_OP_THREADS: int = Field(default=1, env="RECOGNITION_INTRA_OP_THREADS")
+    RECOGNITION_INTER_OP_THREADS: int = Field(default=1, env="RECOGNITION_INTER_OP_THREADS")
+    SIGHTING_BATCH_SIZE: int = Field(default=500, env="SIGHTING_BATCH_SIZE")
+    SIGHTING_FLUSH_INTERVAL: float = Field(default=1.0, env="SIGHTING_FLUSH_INTERVAL")  # seconds
+
     # Stream Processing
     STREAM_FRAME_SAMPLE_RATE: int = Field(default=2, env="STREAM_FRAME_SAMPLE_RATE")
     STREAM_RECONNECT_ATTEMPTS: int = Field(default=5, env="STREAM_RECONNECT_ATTEMPTS")
     STREAM_RECONNECT_DELAY: int = Field(default=5, env="STREAM_RECONNECT_DELAY")
-    
+    STREAM_FRAMES: str = "frames:raw"
+    STREAM_FACES: str = "faces:detected"
+    STREAM_SIGHTINGS: str = "sightings:new"
+    STREAM_ACTIONS: str = "alerts:actions"
+    STREAM_ACTIONS_DEAD: str = "alerts:actions:dead"
+    STREAM_MAX_LENGTH: int = Field(default=10000, env="STREAM_MAX_LENGTH")
+    STREAM_MAX_DELIVERIES: int = Field(default=5, env="STREAM_MAX_DELIVERIES")  # before an entry is dead-lettered
+    STREAM_CLAIM_IDLE: int = Field(default=120, env="STREAM_CLAIM_IDLE")  # s without reads before a consumer's entries are claimed
+    STREAM_HEALTH_INTERVAL: int = Field(default=10, env="STREAM_HEALTH_INTERVAL")
+
+    # Live View Relay
+    LIVE_SEGMENT_SECONDS: float = Field(default=2.0, env="LIVE_SEGMENT_SECONDS")  # cut on the next keyframe after this
+    LIVE_PART_SECONDS: float = Field(default=0.5, env="LIVE_PART_SECONDS")  # LL-HLS part length
+    LIVE_SEGMENTS: int = Field(default=6, env="LIVE_SEGMENTS")  # segments listed in the playlist
+    LIVE_IDLE_GRACE: int = Field(default=30, env="LIVE_IDLE_GRACE")  # seconds without viewers before teardown
+    LIVE_START_TIMEOUT: float = Field(default=10.0, env="LIVE_START_TIMEOUT")  # first playlist wait
+
+    # Ingestion Scheduling
+    SCHEDULER_HEARTBEAT_INTERVAL: float = Field(default=5.0, env="SCHEDULER_HEARTBEAT_INTERVAL")
+    SCHEDULER_LEASE_TTL: float = Field(default=15.0, env="SCHEDULER_LEASE_TTL")
+    SCHEDULER_LOAD_FACTOR: float = Field(default=1.25, env="SCHEDULER_LOAD_FACTOR")  # max load vs. mean
+    SCHEDULER_VIRTUAL_NODES: int = Field(default=64, env="SCHEDULER_VIRTUAL_NODES")
+
+    # Adaptive Frame Sampling
+    SAMPLING_INTERVAL: int = Field(default=10, env="SAMPLING_INTERVAL")
+    SAMPLING_MIN_RATE: float = Field(default=0.2, env="SAMPLING_MIN_RATE")
+    SAMPLING_TARGET_YIELD: float = Field(default=0.5, env="SAMPLING_TARGET_YIELD")  # faces/frame treated as busy
+    SAMPLING_YIELD_SMOOTHING: float = Field(default=0.3, env="SAMPLING_YIELD_SMOOTHING")
+    SAMPLING_MAX_STEP: float = Field(default=2.0, env="SAMPLING_MAX_STEP")
+    SAMPLING_LAG_TARGET: int = Field(default=200, env="SAMPLING_LAG_TARGET")  # backlog before throttling
+
+    # Alert Engine
+    ALERT_BATCH_SIZE: int = Field(default=100, env="ALERT_BATCH_SIZE")
+    ALERT_RULES_REFRESH_INTERVAL: int = Field(default=300, env="ALERT_RULES_REFRESH_INTERVAL")
+    ALERT_SUBJECT_CACHE_TTL: int = Field(default=60, env="ALERT_SUBJECT_CACHE_TTL")
+    ALERT_STORM_WINDOW: int = Field(default=60, env="ALERT_STORM_WINDOW")
+    ALERT_STORM_THRESHOLD: int = Field(default=10, env="ALERT_STORM_THRESHOLD")  # per rule and camera per window; 0 disables
+    ALERT_STORM_ESCALATE: int = Field(default=100, env="ALERT_STORM_ESCALATE")
+    ALERT_STORM_SAMPLES: int = Field(default=10, env="ALERT_STORM_SAMPLES")
+    ALERT_ARCHIVE_AFTER_DAYS: int = Field(default=30, env="ALERT_ARCHIVE_AFTER_DAYS")  # closed alerts kept hot
+    ALERT_ARCHIVE_INTERVAL: int = Field(default=3600, env="ALERT_ARCHIVE_INTERVAL")
+    ALERT_ARCHIVE_BATCH_SIZE: int = Field(default=5000, env="ALERT_ARCHIVE_BATCH_SIZE")
+    WINDOW_CHECKPOINT_INTERVAL: float = Field(default=10.0, env="WINDOW_CHECKPOINT_INTERVAL")
+    WINDOW_LEASE_TTL: float = Field(default=15.0, env="WINDOW_LEASE_TTL")
+    WINDOW_MAX_TRACKS: int = Field(default=100000, env="WINDOW_MAX_TRACKS")  # dwell timers kept in memory
+    WINDOW_MAX_EVENTS: int = Field(default=1000, env="WINDOW_MAX_EVENTS")  # sightings per sliding window
+
+    # Alert Actions
+    WEBHOOK_TIMEOUT: float = Field(default=10.0, env="WEBHOOK_TIMEOUT")
+    EMAIL_GATEWAY_URL: Optional[str] = Field(default=None, env="EMAIL_GATEWAY_URL")  # HTTP email relay
+    SMS_GATEWAY_URL: Optional[str] = Field(default=None, env="SMS_GATEWAY_URL")  # HTTP SMS relay
+    ACTION_HOST_CONCURRENCY: int = Field(default=4, env="ACTION_HOST_CONCURRENCY")  # requests per host
+    ACTION_HOST_QUEUE: int = Field(default=100, env="ACTION_HOST_QUEUE")  # waiting per host before deferring
+    ACTION_MAX_IN_FLIGHT: int = Field(default=500, env="ACTION_MAX_IN_FLIGHT")
+    ACTION_BATCH_SIZE: int = Field(default=50, env="ACTION_BATCH_SIZE")  # alerts per batched call
+    ACTION_MAX_ATTEMPTS: int = Field(default=8, env="ACTION_MAX_ATTEMPTS")
+    ACTION_RETRY_BASE: float = Field(default=2.0, env="ACTION_RETRY_BASE")
+    ACTION_RETRY_MAX_DELAY: float = Field(default=300.0, env="ACTION_RETRY_MAX_DELAY")
+    ACTION_QUEUE_MAX_LENGTH: int = Field(default=100000, env="ACTION_QUEUE_MAX_LENGTH")
+    ACTION_OUTBOX_DELAY: int = Field(default=30, env="ACTION_OUTBOX_DELAY")  # s before outbox jobs are queued again
+
+    # Latency Tracing
+    TRACING_FLUSH_INTERVAL: float = Field(default=5.0, env="TRACING_FLUSH_INTERVAL")
+    TRACING_WINDOW_MINUTES: int = Field(default=60, env="TRACING_WINDOW_MINUTES")  # per-minute history kept
+
     # GDPR/Compliance
     GDPR_DEFAULT_RETENTION_DAYS: int = Field(default=90, env="GDPR_DEFAULT_RETENTION_DAYS")
     AUDIT_LOG_RETENTION_DAYS: int = Field(default=365, env="AUDIT_LOG_RETENTION_DAYS")
@@ -82,7 +163,20 @@ class Settings(BaseSettings):
     
     # WebSocket
     WS_HEARTBEAT_INTERVAL: int = Field(default=30, env="WS_HEARTBEAT_INTERVAL")
-    WS_MAX_CONNECTIONS: int = Field(default=1000, env="WS_MAX_CONNECTIONS")
+    SYSTEM_HEALTH_INTERVAL: float = Field(default=5.0, env="SYSTEM_HEALTH_INTERVAL")  # seconds between /ws/system snapshots
+    WS_MAX_CONNECTIONS: int = Field(default=1000, env="WS_MAX_CONNECTIONS")  # across all API processes
+    WS_MAX_CONNECTIONS_PER_USER: int = Field(default=20, env="WS_MAX_CONNECTIONS_PER_USER")
+    WS_SEND_QUEUE_SIZE: int = Field(default=256, env="WS_SEND_QUEUE_SIZE")  # frames per socket
+    # What a full send queue does: drop_oldest, coalesce (drop a frame the new one supersedes,
+    # i.e. the same subject's detection at the same camera, else the oldest) or disconnect
+    WS_OVERFLOW_POLICY: Literal["drop_oldest", "coalesce", "disconnect"] = Field(default="coalesce", env="WS_OVERFLOW_POLICY")
+    WS_ALERTS_OVERFLOW_POLICY: Literal["drop_oldest", "coalesce", "disconnect"] = Field(
+        default="disconnect", env="WS_ALERTS_OVERFLOW_POLICY"
+    )
+    WS_BATCH_MIN_MS: int = Field(default=100, env="WS_BATCH_MIN_MS")  # bounds of client batching windows
+    WS_BATCH_MAX_MS: int = Field(default=250, env="WS_BATCH_MAX_MS")
+    WS_ALERTS_FEED_LENGTH: int = Field(default=10000, env="WS_ALERTS_FEED_LENGTH")  # entries kept for resuming
+    WS_DETECTIONS_FEED_LENGTH: int = Field(default=1000, env="WS_DETECTIONS_FEED_LENGTH")  # per feed
     
     @validator("CORS_ORIGINS", pre=True)
     def parse_cors_origins(cls, v):
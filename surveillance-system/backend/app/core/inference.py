@@ -0,0 +1,455 @@
+"""
+ONNX Runtime inference engine for the face detection and recognition models.
+Runs one process per physical CPU core, each pinned to that core and holding
+its own warmed-up sessions. Inputs travel through preallocated shared-memory
+buffers so only a buffer name and a batch size cross the process boundary.
+"""
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Static description of a model served by the engine."""
+    name: str
+    path: str
+    input_shape: Tuple[int, int, int, int]  # (max_batch, channels, height, width)
+    intra_op_threads: int = 0  # 0 = every logical CPU of the pinned core
+    inter_op_threads: int = 1
+
+    @property
+    def max_batch(self) -> int:
+        return self.input_shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.input_shape)) * np.dtype(np.float32).itemsize
+
+
+def default_model_specs() -> Dict[str, ModelSpec]:
+    """Model specs for the detection and recognition models from settings."""
+    det_size = settings.DETECTION_INPUT_SIZE
+    rec_size = settings.RECOGNITION_INPUT_SIZE
+    return {
+        "detection": ModelSpec(
+            name="detection",
+            path=settings.DETECTION_MODEL_PATH,
+            input_shape=(settings.DETECTION_BATCH_SIZE, 3, det_size, det_size),
+            intra_op_threads=settings.DETECTION_INTRA_OP_THREADS,
+            inter_op_threads=settings.DETECTION_INTER_OP_THREADS
+        ),
+        "recognition": ModelSpec(
+            name="recognition",
+            path=settings.RECOGNITION_MODEL_PATH,
+            input_shape=(settings.RECOGNITION_BATCH_SIZE, 3, rec_size, rec_size),
+            intra_op_threads=settings.RECOGNITION_INTRA_OP_THREADS,
+            inter_op_threads=settings.RECOGNITION_INTER_OP_THREADS
+        )
+    }
+
+
+def physical_cores() -> List[Tuple[int, ...]]:
+    """
+    Group the CPUs available to this process by physical core.
+    Returns one tuple of logical CPU ids (SMT siblings) per core.
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return [(cpu,) for cpu in range(os.cpu_count() or 1)]
+
+    cores: Dict[Tuple[str, str], List[int]] = {}
+    for cpu in sorted(os.sched_getaffinity(0)):
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{topology}/physical_package_id") as f:
+                package = f.read().strip()
+            with open(f"{topology}/core_id") as f:
+                core = f.read().strip()
+        except OSError:
+            package, core = "0", str(cpu)
+        cores.setdefault((package, core), []).append(cpu)
+
+    return [tuple(cpus) for cpus in cores.values()]
+
+
+def _core_label(core: Sequence[int]) -> str:
+    return ",".join(str(cpu) for cpu in core)
+
+
+# ------------------------------------------------------------------
+# Worker process side
+# ------------------------------------------------------------------
+
+_worker_core: Tuple[int, ...] = ()
+_worker_sessions: Dict[str, object] = {}
+_worker_input_names: Dict[str, str] = {}
+_worker_fixed_batch: Dict[str, Optional[int]] = {}
+_worker_padded: Dict[str, np.ndarray] = {}
+_worker_buffers: Dict[str, shared_memory.SharedMemory] = {}
+_worker_ready = None
+
+
+def _worker_init(core_queue, ready_barrier, specs: Sequence[ModelSpec]) -> None:
+    """Pin the process to one physical core, load and warm up every model."""
+    global _worker_core, _worker_ready
+    import onnxruntime as ort
+
+    _worker_core = core_queue.get()
+    _worker_ready = ready_barrier
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _worker_core)
+
+    for spec in specs:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = spec.intra_op_threads or len(_worker_core)
+        options.inter_op_num_threads = spec.inter_op_threads
+        options.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL if spec.inter_op_threads > 1
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Cores are dedicated; spinning only burns them while the queue is idle
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+
+        session = ort.InferenceSession(
+            spec.path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        model_input = session.get_inputs()[0]
+        batch_dim = model_input.shape[0]
+
+        _worker_sessions[spec.name] = session
+        _worker_input_names[spec.name] = model_input.name
+        _worker_fixed_batch[spec.name] = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        if _worker_fixed_batch[spec.name]:
+            _worker_padded[spec.name] = np.zeros((batch_dim,) + spec.input_shape[1:], dtype=np.float32)
+
+        # Warm-up allocates the memory arena and triggers kernel selection
+        warmup = np.zeros(spec.input_shape, dtype=np.float32)
+        _worker_run(spec.name, warmup)
+
+
+def _worker_run(model: str, batch: np.ndarray) -> List[np.ndarray]:
+    """
+    Run a batch, splitting it for models exported with a fixed batch size.
+    A short last chunk is padded to that size and its outputs trimmed.
+    """
+    session = _worker_sessions[model]
+    input_name = _worker_input_names[model]
+    fixed = _worker_fixed_batch[model]
+
+    if fixed is None or fixed == len(batch):
+        return session.run(None, {input_name: batch})
+
+    chunks = []
+    for i in range(0, len(batch), fixed):
+        chunk = batch[i:i + fixed]
+        count = len(chunk)
+        if count < fixed:
+            padded = _worker_padded[model]
+            padded[:count] = chunk
+            padded[count:] = 0
+            chunk = padded
+        chunks.append([output[:count] for output in session.run(None, {input_name: chunk})])
+    return [np.concatenate(parts) for parts in zip(*chunks)]
+
+
+def _worker_attach(name: str) -> shared_memory.SharedMemory:
+    shm = _worker_buffers.get(name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        # The engine owns the segment; keep this process from unlinking it on exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        _worker_buffers[name] = shm
+    return shm
+
+
+def _worker_infer(
+    model: str,
+    buffer_name: str,
+    shape: Tuple[int, ...],
+    count: int
+) -> Tuple[str, List[np.ndarray]]:
+    """Run inference on the first `count` rows of a shared input buffer."""
+    shm = _worker_attach(buffer_name)
+    batch = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[:count]
+    return _core_label(_worker_core), _worker_run(model, batch)
+
+
+def _worker_wait_ready(timeout: float) -> str:
+    """Block until every pool process has finished loading its models."""
+    _worker_ready.wait(timeout)
+    return _core_label(_worker_core)
+
+
+# ------------------------------------------------------------------
+# Engine
+# ------------------------------------------------------------------
+
+class InputSlot:
+    """Preallocated shared-memory input buffer for one batch of a model."""
+
+    def __init__(self, spec: ModelSpec):
+        self.spec = spec
+        self.shm = shared_memory.SharedMemory(create=True, size=spec.nbytes)
+        self.array = np.ndarray(spec.input_shape, dtype=np.float32, buffer=self.shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self) -> None:
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class InferenceEngine:
+    """
+    Process pool with one ONNX Runtime worker per physical core.
+
+    Callers acquire an `InputSlot`, preprocess directly into `slot.array`,
+    then `infer()` the filled rows. Each model gets enough slots to keep
+    every core busy while the next batch is being prepared.
+    """
+
+    def __init__(
+        self,
+        specs: Sequence[ModelSpec],
+        workers: int = 0,
+        slots_per_worker: int = 2
+    ):
+        self.specs: Dict[str, ModelSpec] = {spec.name: spec for spec in specs}
+        cores = physical_cores()
+        self.cores = cores[:workers] if workers > 0 else cores
+        self.workers = len(self.cores)
+        self.slots_per_worker = max(1, slots_per_worker)
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Dict[str, List[InputSlot]] = {}
+        self._free: Dict[str, asyncio.Queue] = {}
+        self.images_by_core: Counter = Counter()
+
+    def start(self, timeout: float = 300) -> None:
+        """Spawn the pool and block until every worker has warmed up."""
+        ctx = mp.get_context("spawn")
+        core_queue = ctx.Queue()
+        for core in self.cores:
+            core_queue.put(core)
+        ready = ctx.Barrier(self.workers)
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_worker_init,
+            initargs=(core_queue, ready, list(self.specs.values()))
+        )
+
+        # Each task holds its process on the barrier, so all of them must start
+        futures = [
+            self._pool.submit(_worker_wait_ready, timeout)
+            for _ in range(self.workers)
+        ]
+        ready_cores = [future.result(timeout=timeout) for future in futures]
+
+        for name, spec in self.specs.items():
+            self._slots[name] = [
+                InputSlot(spec) for _ in range(self.workers * self.slots_per_worker)
+            ]
+            self._free[name] = asyncio.Queue()
+            for slot in self._slots[name]:
+                self._free[name].put_nowait(slot)
+
+        logger.info(
+            "Inference engine started",
+            models=list(self.specs),
+            workers=self.workers,
+            cores=sorted(ready_cores)
+        )
+
+    def close(self) -> None:
+        """Shut down the pool and free shared input buffers."""
+        if self._pool:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        for slots in self._slots.values():
+            for slot in slots:
+                slot.close()
+        self._slots.clear()
+        self._free.clear()
+
+    async def acquire(self, model: str) -> InputSlot:
+        """Wait for a free input buffer of the given model."""
+        return await self._free[model].get()
+
+    def release(self, slot: InputSlot) -> None:
+        """Return an input buffer to the free list."""
+        self._free[slot.spec.name].put_nowait(slot)
+
+    async def infer(self, slot: InputSlot, count: int) -> List[np.ndarray]:
+        """Run the model on the first `count` rows of a filled slot."""
+        _, outputs = await self._submit(slot, count)
+        return outputs
+
+    async def run(self, model: str, batch: np.ndarray) -> List[np.ndarray]:
+        """Copy an already preprocessed batch into a slot and run it."""
+        slot = await self.acquire(model)
+        try:
+            count = len(batch)
+            slot.array[:count] = batch
+            return await self.infer(slot, count)
+        finally:
+            self.release(slot)
+
+    async def _submit(self, slot: InputSlot, count: int) -> Tuple[str, List[np.ndarray]]:
+        if self._pool is None:
+            raise RuntimeError("Inference engine not started")
+        if not 0 < count <= slot.spec.max_batch:
+            raise ValueError(f"Batch size {count} outside 1..{slot.spec.max_batch}")
+
+        loop = asyncio.get_running_loop()
+        core, outputs = await loop.run_in_executor(
+            self._pool,
+            _worker_infer,
+            slot.spec.name,
+            slot.name,
+            slot.spec.input_shape,
+            count
+        )
+        self.images_by_core[core] += count
+        return core, outputs
+
+
+async def benchmark(engine: InferenceEngine, model: str, seconds: float = 10.0) -> Dict[str, float]:
+    """
+    Saturate every core with full batches of random input.
+    Returns images/sec per core label, plus a "total" entry.
+    """
+    spec = engine.specs[model]
+    processed: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+
+    async def submitter() -> None:
+        slot = await engine.acquire(model)
+        try:
+            slot.array[:] = np.random.rand(*spec.input_shape).astype(np.float32)
+            while time.perf_counter() < deadline:
+                core, _ = await engine._submit(slot, spec.max_batch)
+                processed[core] += spec.max_batch
+        finally:
+            engine.release(slot)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(submitter() for _ in range(engine.workers * engine.slots_per_worker)))
+    elapsed = time.perf_counter() - start
+
+    report = {core: count / elapsed for core, count in sorted(processed.items())}
+    report["total"] = sum(processed.values()) / elapsed
+    return report
+
+
+# ------------------------------------------------------------------
+# Process-wide engine
+# ------------------------------------------------------------------
+
+inference_engine: Optional[InferenceEngine] = None
+_engine_lock = asyncio.Lock()
+
+
+async def init_inference(
+    models: Optional[Sequence[str]] = None,
+    workers: Optional[int] = None
+) -> InferenceEngine:
+    """
+    Start the process-wide inference engine (idempotent).
+    Loads only the named models, or all of them by default.
+    """
+    global inference_engine
+
+    async with _engine_lock:
+        if inference_engine is None:
+            logger.info("Initializing inference engine...")
+            specs = default_model_specs()
+            engine = InferenceEngine(
+                [specs[name] for name in models or specs],
+                workers=settings.INFERENCE_WORKERS if workers is None else workers,
+                slots_per_worker=settings.INFERENCE_SLOTS_PER_WORKER
+            )
+            try:
+                await asyncio.to_thread(engine.start)
+            except Exception as e:
+                engine.close()
+                logger.error("Failed to initialize inference engine", error=str(e))
+                raise
+            inference_engine = engine
+
+    return inference_engine
+
+
+async def close_inference() -> None:
+    """Stop the process-wide inference engine."""
+    global inference_engine
+
+    if inference_engine:
+        logger.info("Closing inference engine...")
+        await asyncio.to_thread(inference_engine.close)
+        inference_engine = None
+        logger.info("Inference engine closed")
+
+
+def get_inference_engine() -> InferenceEngine:
+    """Get inference engine instance."""
+    if inference_engine is None:
+        raise RuntimeError("Inference engine not initialized")
+    return inference_engine
+
+
+async def _benchmark_main(args: argparse.Namespace) -> None:
+    specs = default_model_specs()
+    models = [args.model] if args.model else list(specs)
+    engine = InferenceEngine(
+        [specs[name] for name in models],
+        workers=args.workers,
+        slots_per_worker=settings.INFERENCE_SLOTS_PER_WORKER
+    )
+    await asyncio.to_thread(engine.start)
+    try:
+        for name in models:
+            report = await benchmark(engine, name, args.seconds)
+            total = report.pop("total")
+            print(f"{name}: batch={specs[name].max_batch} workers={engine.workers}")
+            for core, rate in report.items():
+                print(f"  core {core:>8}: {rate:8.1f} images/sec")
+            print(f"  {'total':>13}: {total:8.1f} images/sec")
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inference engine benchmark")
+    parser.add_argument("--benchmark", action="store_true", help="run the throughput benchmark")
+    parser.add_argument("--model", choices=["detection", "recognition"], help="benchmark a single model")
+    parser.add_argument("--workers", type=int, default=settings.INFERENCE_WORKERS)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        asyncio.run(_benchmark_main(args))
+    else:
+        parser.print_help()
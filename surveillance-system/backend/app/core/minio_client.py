@@ -255,6 +255,16 @@ async def upload_live_frame(
     )
 
 
+async def upload_archive(object_name: str, data: bytes) -> str:
+    """Upload a compressed export to the archive bucket."""
+    return await upload_image(
+        settings.MINIO_BUCKET_ARCHIVE,
+        object_name,
+        data,
+        content_type="application/gzip"
+    )
+
+
 async def get_subject_image_url(subject_id: str, image_id: str) -> str:
     """Get presigned URL for subject image."""
     object_name = f"{subject_id}/gallery/{image_id}.jpg"
@@ -1,25 +1,35 @@
 """
 Redis client configuration for caching and message queuing.
 Uses aioredis for async operations.
+
+Two connection pools are kept: a decoding one for cache, rate limiting and
+JSON pub/sub, and a binary one for pipeline streams and channels carrying
+msgpack-encoded messages (see app.core.codec).
 """
 
+import asyncio
 import json
-from typing import Any, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 
 import aioredis
 import structlog
 
+from app.core.codec import CodecError, encode, decode, to_jsonable
 from app.core.config import settings
 
 logger = structlog.get_logger()
 
-# Global Redis client
+# Global Redis clients
 redis_client: Optional[aioredis.Redis] = None
+redis_binary_client: Optional[aioredis.Redis] = None
+
+# Stream entry field holding the encoded message
+MESSAGE_FIELD = b"m"
 
 
 async def init_redis() -> None:
     """Initialize Redis connection."""
-    global redis_client
+    global redis_client, redis_binary_client
     logger.info("Initializing Redis connection...")
     
     try:
@@ -29,9 +39,15 @@ async def init_redis() -> None:
             decode_responses=True,
             max_connections=settings.REDIS_POOL_SIZE
         )
+        redis_binary_client = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=False,
+            max_connections=settings.REDIS_POOL_SIZE
+        )
         
-        # Test connection
+        # Test connections
         await redis_client.ping()
+        await redis_binary_client.ping()
         logger.info("Redis connection established")
         
     except Exception as e:
@@ -41,13 +57,17 @@ async def init_redis() -> None:
 
 async def close_redis() -> None:
     """Close Redis connection."""
-    global redis_client
+    global redis_client, redis_binary_client
     logger.info("Closing Redis connection...")
     
     if redis_client:
         await redis_client.close()
         redis_client = None
     
+    if redis_binary_client:
+        await redis_binary_client.close()
+        redis_binary_client = None
+    
     logger.info("Redis connection closed")
 
 
@@ -58,6 +78,13 @@ def get_redis() -> aioredis.Redis:
     return redis_client
 
 
+def get_redis_binary() -> aioredis.Redis:
+    """Get non-decoding Redis client instance for binary payloads."""
+    if redis_binary_client is None:
+        raise RuntimeError("Redis client not initialized")
+    return redis_binary_client
+
+
 # Cache operations
 async def cache_get(key: str) -> Optional[Any]:
     """Get value from cache."""
@@ -91,24 +118,181 @@ async def cache_delete(key: str) -> bool:
         return False
 
 
-async def cache_delete_pattern(pattern: str) -> int:
-    """Delete keys matching pattern."""
+# Tagged cache entries
+#
+# Entries cached under a tag embed the tag's generation; invalidating the
+# tag bumps the generation (one INCR), after which older entries read as
+# misses and expire on their own. A tag's entries must be keyed `<tag>:...`
+# so `cache_collect` can find stale ones in the background.
+
+CACHE_GENERATION_PREFIX = "cache:generation:"
+CACHE_GC_LOCK = "cache:gc:lock"
+CACHE_GC_BATCH = 500
+
+
+async def cache_get_tagged(key: str, tag: str) -> Tuple[Optional[Any], int]:
+    """
+    Get a tagged value and the tag's current generation. On a miss, pass
+    the generation to `cache_set_tagged` so a value read while the tag was
+    invalidated is not cached as current.
+    """
     try:
-        keys = await get_redis().keys(pattern)
-        if keys:
-            return await get_redis().delete(*keys)
-        return 0
+        generation, value = await get_redis().mget(CACHE_GENERATION_PREFIX + tag, key)
+        generation = int(generation or 0)
+        if value:
+            entry = json.loads(value)
+            if entry["g"] == generation:
+                return entry["v"], generation
+        return None, generation
     except Exception as e:
-        logger.warning("Cache delete pattern failed", pattern=pattern, error=str(e))
-        return 0
+        logger.warning("Cache get failed", key=key, error=str(e))
+        return None, -1
 
 
-# Stream operations for message queuing
-async def stream_add(stream: str, data: dict) -> str:
-    """Add message to Redis Stream."""
+async def cache_set_tagged(key: str, value: Any, tag: str, generation: int, expire: int = 300) -> bool:
+    """Set a tagged value read under `generation` (see `cache_get_tagged`)."""
+    if generation < 0:
+        return False
+    try:
+        await get_redis().setex(key, expire, json.dumps({"g": generation, "v": value}))
+        return True
+    except Exception as e:
+        logger.warning("Cache set failed", key=key, error=str(e))
+        return False
+
+
+async def cache_invalidate(tag: str) -> bool:
+    """Invalidate every entry cached under a tag."""
+    try:
+        await get_redis().incr(CACHE_GENERATION_PREFIX + tag)
+        return True
+    except Exception as e:
+        logger.warning("Cache invalidate failed", tag=tag, error=str(e))
+        return False
+
+
+async def cache_collect() -> int:
+    """
+    Delete tagged entries of superseded generations. Walks the keyspace with
+    SCAN, so it is meant for background use only.
+    """
     redis = get_redis()
-    message_id = await redis.xadd(stream, data)
-    return message_id
+    deleted = 0
+    async for generation_key in redis.scan_iter(match=f"{CACHE_GENERATION_PREFIX}*", count=100):
+        tag = generation_key[len(CACHE_GENERATION_PREFIX):]
+        generation = int(await redis.get(generation_key) or 0)
+        keys = []
+        async for key in redis.scan_iter(match=f"{tag}:*", count=CACHE_GC_BATCH):
+            keys.append(key)
+            if len(keys) >= CACHE_GC_BATCH:
+                deleted += await _collect_stale(keys, generation)
+                keys = []
+        if keys:
+            deleted += await _collect_stale(keys, generation)
+    return deleted
+
+
+async def _collect_stale(keys: List[str], generation: int) -> int:
+    stale = []
+    for key, value in zip(keys, await get_redis().mget(*keys)):
+        try:
+            if value and json.loads(value)["g"] < generation:
+                stale.append(key)
+        except (ValueError, KeyError, TypeError):
+            # Not a tagged entry
+            continue
+    if stale:
+        return await get_redis().delete(*stale)
+    return 0
+
+
+async def run_cache_collector() -> None:
+    """Collect stale cache entries every CACHE_GC_INTERVAL, in one process at a time."""
+    while True:
+        await asyncio.sleep(settings.CACHE_GC_INTERVAL)
+        try:
+            if await get_redis().set(CACHE_GC_LOCK, 1, nx=True, ex=settings.CACHE_GC_INTERVAL):
+                deleted = await cache_collect()
+                if deleted:
+                    logger.info("Stale cache entries collected", deleted=deleted)
+        except Exception as e:
+            logger.warning("Cache collection failed", error=str(e))
+
+
+# Stream operations for message queuing
+async def stream_add(
+    stream: str,
+    kind: str,
+    data: dict,
+    maxlen: Optional[int] = None
+) -> str:
+    """
+    Add a binary-encoded message of the given schema kind to a Redis Stream,
+    optionally capped (approximately) at maxlen.
+    """
+    redis = get_redis_binary()
+    message_id = await redis.xadd(
+        stream,
+        {MESSAGE_FIELD: encode(kind, data)},
+        maxlen=maxlen,
+        approximate=True
+    )
+    return message_id.decode()
+
+
+async def stream_add_many(
+    stream: str,
+    kind: str,
+    items: List[dict],
+    maxlen: Optional[int] = None
+) -> List[str]:
+    """Add several messages of one kind in a single pipelined round trip."""
+    pipe = get_redis_binary().pipeline(transaction=False)
+    for data in items:
+        pipe.xadd(stream, {MESSAGE_FIELD: encode(kind, data)}, maxlen=maxlen, approximate=True)
+    return [message_id.decode() for message_id in await pipe.execute()]
+
+
+# How long stream_add_once remembers what it added
+STREAM_DEDUPE_TTL = 86400
+
+# KEYS: stream, then one dedupe key per message
+# ARGV: message field, maxlen, dedupe TTL, then the encoded messages in order
+ADD_ONCE_SCRIPT = """
+local added = 0
+for i = 2, #KEYS do
+    if redis.call('SET', KEYS[i], 1, 'NX', 'EX', ARGV[3]) then
+        redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', ARGV[1], ARGV[i + 2])
+        added = added + 1
+    end
+end
+return added
+"""
+
+
+async def stream_add_once(
+    stream: str,
+    kind: str,
+    items: List[Tuple[str, dict]],
+    maxlen: int
+) -> int:
+    """
+    Add (dedupe id, message) pairs to a stream, skipping ids added before,
+    so a failed or repeated call can simply be retried. Returns how many
+    messages were added.
+    """
+    if not items:
+        return 0
+    return await get_redis_binary().eval(
+        ADD_ONCE_SCRIPT,
+        1 + len(items),
+        stream,
+        *[f"{stream}:added:{dedupe_id}" for dedupe_id, _ in items],
+        MESSAGE_FIELD,
+        maxlen,
+        STREAM_DEDUPE_TTL,
+        *[encode(kind, data) for _, data in items]
+    )
 
 
 async def stream_read(
@@ -116,11 +300,15 @@ async def stream_read(
     group: Optional[str] = None,
     consumer: Optional[str] = None,
     count: int = 10,
-    block: int = 5000,
+    block: Optional[int] = 5000,
     last_id: str = ">"
-) -> List[dict]:
-    """Read messages from Redis Stream."""
-    redis = get_redis()
+) -> List[Tuple[str, List[Tuple[str, Dict[str, Any]]]]]:
+    """
+    Read messages from Redis Stream.
+    Returns [(stream, [(message_id, payload), ...])] with decoded payloads;
+    deleted or undecodable entries come back with an empty payload.
+    """
+    redis = get_redis_binary()
     
     if group and consumer:
         messages = await redis.xreadgroup(
@@ -137,13 +325,29 @@ async def stream_read(
             block=block
         )
     
-    return messages
+    return [
+        (
+            name.decode(),
+            [(message_id.decode(), _decode_entry(fields)) for message_id, fields in entries]
+        )
+        for name, entries in messages or []
+    ]
 
 
-async def stream_ack(stream: str, group: str, message_id: str) -> int:
-    """Acknowledge message in consumer group."""
+def _decode_entry(fields: Optional[dict]) -> Dict[str, Any]:
+    if not fields:
+        return {}
+    try:
+        return decode(fields[MESSAGE_FIELD])[1]
+    except (CodecError, KeyError) as e:
+        logger.warning("Dropping undecodable stream entry", error=str(e))
+        return {}
+
+
+async def stream_ack(stream: str, group: str, *message_ids: str) -> int:
+    """Acknowledge messages in consumer group."""
     redis = get_redis()
-    return await redis.xack(stream, group, message_id)
+    return await redis.xack(stream, group, *message_ids)
 
 
 async def stream_create_group(stream: str, group: str) -> bool:
@@ -158,13 +362,137 @@ async def stream_create_group(stream: str, group: str) -> bool:
         raise
 
 
+async def stream_claim_abandoned(
+    stream: str,
+    group: str,
+    consumer: str,
+    min_idle_ms: int,
+    count: int = 10
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Move up to `count` entries left pending by a consumer that has not read
+    for min_idle_ms to `consumer`, decoded as by stream_read(). Consumers
+    still reading keep their pending entries, even ones held on purpose.
+    Abandoned consumers with nothing pending are removed from the group.
+    """
+    redis = get_redis()
+    for info in await redis.xinfo_consumers(stream, group):
+        name = info["name"]
+        if name == consumer or info["idle"] < min_idle_ms:
+            continue
+        if not info["pending"]:
+            await redis.xgroup_delconsumer(stream, group, name)
+            continue
+        pending = await redis.xpending_range(stream, group, min="-", max="+", count=count, consumername=name)
+        if not pending:
+            continue
+        # The idle check keeps two consumers from claiming the same entries
+        claimed = await get_redis_binary().xclaim(
+            stream, group, consumer, min_idle_ms, [entry["message_id"] for entry in pending]
+        )
+        if claimed:
+            return [(message_id.decode(), _decode_entry(fields)) for message_id, fields in claimed]
+    return []
+
+
+# Real-time feeds: capped streams behind the WebSocket endpoints, so a
+# client that reconnects can resume after the last entry it saw. Detections
+# go to an aggregate feed and to one feed per camera, so a client watching
+# a single camera only reads that camera's traffic.
+ALERTS_FEED = "alerts:feed"
+DETECTIONS_FEED = "detections:feed"
+
+
+def detections_feed(camera_id: Optional[str] = None) -> str:
+    """Detection feed for one camera, or the aggregate feed."""
+    return f"{DETECTIONS_FEED}:{camera_id}" if camera_id else DETECTIONS_FEED
+
+
+def entry_position(entry_id: str) -> Tuple[int, int]:
+    """Stream entry id as a comparable (ms, seq) pair; ValueError if malformed."""
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+async def feed_top(feed: str) -> str:
+    """Id of the newest entry in a feed, or 0-0."""
+    entries = await get_redis_binary().xrevrange(feed, count=1)
+    return entries[0][0].decode() if entries else "0-0"
+
+
+async def feed_resumable(feed: str, last_id: str) -> bool:
+    """Whether a feed still holds every entry after last_id."""
+    try:
+        position = entry_position(last_id)
+        info = await get_redis_binary().xinfo_stream(feed)
+    except (ValueError, aioredis.ResponseError):
+        return False
+
+    def entry_id(value: Any) -> Tuple[int, int]:
+        return entry_position(value.decode() if isinstance(value, bytes) else value)
+
+    if position > entry_id(info["last-generated-id"]):
+        # Newer than anything in the feed: it was recreated since
+        return False
+    if info.get("max-deleted-entry-id") is not None:
+        return position >= entry_id(info["max-deleted-entry-id"])
+    # Before Redis 7 trimming is not recorded; assume the worst
+    first = info.get("first-entry")
+    return first is None or position >= entry_id(first[0])
+
+
+async def feed_range(
+    feed: str,
+    after: str,
+    until: str = "+",
+    count: int = 200
+) -> List[Tuple[str, Dict[bytes, bytes]]]:
+    """Raw entries of a feed after `after` (exclusive) up to `until`."""
+    entries = await get_redis_binary().xrange(feed, min=f"({after}", max=until, count=count)
+    return [(entry_id.decode(), fields) for entry_id, fields in entries]
+
+
+def feed_message(entry_id: str, fields: Dict[bytes, bytes]) -> Optional[dict]:
+    """A feed entry as the JSON message sent to browsers, tagged with its id."""
+    try:
+        message = to_jsonable(decode(fields[MESSAGE_FIELD])[1])
+    except (CodecError, KeyError):
+        return None
+    message["id"] = entry_id
+    return message
+
+
+async def publish_alert_update(message: dict) -> str:
+    """Append an alert change ({"type": ..., ...}) to the alerts feed."""
+    return await stream_add(ALERTS_FEED, "alert_update", message, maxlen=settings.WS_ALERTS_FEED_LENGTH)
+
+
+async def publish_detections(entries: List[Tuple[str, dict]]) -> None:
+    """Append detection messages to their feeds in a single round trip."""
+    pipe = get_redis_binary().pipeline(transaction=False)
+    for feed, message in entries:
+        pipe.xadd(
+            feed,
+            {MESSAGE_FIELD: encode("detections", message)},
+            maxlen=settings.WS_DETECTIONS_FEED_LENGTH,
+            approximate=True
+        )
+    await pipe.execute()
+
+
 # Pub/Sub operations
 async def publish(channel: str, message: dict) -> int:
-    """Publish message to channel."""
+    """Publish JSON message to channel."""
     redis = get_redis()
     return await redis.publish(channel, json.dumps(message))
 
 
+async def publish_message(channel: str, kind: str, message: dict) -> int:
+    """Publish binary-encoded pipeline message of the given schema kind."""
+    redis = get_redis_binary()
+    return await redis.publish(channel, encode(kind, message))
+
+
 # Rate limiting
 async def check_rate_limit(key: str, max_requests: int, window: int) -> tuple[bool, int]:
     """
@@ -0,0 +1,188 @@
+"""
+WebSocket delivery metrics.
+
+Every API process counts, per channel, its open sockets (raw WebSockets
+and Socket.IO namespaces, the latter as `socketio:<channel>`), the frames
+waiting in their send queues, the frames dropped by the overflow policy and
+the sockets refused at admission. Gauges are written every
+TRACING_FLUSH_INTERVAL seconds to a per-process hash that expires when the
+process stops refreshing it; drop and refusal counts are added to shared
+hashes. `/metrics` therefore reports every uvicorn worker, whichever
+one answers the scrape.
+"""
+
+import asyncio
+import os
+import socket
+from typing import Callable, Dict, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+KEY_PREFIX = "ws:metrics:"
+PROCESSES_KEY = "ws:metrics:processes"
+DROPPED_KEY = "ws:metrics:dropped"
+REJECTED_KEY = "ws:metrics:rejected"
+
+PROCESS = f"{socket.gethostname()}:{os.getpid()}"
+
+# channel -> {"connections": n, "queued": frames, "max_queue": frames}
+Gauges = Dict[str, Dict[str, int]]
+
+GAUGES = {
+    "connections": ("websocket_connections", "Open WebSocket connections"),
+    "queued": ("websocket_send_queue_frames", "Frames waiting in WebSocket send queues"),
+    "max_queue": ("websocket_send_queue_max_frames", "Longest WebSocket send queue"),
+}
+
+
+class SocketMetrics:
+    """Process-local WebSocket gauges and drop counts, flushed to Redis."""
+
+    def __init__(self):
+        # (channel, policy) -> frames dropped since the last flush
+        self.dropped: Dict[Tuple[str, str], int] = {}
+        # (channel, reason) -> sockets refused since the last flush
+        self.rejected: Dict[Tuple[str, str], int] = {}
+        # Source name -> function returning its current gauges
+        self._gauges: Dict[str, Callable[[], Gauges]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, source: str, gauges: Callable[[], Gauges]) -> None:
+        """Start flushing, reading the current gauges of `source` from `gauges`."""
+        self._gauges[source] = gauges
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def drop(self, channel: str, policy: str) -> None:
+        self.dropped[(channel, policy)] = self.dropped.get((channel, policy), 0) + 1
+
+    def reject(self, channel: str, reason: str) -> None:
+        self.rejected[(channel, reason)] = self.rejected.get((channel, reason), 0) + 1
+
+    async def flush(self) -> None:
+        key = f"{KEY_PREFIX}{PROCESS}"
+        fields = {
+            f"{channel}:{name}": value
+            for gauges in self._gauges.values()
+            for channel, values in gauges().items()
+            for name, value in values.items()
+        }
+        dropped, self.dropped = self.dropped, {}
+        rejected, self.rejected = self.rejected, {}
+
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.delete(key)
+        if fields:
+            pipe.hset(key, mapping=fields)
+            pipe.expire(key, int(settings.TRACING_FLUSH_INTERVAL * 3) + 1)
+            pipe.sadd(PROCESSES_KEY, PROCESS)
+        for (channel, policy), count in dropped.items():
+            pipe.hincrby(DROPPED_KEY, f"{channel}:{policy}", count)
+        for (channel, reason), count in rejected.items():
+            pipe.hincrby(REJECTED_KEY, f"{channel}:{reason}", count)
+        await pipe.execute()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRACING_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Failed to flush WebSocket metrics", error=str(e))
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._gauges = {}
+        try:
+            # With no gauge source this also clears the process's gauges
+            await self.flush()
+            await get_redis().srem(PROCESSES_KEY, PROCESS)
+        except Exception as e:
+            logger.warning("Failed to flush WebSocket metrics", error=str(e))
+
+
+metrics = SocketMetrics()
+
+
+async def load_gauges() -> Gauges:
+    """Gauges summed over all live API processes (max for the longest queue)."""
+    redis = get_redis()
+    processes = sorted(await redis.smembers(PROCESSES_KEY))
+    pipe = redis.pipeline(transaction=False)
+    for process in processes:
+        pipe.hgetall(f"{KEY_PREFIX}{process}")
+    results = await pipe.execute()
+
+    totals: Gauges = {}
+    expired = []
+    for process, values in zip(processes, results):
+        if not values:
+            expired.append(process)
+            continue
+        for field, value in values.items():
+            channel, _, name = field.rpartition(":")
+            channel_totals = totals.setdefault(channel, {name: 0 for name in GAUGES})
+            if name == "max_queue":
+                channel_totals[name] = max(channel_totals[name], int(value))
+            else:
+                channel_totals[name] = channel_totals.get(name, 0) + int(value)
+    if expired:
+        await redis.srem(PROCESSES_KEY, *expired)
+    return totals
+
+
+class _SocketSnapshot:
+    """Prometheus collector over WebSocket metrics already loaded from Redis."""
+
+    def __init__(self, gauges: Gauges, dropped: Dict[str, str], rejected: Dict[str, str]):
+        self.gauges = gauges
+        self.dropped = dropped
+        self.rejected = rejected
+
+    def collect(self):
+        for name, (metric, documentation) in GAUGES.items():
+            family = GaugeMetricFamily(metric, documentation, labels=["channel"])
+            for channel, values in self.gauges.items():
+                family.add_metric([channel], values.get(name, 0))
+            yield family
+
+        family = CounterMetricFamily(
+            "websocket_dropped_frames",
+            "Frames dropped or coalesced away by the send queue overflow policy",
+            labels=["channel", "policy"]
+        )
+        for field, count in self.dropped.items():
+            channel, _, policy = field.rpartition(":")
+            family.add_metric([channel, policy], int(count))
+        yield family
+
+        family = CounterMetricFamily(
+            "websocket_rejected_connections",
+            "Sockets refused at admission (unauthorized, user_limit or capacity)",
+            labels=["channel", "reason"]
+        )
+        for field, count in self.rejected.items():
+            channel, _, reason = field.rpartition(":")
+            family.add_metric([channel, reason], int(count))
+        yield family
+
+
+async def prometheus_socket_metrics() -> bytes:
+    """Cluster-wide WebSocket metrics in the Prometheus text format."""
+    registry = CollectorRegistry(auto_describe=False)
+    redis = get_redis()
+    registry.register(_SocketSnapshot(
+        await load_gauges(),
+        await redis.hgetall(DROPPED_KEY),
+        await redis.hgetall(REJECTED_KEY)
+    ))
+    return generate_latest(registry)
@@ -0,0 +1,251 @@
+"""
+Frame-to-alert latency tracing.
+
+Every sampled frame carries a trace, {"id": ..., "stages": {stage: epoch}},
+through the pipeline messages. Each process stamps the stages it completes
+with `mark()`, which also records how long the stage took since the
+previous stamp (queueing included). Stages that end a path, detections or
+alerts reaching the WebSocket channels, also record the end-to-end latency
+from capture.
+
+Observations are aggregated per camera and stage into fixed-bucket
+histograms, kept in process and merged into Redis every few seconds, so
+the API can serve cluster-wide numbers: all-time counters for Prometheus
+and per-minute windows for `/analytics/pipeline-latency`.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import HistogramMetricFamily
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+# Pipeline stages in order of completion
+STAGES = ("capture", "decode", "detect", "embed", "search", "write", "publish", "evaluate", "alert")
+
+# Final stage of a path -> histogram of its capture-to-completion latency
+END_TO_END = {
+    "publish": "detection_end_to_end",
+    "alert": "alert_end_to_end",
+}
+
+# Histogram bucket upper bounds in seconds; one extra +Inf bucket follows
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CAMERAS_KEY = "pipeline:latency:cameras"
+KEY_PREFIX = "pipeline:latency:"
+
+
+def new_trace(captured_at: Optional[float] = None) -> Dict[str, Any]:
+    """Start a trace for a frame captured now (or at the given epoch time)."""
+    return {"id": uuid4().hex, "stages": {"capture": captured_at or time.time()}}
+
+
+def mark(trace: Optional[Dict[str, Any]], camera_id: str, stage: str) -> None:
+    """
+    Stamp a completed stage and record its latency. Messages from producers
+    without tracing carry no trace and are skipped.
+    """
+    if not trace:
+        return
+    now = time.time()
+    stages = trace["stages"]
+    previous = max(stages.values())
+    stages[stage] = now
+    recorder.observe(camera_id, stage, now - previous)
+    if stage in END_TO_END:
+        recorder.observe(camera_id, END_TO_END[stage], now - stages["capture"])
+
+
+def window_key(camera_id: str, minute: int) -> str:
+    return f"{KEY_PREFIX}{camera_id}:{minute}"
+
+
+def total_key(camera_id: str) -> str:
+    return f"{KEY_PREFIX}{camera_id}"
+
+
+class LatencyRecorder:
+    """Process-local histogram deltas, flushed to Redis in the background."""
+
+    def __init__(self):
+        # (camera_id, stage) -> [bucket counts..., sum, count]
+        self.pending: Dict[Tuple[str, str], List[float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self, camera_id: str, stage: str, seconds: float) -> None:
+        seconds = max(0.0, seconds)
+        counts = self.pending.get((camera_id, stage))
+        if counts is None:
+            counts = self.pending[(camera_id, stage)] = [0.0] * (len(BUCKETS) + 3)
+        index = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+        counts[index] += 1
+        counts[-2] += seconds
+        counts[-1] += 1
+
+        if self._task is None:
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                pass
+
+    async def flush(self) -> None:
+        """Merge pending observations into the shared histograms."""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+
+        minute = int(time.time() // 60)
+        retention = settings.TRACING_WINDOW_MINUTES * 60 + 60
+        pipe = get_redis().pipeline(transaction=False)
+        for (camera_id, stage), counts in pending.items():
+            pipe.sadd(CAMERAS_KEY, camera_id)
+            for key in (total_key(camera_id), window_key(camera_id, minute)):
+                for index, count in enumerate(counts[:-2]):
+                    if count:
+                        pipe.hincrby(key, f"{stage}:{index}", int(count))
+                pipe.hincrbyfloat(key, f"{stage}:sum", counts[-2])
+                pipe.hincrby(key, f"{stage}:count", int(counts[-1]))
+            pipe.expire(window_key(camera_id, minute), retention)
+        await pipe.execute()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRACING_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Failed to flush latency histograms", error=str(e))
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Failed to flush latency histograms", error=str(e))
+
+
+recorder = LatencyRecorder()
+
+
+async def close_tracing() -> None:
+    """Flush what this process observed; call before closing Redis."""
+    await recorder.close()
+
+
+def parse_histograms(data: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Turn a stored hash into {stage: {"buckets": [...], "sum": s, "count": n}}."""
+    stages: Dict[str, Dict[str, Any]] = {}
+    for field, value in data.items():
+        stage, _, part = field.rpartition(":")
+        entry = stages.setdefault(stage, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+        if part == "sum":
+            entry["sum"] = float(value)
+        elif part == "count":
+            entry["count"] = int(value)
+        else:
+            entry["buckets"][int(part)] = int(value)
+    return stages
+
+
+def merge_histograms(target: Dict[str, Dict[str, Any]], source: Dict[str, Dict[str, Any]]) -> None:
+    for stage, entry in source.items():
+        merged = target.setdefault(stage, {"buckets": [0] * (len(BUCKETS) + 1), "sum": 0.0, "count": 0})
+        merged["buckets"] = [a + b for a, b in zip(merged["buckets"], entry["buckets"])]
+        merged["sum"] += entry["sum"]
+        merged["count"] += entry["count"]
+
+
+def quantile(buckets: List[int], q: float) -> Optional[float]:
+    """Estimate a quantile in seconds by interpolating inside its bucket."""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            lower = BUCKETS[index - 1] if index > 0 else 0.0
+            if index == len(BUCKETS):
+                return lower
+            return lower + (BUCKETS[index] - lower) * (rank - seen) / count
+        seen += count
+    return BUCKETS[-1]
+
+
+async def load_histograms(
+    camera_ids: Optional[List[str]] = None,
+    minutes: Optional[int] = None
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """
+    Histograms per camera and stage: all-time when `minutes` is None,
+    otherwise summed over the last `minutes` minute windows.
+    """
+    redis = get_redis()
+    if camera_ids is None:
+        camera_ids = sorted(await redis.smembers(CAMERAS_KEY))
+
+    if minutes is None:
+        keys = {camera_id: [total_key(camera_id)] for camera_id in camera_ids}
+    else:
+        current = int(time.time() // 60)
+        keys = {
+            camera_id: [window_key(camera_id, minute) for minute in range(current - minutes + 1, current + 1)]
+            for camera_id in camera_ids
+        }
+
+    pipe = redis.pipeline(transaction=False)
+    for camera_keys in keys.values():
+        for key in camera_keys:
+            pipe.hgetall(key)
+    results = iter(await pipe.execute())
+
+    histograms: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for camera_id, camera_keys in keys.items():
+        merged: Dict[str, Dict[str, Any]] = {}
+        for _ in camera_keys:
+            merge_histograms(merged, parse_histograms(next(results)))
+        if merged:
+            histograms[camera_id] = merged
+    return histograms
+
+
+class _HistogramSnapshot:
+    """Prometheus collector over histograms already loaded from Redis."""
+
+    def __init__(self, histograms: Dict[str, Dict[str, Dict[str, Any]]]):
+        self.histograms = histograms
+
+    def collect(self):
+        family = HistogramMetricFamily(
+            "pipeline_stage_latency_seconds",
+            "Time from the previous pipeline stage (or capture, for end-to-end) to this one",
+            labels=["camera_id", "stage"]
+        )
+        bounds = [str(bound) for bound in BUCKETS] + ["+Inf"]
+        for camera_id, stages in self.histograms.items():
+            for stage, entry in stages.items():
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(bounds, entry["buckets"]):
+                    cumulative += count
+                    buckets.append((bound, cumulative))
+                family.add_metric([camera_id, stage], buckets, entry["sum"])
+        yield family
+
+
+async def prometheus_metrics() -> bytes:
+    """Cluster-wide latency histograms in the Prometheus text format."""
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(_HistogramSnapshot(await load_histograms()))
+    return generate_latest(registry)
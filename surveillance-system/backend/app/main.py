@@ -3,21 +3,31 @@ Main FastAPI application entry point.
 Configures middleware, routes, and startup/shutdown events.
 """
 
+import asyncio
 import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+import socketio
 import structlog
 
+from app.api.v1.gateway import sio
 from app.api.v1.router import api_router
+from app.api.v1.endpoints.websocket import manager as websocket_manager
 from app.core.config import settings
 from app.core.database import init_db, close_db
-from app.core.redis import init_redis, close_redis
+from app.core.redis import init_redis, close_redis, run_cache_collector
 from app.core.minio_client import init_minio
+from app.core.inference import init_inference, close_inference
+from app.core.socket_metrics import prometheus_socket_metrics
+from app.core.tracing import close_tracing, prometheus_metrics
+from app.services.system_health import health as system_health
 from app.middleware.audit import AuditMiddleware
+from app.middleware.latency import LatencyMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
 
 logger = structlog.get_logger()
@@ -31,12 +41,20 @@ async def lifespan(app: FastAPI):
     await init_db()
     await init_redis()
     await init_minio()
+    # Face enrollment runs on this pool; spawning it takes the model load and warm-up
+    await init_inference(workers=settings.INFERENCE_API_WORKERS)
+    cache_collector = asyncio.create_task(run_cache_collector())
     logger.info("Surveillance system API started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down surveillance system API...")
+    cache_collector.cancel()
+    await websocket_manager.close()
+    await system_health.close()
+    await close_inference()
+    await close_tracing()
     await close_db()
     await close_redis()
     logger.info("Surveillance system API shut down successfully")
@@ -74,11 +92,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 app.add_middleware(RateLimitMiddleware)
 app.add_middleware(AuditMiddleware)
+app.add_middleware(LatencyMiddleware)
 
 # Include API routes
 app.include_router(api_router, prefix="/api/v1")
@@ -94,6 +114,15 @@ async def health_check():
     }
 
 
+@app.get("/metrics", tags=["System"], include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint for pipeline latency and WebSocket delivery."""
+    return Response(
+        await prometheus_metrics() + await prometheus_socket_metrics(),
+        media_type=CONTENT_TYPE_LATEST
+    )
+
+
 @app.get("/", tags=["System"])
 async def root():
     """Root endpoint with API information."""
@@ -120,10 +149,14 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+# Socket.IO gateway on /socket.io; every other request goes to the API
+asgi_app = socketio.ASGIApp(sio, other_asgi_app=app)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
-        "app.main:app",
+        "app.main:asgi_app",
         host="0.0.0.0",
         port=8000,
         reload=settings.DEBUG,
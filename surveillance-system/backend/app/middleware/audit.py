@@ -41,6 +41,7 @@ class AuditMiddleware(BaseHTTPMiddleware):
         """Check if request should be skipped from audit log."""
         skip_paths = [
             "/health",
+            "/metrics",
             "/docs",
             "/redoc",
             "/openapi.json",
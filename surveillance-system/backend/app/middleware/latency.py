@@ -0,0 +1,24 @@
+"""Request latency middleware feeding the system health snapshots."""
+
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.services.system_health import request_latency
+
+
+class LatencyMiddleware:
+    """Record how long each HTTP request takes (WebSockets are not timed)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_latency.observe(time.perf_counter() - started)
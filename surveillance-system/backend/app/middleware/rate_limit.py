@@ -53,6 +53,7 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         """Check if request should skip rate limiting."""
         skip_paths = [
             "/health",
+            "/metrics",
             "/docs",
             "/redoc",
             "/openapi.json"
@@ -133,3 +133,13 @@ class AlertLog(Base):
         """Resolve the alert."""
         self.status = "resolved"
         self.resolved_at = datetime.utcnow()
+
+
+class AlertActionOutbox(Base):
+    """Notification job of a committed alert not yet on the actions stream."""
+
+    __tablename__ = "alert_action_outbox"
+
+    job_id = Column(UUID(as_uuid=True), primary_key=True)
+    job = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
@@ -1,6 +1,6 @@
 """Alert schemas for API requests and responses."""
 
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 from uuid import UUID
 
@@ -17,6 +17,12 @@ class AlertConditions(BaseModel):
     time_range: Optional[Dict[str, str]] = None
     days: Optional[List[str]] = None
     exclude_types: Optional[List[str]] = None
+    cooldown_scopes: Optional[List[Literal["rule", "subject", "camera"]]] = None
+    # Windowed rule types (loitering, time_restriction, crowd, tailgating)
+    dwell_seconds: Optional[float] = Field(None, ge=0)
+    gap_seconds: Optional[float] = Field(None, gt=0)
+    window_seconds: Optional[float] = Field(None, gt=0)
+    max_occupancy: Optional[int] = Field(None, ge=1)
 
 
 class AlertActions(BaseModel):
@@ -25,6 +31,7 @@ class AlertActions(BaseModel):
     email: Optional[List[str]] = None
     sms: Optional[List[str]] = None
     push: Optional[bool] = False
+    batch: Optional[bool] = False  # group alerts due together into one call per destination
 
 
 class AlertRuleBase(BaseModel):
@@ -101,6 +108,28 @@ class AlertResolveRequest(BaseModel):
     notes: Optional[str] = None
 
 
+class AlertBulkFilter(BaseModel):
+    """Selects the alerts a bulk operation applies to."""
+    rule_id: Optional[UUID] = None
+    subject_id: Optional[UUID] = None
+    camera_id: Optional[UUID] = None
+    max_priority: Optional[int] = Field(None, ge=1, le=10)
+    created_before: Optional[datetime] = None
+
+
+class AlertBulkRequest(BaseModel):
+    """Schema for acknowledging or resolving many alerts at once."""
+    alert_ids: Optional[List[UUID]] = Field(None, max_length=5000)
+    filter: Optional[AlertBulkFilter] = None
+    notes: Optional[str] = None
+
+
+class AlertBulkResponse(BaseModel):
+    """Schema for the result of a bulk operation."""
+    updated: int
+    alert_ids: List[UUID]
+
+
 class AlertStatsResponse(BaseModel):
     """Schema for alert statistics."""
     total_alerts: int
@@ -95,6 +95,29 @@ class DemographicsResponse(BaseModel):
     time_to: datetime
 
 
+class StageLatency(BaseModel):
+    """Schema for latency of one pipeline stage."""
+    count: int
+    mean_ms: Optional[float]
+    p50_ms: Optional[float]
+    p95_ms: Optional[float]
+    p99_ms: Optional[float]
+
+
+class CameraPipelineLatency(BaseModel):
+    """Schema for pipeline latency of one camera."""
+    camera_id: UUID
+    camera_name: Optional[str]
+    stages: Dict[str, StageLatency]
+
+
+class PipelineLatencyResponse(BaseModel):
+    """Schema for pipeline latency response."""
+    window_minutes: int
+    stages: Dict[str, StageLatency]
+    cameras: List[CameraPipelineLatency]
+
+
 class ExportRequest(BaseModel):
     """Schema for data export request."""
     format: str = Field(default="csv", pattern="^(csv|json|pdf)$")
@@ -14,6 +14,8 @@ class StreamConfig(BaseModel):
     fps: int = 15
     codec: str = "h264"
     auth_type: str = "basic"
+    min_sample_rate: Optional[float] = Field(None, gt=0)
+    max_sample_rate: Optional[float] = Field(None, gt=0)
 
 
 class DetectionZone(BaseModel):
@@ -0,0 +1,265 @@
+"""
+Alert actions: webhook, email and SMS notifications.
+
+The alert path only enqueues jobs on STREAM_ACTIONS, one per alert and
+channel, so a slow or failing endpoint can never hold up evaluation; the
+dispatcher worker (app.workers.dispatcher) delivers them. Jobs are also
+written to `alert_action_outbox` in the transaction that stores their
+alerts and deleted once queued, so jobs that could not be queued are not
+lost: `relay_outbox()` queues them again. Each job has an id and is added
+to the stream at most once. Email and SMS go
+through HTTP relays (EMAIL_GATEWAY_URL, SMS_GATEWAY_URL), so every channel
+is an HTTP POST.
+
+`ActionSender` owns one connection pool per destination origin and caps
+the requests in flight to each host; when too many deliveries are already
+waiting on a host, new ones are deferred instead of queueing behind it.
+It needs nothing but the network, so it can be pointed at a local stub
+server:
+
+    async with ActionSender() as sender:
+        outcome = await sender.send(Delivery("webhook", "http://localhost:8099/hook", [alert]))
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from uuid import UUID, uuid4
+
+import httpx
+from sqlalchemy import delete, select
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import stream_add_once
+from app.models.alert import AlertActionOutbox
+
+logger = structlog.get_logger()
+
+CHANNELS = ("webhook", "email", "sms")
+
+# Statuses worth retrying; other 4xx responses will not get better
+RETRY_STATUSES = {408, 425, 429}
+
+# Pools unused for this long are closed
+POOL_IDLE_SECONDS = 300
+
+
+@dataclass
+class Delivery:
+    """One request to make: a channel, its target and the alerts it carries."""
+    channel: str
+    target: Any
+    alerts: List[Dict[str, Any]]
+    attempt: int = 0
+    # Stream entries this delivery settles
+    message_ids: List[str] = field(default_factory=list)
+
+    @property
+    def url(self) -> Optional[str]:
+        if self.channel == "webhook":
+            return self.target
+        if self.channel == "email":
+            return settings.EMAIL_GATEWAY_URL
+        if self.channel == "sms":
+            return settings.SMS_GATEWAY_URL
+        return None
+
+
+@dataclass
+class Outcome:
+    ok: bool
+    retry: bool = False
+    error: Optional[str] = None
+    # Seconds the destination asked us to wait, or a deferral delay
+    retry_after: Optional[float] = None
+    # Deferred without being attempted; does not count as an attempt
+    deferred: bool = False
+
+
+def action_jobs(rule_actions: Dict[str, Any], alert: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Queue entries for the notifications a rule's actions ask for."""
+    batch = bool(rule_actions.get("batch"))
+    jobs = []
+    for channel in CHANNELS:
+        target = rule_actions.get(channel)
+        if target:
+            jobs.append({
+                "job_id": str(uuid4()),
+                "channel": channel,
+                "target": target,
+                "alerts": [alert],
+                "batch": batch,
+                "attempt": 0
+            })
+    return jobs
+
+
+def outbox_rows(jobs: List[Dict[str, Any]]) -> List[AlertActionOutbox]:
+    """Outbox rows to store with the alerts the jobs notify about."""
+    return [AlertActionOutbox(job_id=UUID(job["job_id"]), job=job) for job in jobs]
+
+
+async def _queue(jobs: List[Dict[str, Any]]) -> None:
+    await stream_add_once(
+        settings.STREAM_ACTIONS,
+        "action",
+        [(job["job_id"], job) for job in jobs],
+        maxlen=settings.ACTION_QUEUE_MAX_LENGTH
+    )
+
+
+def _settle(jobs: List[Dict[str, Any]]):
+    """Statement removing queued jobs from the outbox."""
+    return delete(AlertActionOutbox).where(AlertActionOutbox.job_id.in_([UUID(job["job_id"]) for job in jobs]))
+
+
+async def enqueue_actions(jobs: List[Dict[str, Any]]) -> None:
+    """Queue jobs for the dispatcher, then clear them from the outbox."""
+    if not jobs:
+        return
+    await _queue(jobs)
+    async with AsyncSessionLocal() as session:
+        await session.execute(_settle(jobs))
+        await session.commit()
+
+
+async def relay_outbox(limit: int = 500) -> int:
+    """Queue outbox jobs left over for ACTION_OUTBOX_DELAY seconds; returns how many."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.ACTION_OUTBOX_DELAY)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(AlertActionOutbox)
+            .where(AlertActionOutbox.created_at < cutoff)
+            .order_by(AlertActionOutbox.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        jobs = [row.job for row in result.scalars()]
+        if not jobs:
+            return 0
+        await _queue(jobs)
+        await session.execute(_settle(jobs))
+        await session.commit()
+    return len(jobs)
+
+
+def backoff(attempt: int) -> float:
+    """Jittered exponential backoff before retry number `attempt` + 1."""
+    ceiling = min(settings.ACTION_RETRY_MAX_DELAY, settings.ACTION_RETRY_BASE * 2 ** attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def _summary(alert: Dict[str, Any]) -> str:
+    trigger = alert.get("trigger_data") or {}
+    return (
+        f"[P{alert.get('priority')}] {alert.get('rule_name') or trigger.get('rule_name')} "
+        f"({alert.get('rule_type') or trigger.get('rule_type')}) on camera {alert.get('camera_id')} "
+        f"at {alert.get('created_at')}"
+    )
+
+
+def render(delivery: Delivery) -> Dict[str, Any]:
+    """Request body for a delivery."""
+    alerts = delivery.alerts
+    if delivery.channel == "webhook":
+        if len(alerts) == 1:
+            return {"type": "alert", "data": alerts[0]}
+        return {"type": "alerts", "data": alerts}
+
+    lines = [_summary(alert) for alert in alerts]
+    if delivery.channel == "email":
+        subject = lines[0] if len(lines) == 1 else f"{len(lines)} surveillance alerts"
+        return {"to": delivery.target, "subject": subject, "text": "\n".join(lines)}
+    return {"to": delivery.target, "message": lines[0] if len(lines) == 1 else f"{len(lines)} alerts: {lines[0]}"}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+class ActionSender:
+    """Per-origin connection pools with bounded concurrency per host."""
+
+    def __init__(self):
+        # origin -> (client, last used)
+        self._clients: Dict[str, Tuple[httpx.AsyncClient, float]] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._waiting: Dict[str, int] = {}
+
+    async def __aenter__(self) -> "ActionSender":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    def _client(self, origin: str) -> httpx.AsyncClient:
+        client = self._clients.get(origin, (None, 0.0))[0]
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.WEBHOOK_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.ACTION_HOST_CONCURRENCY,
+                    max_keepalive_connections=settings.ACTION_HOST_CONCURRENCY
+                )
+            )
+        self._clients[origin] = (client, time.monotonic())
+        return client
+
+    async def send(self, delivery: Delivery) -> Outcome:
+        url = delivery.url
+        if not url:
+            return Outcome(ok=False, error=f"No gateway configured for {delivery.channel}")
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return Outcome(ok=False, error=f"Invalid {delivery.channel} URL")
+
+        host = parts.hostname
+        if self._waiting.get(host, 0) >= settings.ACTION_HOST_QUEUE:
+            # Do not pile up behind a slow host; try again shortly
+            return Outcome(ok=False, retry=True, deferred=True, error="Host busy", retry_after=1.0)
+
+        slots = self._slots.setdefault(host, asyncio.Semaphore(settings.ACTION_HOST_CONCURRENCY))
+        self._waiting[host] = self._waiting.get(host, 0) + 1
+        try:
+            await slots.acquire()
+        finally:
+            self._waiting[host] -= 1
+        try:
+            client = self._client(f"{parts.scheme}://{parts.netloc}")
+            response = await client.post(url, json=render(delivery))
+        except httpx.HTTPError as e:
+            return Outcome(ok=False, retry=True, error=f"{type(e).__name__}: {e}")
+        finally:
+            slots.release()
+
+        if response.is_success:
+            return Outcome(ok=True)
+        retry = response.status_code >= 500 or response.status_code in RETRY_STATUSES
+        return Outcome(
+            ok=False,
+            retry=retry,
+            error=f"HTTP {response.status_code}",
+            retry_after=_retry_after(response)
+        )
+
+    async def close_idle(self) -> None:
+        """Close pools of destinations that have not been used for a while."""
+        cutoff = time.monotonic() - POOL_IDLE_SECONDS
+        for origin, (client, last_used) in list(self._clients.items()):
+            if last_used < cutoff:
+                del self._clients[origin]
+                await client.aclose()
+
+    async def close(self) -> None:
+        for client, _ in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
@@ -0,0 +1,153 @@
+"""
+Alert log archival.
+
+`alert_logs` is partitioned by month. Every ALERT_ARCHIVE_INTERVAL seconds
+the archiver makes sure the partitions for this month and the next exist,
+exports resolved and false-positive alerts older than
+ALERT_ARCHIVE_AFTER_DAYS to the archive bucket as gzipped JSON lines and
+deletes them, then drops old monthly partitions left empty. Alerts still
+open, acknowledged or escalated are never archived, so the table only
+holds the working set and recent history.
+
+Each batch is exported before the transaction deleting it commits; if the
+commit fails the rows stay and are exported again, so an alert can appear
+in two exports but is never lost.
+"""
+
+import asyncio
+import gzip
+import json
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import delete, select, text
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.minio_client import upload_archive
+from app.models.alert import AlertLog
+
+logger = structlog.get_logger()
+
+CLOSED_STATUSES = ("resolved", "false_positive")
+EXPORT_PREFIX = "alert_logs"
+
+PARTITION_NAME = re.compile(r"^alert_logs_y(\d{4})m(\d{2})$")
+
+
+def _next_month(year: int, month: int) -> tuple:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def export_lines(alerts: List[AlertLog]) -> bytes:
+    """Gzipped JSON lines, one alert per line."""
+    lines = "\n".join(json.dumps(alert.to_dict()) for alert in alerts) + "\n"
+    return gzip.compress(lines.encode())
+
+
+class AlertArchiver:
+    """Keeps alert_logs partitioned and moves closed alerts to MinIO."""
+
+    async def run(self, stopping: asyncio.Event) -> None:
+        while not stopping.is_set():
+            try:
+                await self.ensure_partitions()
+                archived = await self.archive()
+                dropped = await self.drop_empty_partitions()
+                logger.info("Alert archival finished", archived=archived, dropped_partitions=dropped)
+            except Exception as e:
+                logger.error("Alert archival failed", error=str(e))
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=settings.ALERT_ARCHIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(days=settings.ALERT_ARCHIVE_AFTER_DAYS)
+
+    async def ensure_partitions(self) -> None:
+        """Create this month's and next month's partitions ahead of the inserts."""
+        now = datetime.now(timezone.utc)
+        months = [(now.year, now.month), _next_month(now.year, now.month)]
+        async with AsyncSessionLocal() as session:
+            for year, month in months:
+                try:
+                    await session.execute(
+                        text("SELECT create_alert_logs_partition(:year, :month)"),
+                        {"year": year, "month": month}
+                    )
+                    await session.commit()
+                except Exception as e:
+                    # e.g. rows for that month already landed in the default partition
+                    await session.rollback()
+                    logger.warning("Failed to create alert_logs partition", year=year, month=month, error=str(e))
+
+    async def archive(self) -> int:
+        """Export and delete closed alerts past the cutoff, batch by batch."""
+        cutoff = self.cutoff()
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(AlertLog)
+                    .where(AlertLog.status.in_(CLOSED_STATUSES))
+                    .where(AlertLog.created_at < cutoff)
+                    .order_by(AlertLog.created_at)
+                    .limit(settings.ALERT_ARCHIVE_BATCH_SIZE)
+                    .with_for_update(skip_locked=True)
+                )
+                alerts = list(result.scalars())
+                if not alerts:
+                    return total
+
+                first, last = alerts[0], alerts[-1]
+                object_name = (
+                    f"{EXPORT_PREFIX}/{first.created_at:%Y/%m}/"
+                    f"{first.created_at:%Y%m%dT%H%M%S}-{last.created_at:%Y%m%dT%H%M%S}-{first.alert_id}.jsonl.gz"
+                )
+                await upload_archive(object_name, export_lines(alerts))
+
+                await session.execute(
+                    delete(AlertLog)
+                    .where(AlertLog.alert_id.in_([alert.alert_id for alert in alerts]))
+                    # Lets the planner skip partitions outside the batch
+                    .where(AlertLog.created_at.between(first.created_at, last.created_at))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+
+            total += len(alerts)
+            logger.info("Archived alerts", count=len(alerts), object=object_name)
+            if len(alerts) < settings.ALERT_ARCHIVE_BATCH_SIZE:
+                return total
+
+    async def drop_empty_partitions(self) -> int:
+        """Drop monthly partitions that ended before the cutoff and hold no rows."""
+        cutoff = self.cutoff()
+        dropped = 0
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(text("""
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'alert_logs'
+            """))
+            for (name,) in result.all():
+                match = PARTITION_NAME.match(name)
+                if not match:
+                    continue
+                year, month = _next_month(int(match.group(1)), int(match.group(2)))
+                if datetime(year, month, 1, tzinfo=timezone.utc) > cutoff:
+                    continue
+                # The name matched the pattern above, so it is safe to inline
+                if (await session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))).scalar():
+                    continue
+                await session.execute(text(f"ALTER TABLE alert_logs DETACH PARTITION {name}"))
+                await session.execute(text(f"DROP TABLE {name}"))
+                await session.commit()
+                dropped += 1
+                logger.info("Dropped empty alert_logs partition", partition=name)
+        return dropped
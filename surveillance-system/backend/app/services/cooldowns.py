@@ -0,0 +1,98 @@
+"""
+Distributed alert cooldowns.
+
+A rule's `cooldown_seconds` is enforced with Redis keys that exist for the
+length of the cooldown. Taking a single scope is one `SET NX PX`; a rule
+with several scopes (`conditions.cooldown_scopes`) takes all of its keys
+in one Lua script or none of them. Either way the check and the claim are
+a single atomic step, so concurrent engine replicas cannot both alert.
+
+Scopes:
+    rule     one alert per rule at a time
+    subject  per rule and subject (the default); unknown faces per camera
+    camera   per rule, subject and camera
+"""
+
+from typing import List, Sequence, Tuple
+
+from app.core.redis import get_redis
+from app.services.rules import CompiledRule, SightingEvent
+
+KEY_PREFIX = "alerts:cooldown:"
+DEFAULT_SCOPES = ("subject",)
+
+# (rule, event, token); the token, usually the alert id, identifies the claim
+Claim = Tuple[CompiledRule, SightingEvent, str]
+
+# Claim every key in KEYS for ARGV[2] ms with value ARGV[1], or none of them
+CLAIM_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        return 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+end
+return 1
+"""
+
+# Delete the keys in KEYS still holding ARGV[1]
+RELEASE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+    end
+end
+return 1
+"""
+
+
+def cooldown_keys(rule: CompiledRule, event: SightingEvent) -> List[str]:
+    """Keys guarding this rule for this event, one per configured scope."""
+    subject = event.subject_id or f"unknown:{event.camera_id}"
+    keys = []
+    for scope in rule.conditions.get("cooldown_scopes") or DEFAULT_SCOPES:
+        if scope == "rule":
+            keys.append(f"{KEY_PREFIX}{rule.rule_id}")
+        elif scope == "subject":
+            keys.append(f"{KEY_PREFIX}{rule.rule_id}:{subject}")
+        elif scope == "camera":
+            keys.append(f"{KEY_PREFIX}{rule.rule_id}:{subject}:{event.camera_id}")
+    return keys
+
+
+async def claim_cooldowns(claims: Sequence[Claim]) -> List[bool]:
+    """
+    Claim cooldowns for several alerts in one round trip, in order, so a
+    batch cannot alert twice for the same scope either. Returns whether
+    each alert may fire; rules without a cooldown always may.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    checked: List[bool] = []
+    for rule, event, token in claims:
+        keys = cooldown_keys(rule, event)
+        if not rule.cooldown_seconds or not keys:
+            checked.append(False)
+            continue
+        ttl = rule.cooldown_seconds * 1000
+        if len(keys) == 1:
+            pipe.set(keys[0], token, nx=True, px=ttl)
+        else:
+            pipe.eval(CLAIM_SCRIPT, len(keys), *keys, token, ttl)
+        checked.append(True)
+
+    if not any(checked):
+        return [True] * len(checked)
+    results = iter(await pipe.execute())
+    return [bool(next(results)) if check else True for check in checked]
+
+
+async def release_cooldowns(claims: Sequence[Claim]) -> None:
+    """Give back cooldowns claimed for alerts that were not recorded."""
+    pipe = get_redis().pipeline(transaction=False)
+    for rule, event, token in claims:
+        keys = cooldown_keys(rule, event)
+        if rule.cooldown_seconds and keys:
+            pipe.eval(RELEASE_SCRIPT, len(keys), *keys, token)
+    await pipe.execute()
@@ -0,0 +1,215 @@
+"""
+Face detection and embedding on top of the inference engine.
+Pre- and post-processing for the YOLOv8-face and ArcFace models.
+"""
+
+import io
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image as PILImage
+
+from app.core.config import settings
+from app.core.inference import InferenceEngine
+
+
+@dataclass
+class FaceBox:
+    """Detected face in source image pixel coordinates."""
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+    confidence: float
+
+    @property
+    def width(self) -> float:
+        return self.x2 - self.x1
+
+    @property
+    def height(self) -> float:
+        return self.y2 - self.y1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Bounding box in the {"x", "y", "w", "h"} form stored on images."""
+        return {
+            "x": round(self.x1, 1),
+            "y": round(self.y1, 1),
+            "w": round(self.width, 1),
+            "h": round(self.height, 1),
+            "confidence": round(self.confidence, 4)
+        }
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """Decode encoded image bytes into an RGB uint8 array."""
+    with PILImage.open(io.BytesIO(data)) as img:
+        return np.asarray(img.convert("RGB"))
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    """Encode an RGB uint8 array as JPEG."""
+    buffer = io.BytesIO()
+    PILImage.fromarray(image).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def letterbox_into(image: np.ndarray, out: np.ndarray) -> Tuple[float, float, float]:
+    """
+    Resize `image` keeping aspect ratio and pad it into `out` (3, S, S).
+    Writes float32 RGB scaled to 0..1. Returns (scale, pad_x, pad_y).
+    """
+    size = out.shape[-1]
+    height, width = image.shape[:2]
+    scale = min(size / width, size / height)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+
+    resized = np.asarray(
+        PILImage.fromarray(image).resize((new_w, new_h), PILImage.BILINEAR),
+        dtype=np.float32
+    )
+
+    out.fill(114.0 / 255.0)
+    out[:, pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized.transpose(2, 0, 1) / 255.0
+    return scale, float(pad_x), float(pad_y)
+
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> List[int]:
+    """Greedy NMS over (N, 4) xyxy boxes. Returns kept indices by score."""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep: List[int] = []
+
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+
+        order = rest[iou < iou_threshold]
+
+    return keep
+
+
+def decode_detections(
+    output: np.ndarray,
+    letterbox: Tuple[float, float, float],
+    image_shape: Tuple[int, ...],
+    threshold: float,
+    iou_threshold: float
+) -> List[FaceBox]:
+    """
+    Decode one image of YOLOv8-face output, shape (4 + 1 + K, anchors)
+    with rows cx, cy, w, h, score[, landmarks].
+    """
+    predictions = output.T
+    scores = predictions[:, 4]
+    mask = scores >= threshold
+    if not mask.any():
+        return []
+
+    predictions, scores = predictions[mask], scores[mask]
+    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    scale, pad_x, pad_y = letterbox
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / scale
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / scale
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, image_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, image_shape[0])
+
+    return [
+        FaceBox(*boxes[i].tolist(), confidence=float(scores[i]))
+        for i in non_max_suppression(boxes, scores, iou_threshold)
+    ]
+
+
+def crop_face(image: np.ndarray, box: FaceBox, margin: float = 0.2) -> np.ndarray:
+    """Crop a square face region with margin, resized to the recognition input."""
+    size = settings.RECOGNITION_INPUT_SIZE
+    side = max(box.width, box.height) * (1 + margin)
+    cx, cy = (box.x1 + box.x2) / 2, (box.y1 + box.y2) / 2
+    height, width = image.shape[:2]
+
+    x1, y1 = int(max(0, cx - side / 2)), int(max(0, cy - side / 2))
+    x2, y2 = int(min(width, cx + side / 2)), int(min(height, cy + side / 2))
+    crop = image[y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)]
+
+    return np.asarray(PILImage.fromarray(crop).resize((size, size), PILImage.BILINEAR))
+
+
+def face_into(face: np.ndarray, out: np.ndarray) -> None:
+    """Write an RGB face crop into `out` (3, 112, 112) with ArcFace normalization."""
+    size = out.shape[-1]
+    if face.shape[0] != size or face.shape[1] != size:
+        face = np.asarray(PILImage.fromarray(face).resize((size, size), PILImage.BILINEAR))
+    np.subtract(face.transpose(2, 0, 1), 127.5, out=out, dtype=np.float32)
+    out *= 1.0 / 127.5
+
+
+def l2_normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalize embeddings row-wise."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class FaceAnalyzer:
+    """Runs face detection and embedding through a shared inference engine."""
+
+    def __init__(self, engine: InferenceEngine):
+        self.engine = engine
+
+    async def detect(
+        self,
+        image: np.ndarray,
+        threshold: Optional[float] = None
+    ) -> List[FaceBox]:
+        """Detect faces in one RGB image."""
+        slot = await self.engine.acquire("detection")
+        try:
+            letterbox = letterbox_into(image, slot.array[0])
+            outputs = await self.engine.infer(slot, 1)
+        finally:
+            self.engine.release(slot)
+
+        return decode_detections(
+            outputs[0][0],
+            letterbox,
+            image.shape,
+            settings.DETECTION_THRESHOLD if threshold is None else threshold,
+            settings.DETECTION_NMS_THRESHOLD
+        )
+
+    async def embed(self, faces: Sequence[np.ndarray]) -> np.ndarray:
+        """Embed RGB face crops. Returns (N, EMBEDDING_DIMENSION) unit vectors."""
+        if not faces:
+            return np.empty((0, settings.EMBEDDING_DIMENSION), dtype=np.float32)
+
+        max_batch = self.engine.specs["recognition"].max_batch
+        embeddings = []
+
+        for start in range(0, len(faces), max_batch):
+            chunk = faces[start:start + max_batch]
+            slot = await self.engine.acquire("recognition")
+            try:
+                for i, face in enumerate(chunk):
+                    face_into(face, slot.array[i])
+                outputs = await self.engine.infer(slot, len(chunk))
+            finally:
+                self.engine.release(slot)
+            embeddings.append(outputs[0])
+
+        return l2_normalize(np.concatenate(embeddings).astype(np.float32))
+
+
+def embedding_literal(embedding: Sequence[float]) -> str:
+    """Format an embedding as a pgvector text literal."""
+    return "[" + ",".join(f"{value:.6f}" for value in embedding) + "]"
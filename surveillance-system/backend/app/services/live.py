@@ -0,0 +1,295 @@
+"""
+Live view relay: LL-HLS playlists and media shared by the relay worker and
+the API.
+
+Viewers fetch a camera's playlist from the API, which records the camera
+as watched in VIEWERS_KEY. The relay worker (app.workers.live) pulls every
+watched camera once, under a per-camera lease, and has FFmpeg remux it
+(`-c copy`, no transcoding) into fragmented MP4. Each fragment becomes an
+LL-HLS part; parts are grouped into segments that start on a keyframe.
+Parts are pushed to one Redis list per segment, so a segment is served as
+the concatenation of its parts and nothing is stored twice. The last
+LIVE_SEGMENTS segments are listed in the playlist; older ones are deleted,
+and every key carries a TTL in case the worker dies.
+
+Media URIs contain the relay's generation (its start time), so a camera
+torn down and pulled again never reuses a URI and media can be cached as
+immutable. A restarted upstream within one generation starts a new run:
+a discontinuity with its own init section.
+
+Once nobody has fetched a camera's playlist for LIVE_IDLE_GRACE seconds,
+the worker stops pulling it.
+"""
+
+import math
+import struct
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Camera -> time (s) its playlist was last fetched
+VIEWERS_KEY = "live:viewers"
+LEASE_PREFIX = "live:lease:"
+
+# Segments kept past the playlist window for players still fetching them
+RETAINED_SEGMENTS = 2
+# Complete segments whose parts are still listed
+PART_SEGMENTS = 2
+
+# trun/tfhd sample flag marking a sample that is not a keyframe
+NON_SYNC_SAMPLE = 0x10000
+
+
+def state_key(camera_id: str) -> str:
+    """Hash with the camera's generation, playlist and live edge."""
+    return f"live:{camera_id}"
+
+
+def segment_key(camera_id: str, generation: str, msn: int) -> str:
+    """List of the parts of one segment."""
+    return f"live:{camera_id}:{generation}:{msn}"
+
+
+def init_key(camera_id: str, generation: str, run: int) -> str:
+    return f"live:{camera_id}:{generation}:init{run}"
+
+
+def media_ttl(target_duration: float) -> int:
+    """How long media may outlive the worker that wrote it."""
+    return math.ceil(target_duration * (settings.LIVE_SEGMENTS + RETAINED_SEGMENTS)) + 10
+
+
+# ISO BMFF (fragmented MP4) boxes
+
+def boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload offset, end offset) of the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield kind, start + header, start + size
+        start += size
+
+
+def find_box(data: bytes, path: List[bytes], start: int = 0, end: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """Payload (offset, end) of the first box along `path`, e.g. [b"moov", b"mvex", b"trex"]."""
+    for kind, payload, box_end in boxes(data, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            return find_box(data, path[1:], payload, box_end)
+    return None
+
+
+@dataclass
+class Track:
+    """What fragments need from the init section."""
+    timescale: int
+    default_duration: int = 0
+    default_flags: int = 0
+
+
+def parse_init(data: bytes) -> Track:
+    mdhd = find_box(data, [b"moov", b"trak", b"mdia", b"mdhd"])
+    if mdhd is None:
+        raise ValueError("No mdhd box in init section")
+    offset = mdhd[0]
+    version = data[offset]
+    timescale = struct.unpack_from(">I", data, offset + (20 if version == 1 else 12))[0]
+    track = Track(timescale=timescale)
+    trex = find_box(data, [b"moov", b"mvex", b"trex"])
+    if trex is not None:
+        # version/flags, track_ID, sample description index, duration, size, flags
+        _, _, _, track.default_duration, _, track.default_flags = struct.unpack_from(">6I", data, trex[0])
+    return track
+
+
+def parse_fragment(data: bytes, track: Track) -> Tuple[float, bool]:
+    """Duration in seconds of a moof+mdat fragment, and whether it starts on a keyframe."""
+    traf = find_box(data, [b"moof", b"traf"])
+    if traf is None:
+        raise ValueError("No traf box in fragment")
+    default_duration, default_flags = track.default_duration, track.default_flags
+
+    tfhd = find_box(data, [b"tfhd"], *traf)
+    if tfhd is not None:
+        offset = tfhd[0]
+        flags = struct.unpack_from(">I", data, offset)[0] & 0xFFFFFF
+        offset += 8
+        if flags & 0x1:
+            offset += 8
+        if flags & 0x2:
+            offset += 4
+        if flags & 0x8:
+            default_duration = struct.unpack_from(">I", data, offset)[0]
+            offset += 4
+        if flags & 0x10:
+            offset += 4
+        if flags & 0x20:
+            default_flags = struct.unpack_from(">I", data, offset)[0]
+
+    duration = 0
+    first_flags = None
+    for kind, payload, _ in boxes(data, *traf):
+        if kind != b"trun":
+            continue
+        flags, count = struct.unpack_from(">II", data, payload)
+        flags &= 0xFFFFFF
+        offset = payload + 8
+        if flags & 0x1:
+            offset += 4
+        if flags & 0x4:
+            if first_flags is None:
+                first_flags = struct.unpack_from(">I", data, offset)[0]
+            offset += 4
+        for index in range(count):
+            sample_duration = default_duration
+            if flags & 0x100:
+                sample_duration = struct.unpack_from(">I", data, offset)[0]
+                offset += 4
+            if flags & 0x200:
+                offset += 4
+            if flags & 0x400:
+                if index == 0 and first_flags is None:
+                    first_flags = struct.unpack_from(">I", data, offset)[0]
+                offset += 4
+            if flags & 0x800:
+                offset += 4
+            duration += sample_duration
+    if first_flags is None:
+        first_flags = default_flags
+    return duration / track.timescale, not first_flags & NON_SYNC_SAMPLE
+
+
+# Playlist
+
+@dataclass
+class Segment:
+    msn: int
+    run: int
+    # Discontinuities before this segment since the relay started
+    discontinuity: int
+    parts: List[Tuple[float, bool]] = field(default_factory=list)
+    complete: bool = False
+
+    @property
+    def duration(self) -> float:
+        return sum(duration for duration, _ in self.parts)
+
+
+class LivePlaylist:
+    """Groups a camera's parts into segments and renders its LL-HLS playlist."""
+
+    def __init__(self, generation: str):
+        self.generation = generation
+        self.run = 0
+        self.segments: Deque[Segment] = deque()
+        self.discontinuities = 0
+        self.longest_part = settings.LIVE_PART_SECONDS
+
+    def new_run(self) -> None:
+        """The upstream restarted: later parts follow a new init section."""
+        self.run += 1
+
+    @property
+    def current(self) -> Optional[Segment]:
+        if self.segments and not self.segments[-1].complete:
+            return self.segments[-1]
+        return None
+
+    @property
+    def listed(self) -> List[Segment]:
+        complete = [segment for segment in self.segments if segment.complete]
+        listed = complete[-settings.LIVE_SEGMENTS:]
+        return listed + ([self.current] if self.current else [])
+
+    def add(self, duration: float, independent: bool) -> Tuple[Optional[Tuple[int, int]], List[int]]:
+        """
+        Place a part; returns its (msn, part index), or None if it cannot
+        start a segment, and the segments that fell out of the ring.
+        """
+        current = self.current
+        if current and independent and (
+            current.duration >= settings.LIVE_SEGMENT_SECONDS or current.run != self.run
+        ):
+            current.complete = True
+            current = None
+        if current is None:
+            if not independent:
+                return None, []
+            previous = self.segments[-1] if self.segments else None
+            if previous and previous.run != self.run:
+                self.discontinuities += 1
+            current = Segment(
+                msn=previous.msn + 1 if previous else 0,
+                run=self.run,
+                discontinuity=self.discontinuities
+            )
+            self.segments.append(current)
+        current.parts.append((duration, independent))
+        self.longest_part = max(self.longest_part, duration)
+
+        dropped = []
+        while len(self.segments) > settings.LIVE_SEGMENTS + RETAINED_SEGMENTS + 1:
+            dropped.append(self.segments.popleft().msn)
+        return (current.msn, len(current.parts) - 1), dropped
+
+    @property
+    def target_duration(self) -> int:
+        return max([math.ceil(settings.LIVE_SEGMENT_SECONDS)] + [
+            math.ceil(segment.duration) for segment in self.segments if segment.complete
+        ])
+
+    def render(self) -> Optional[str]:
+        """The media playlist, once there is a complete segment to list."""
+        listed = self.listed
+        if not listed or not listed[0].complete:
+            return None
+        part_target = self.longest_part
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:9",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            f"#EXT-X-PART-INF:PART-TARGET={part_target:.3f}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={part_target * 3:.3f}",
+            f"#EXT-X-MEDIA-SEQUENCE:{listed[0].msn}",
+            f"#EXT-X-DISCONTINUITY-SEQUENCE:{listed[0].discontinuity}",
+        ]
+        with_parts = {segment.msn for segment in listed[-(PART_SEGMENTS + 1):]}
+        run = None
+        for segment in listed:
+            if segment.run != run:
+                if run is not None:
+                    lines.append("#EXT-X-DISCONTINUITY")
+                lines.append(f'#EXT-X-MAP:URI="{self.generation}/init{segment.run}.mp4"')
+                run = segment.run
+            if segment.msn in with_parts:
+                for index, (duration, independent) in enumerate(segment.parts):
+                    lines.append(
+                        f'#EXT-X-PART:DURATION={duration:.3f},URI="{self.generation}/{segment.msn}.{index}.m4s"'
+                        + (",INDEPENDENT=YES" if independent else "")
+                    )
+            if segment.complete:
+                lines.append(f"#EXTINF:{segment.duration:.3f},")
+                lines.append(f"{self.generation}/{segment.msn}.m4s")
+        return "\n".join(lines) + "\n"
+
+    def edge(self) -> Dict[str, str]:
+        """State fields the API waits on for blocking playlist reloads."""
+        current = self.current
+        last = self.segments[-1]
+        return {
+            "generation": self.generation,
+            "msn": str(current.msn if current else last.msn + 1),
+            "parts": str(len(current.parts) if current else 0),
+            "part_target": f"{self.longest_part:.3f}",
+        }
@@ -0,0 +1,59 @@
+"""
+Socket.IO realtime gateway: rooms and frames shared by the gateway and
+the relay.
+
+Every API worker runs the gateway (app.api.v1.gateway), a Socket.IO server
+on a Redis-backed client manager. Sockets join the room of the feed they
+follow: the alerts feed, the aggregate or one camera's detections feed,
+or the system room. The relay (app.workers.realtime) is the only process
+reading the feeds; it emits each entry once to its room and the manager
+hands it to whichever workers hold sockets in that room.
+
+Clients asking for `binary` get the stored msgpack entry (`{"id", "m"}`)
+as a binary frame instead of JSON, so nothing is decoded or re-encoded on
+the way.
+
+Room membership is counted in ROOMS_KEY across workers, so the relay only
+reads feeds someone is following.
+"""
+
+from typing import Dict, Optional
+
+from app.core.redis import ALERTS_FEED, MESSAGE_FIELD, feed_message
+
+# Socket.IO namespaces, matching the URLs the frontend connects to
+PREFIX = "/api/v1/ws"
+ALERTS_NAMESPACE = f"{PREFIX}/alerts"
+DETECTIONS_NAMESPACE = f"{PREFIX}/detections"
+SYSTEM_NAMESPACE = f"{PREFIX}/system"
+
+SYSTEM_ROOM = "system"
+BINARY_SUFFIX = ":binary"
+
+# Room -> sockets in it, across workers
+ROOMS_KEY = "realtime:rooms"
+
+EVENT = "message"
+
+
+def feed_room(feed: str, binary: bool = False) -> str:
+    return f"{feed}{BINARY_SUFFIX}" if binary else feed
+
+
+def room_feed(room: str) -> Optional[str]:
+    """The feed a room follows, if it follows one."""
+    if room == SYSTEM_ROOM:
+        return None
+    return room[:-len(BINARY_SUFFIX)] if room.endswith(BINARY_SUFFIX) else room
+
+
+def feed_namespace(feed: str) -> str:
+    return ALERTS_NAMESPACE if feed == ALERTS_FEED else DETECTIONS_NAMESPACE
+
+
+def feed_frame(entry_id: str, fields: Dict[bytes, bytes], binary: bool = False) -> Optional[dict]:
+    """What a feed entry is emitted as: JSON, or the raw stored message."""
+    if binary:
+        raw = fields.get(MESSAGE_FIELD)
+        return {"id": entry_id, "m": raw} if raw is not None else None
+    return feed_message(entry_id, fields)
@@ -0,0 +1,239 @@
+"""
+Compiled alert rules.
+
+Active rules are compiled once into `CompiledRule`s whose conditions are
+closures over pre-parsed values, and stored in a `RuleIndex` keyed by the
+most selective condition of each rule: subject id, then camera id, then
+subject type. A sighting only looks at the rules filed under its own
+subject, camera and subject type plus the unconditioned ones, so the cost
+of an evaluation depends on the matching rules rather than on how many
+rules exist. The API announces rule changes on `RULES_CHANNEL` and
+engines recompile just that rule.
+
+Stateful types are compiled the same way, with their window parameters in
+`CompiledRule.window`; whether they fire is decided by the window engine
+(app.services.windows) once their predicates match.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import structlog
+
+from app.core.redis import publish
+from app.models.alert import AlertRule
+
+logger = structlog.get_logger()
+
+RULES_CHANNEL = "alerts:rules"
+
+# Rule types decided by the current sighting alone
+STATELESS_TYPES = {"blacklist", "whitelist", "geofence", "custom"}
+
+# Rule types that depend on earlier sightings too
+STATEFUL_TYPES = {"loitering", "tailgating", "crowd", "time_restriction"}
+
+# Window parameters of stateful types and their defaults, in seconds or people
+WINDOW_DEFAULTS = {
+    "loitering": {"dwell_seconds": 300, "gap_seconds": 60},
+    "time_restriction": {"dwell_seconds": 0, "gap_seconds": 60},
+    "crowd": {"window_seconds": 60, "max_occupancy": 10},
+    "tailgating": {"window_seconds": 5},
+}
+
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+@dataclass
+class SightingEvent:
+    """What rules are evaluated against: one sighting and its subject."""
+    sighting_id: Optional[str]
+    camera_id: str
+    subject_id: Optional[str]
+    subject_type: Optional[str]
+    recognition_confidence: Optional[float]
+    detection_confidence: float
+    detected_at: datetime
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+Predicate = Callable[[SightingEvent], bool]
+
+
+@dataclass
+class CompiledRule:
+    """An active rule reduced to index keys and predicate closures."""
+    rule_id: str
+    name: str
+    rule_type: str
+    priority: int
+    cooldown_seconds: int
+    conditions: Dict[str, Any]
+    actions: Dict[str, Any]
+    predicates: List[Predicate]
+    subject_ids: Set[str] = field(default_factory=set)
+    cameras: Set[str] = field(default_factory=set)
+    subject_types: Set[str] = field(default_factory=set)
+    window: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def stateful(self) -> bool:
+        return self.rule_type in STATEFUL_TYPES
+
+    def matches(self, event: SightingEvent) -> bool:
+        return all(predicate(event) for predicate in self.predicates)
+
+
+def _parse_time(value: str) -> time:
+    hour, minute = value.split(":")[:2]
+    return time(int(hour), int(minute))
+
+
+def _time_predicate(time_range: Dict[str, str]) -> Predicate:
+    start = _parse_time(time_range.get("start", "00:00"))
+    end = _parse_time(time_range.get("end", "23:59"))
+    if start <= end:
+        return lambda event: start <= event.detected_at.time() <= end
+    # Windows such as 22:00-06:00 wrap around midnight
+    return lambda event: event.detected_at.time() >= start or event.detected_at.time() <= end
+
+
+def filter_predicates(conditions: Dict[str, Any]) -> List[Predicate]:
+    """Closures for the camera, confidence and schedule conditions."""
+    predicates: List[Predicate] = []
+
+    cameras = {str(camera_id) for camera_id in conditions.get("cameras") or []}
+    if cameras:
+        predicates.append(lambda event: event.camera_id in cameras)
+
+    if conditions.get("min_confidence") is not None:
+        threshold = float(conditions["min_confidence"])
+        predicates.append(
+            lambda event: event.recognition_confidence is not None
+            and event.recognition_confidence >= threshold
+        )
+
+    if conditions.get("time_range"):
+        predicates.append(_time_predicate(conditions["time_range"]))
+
+    days = {DAY_NAMES.index(day[:3].lower()) for day in conditions.get("days") or [] if day[:3].lower() in DAY_NAMES}
+    if days:
+        predicates.append(lambda event: event.detected_at.weekday() in days)
+
+    return predicates
+
+
+def compile_rule(rule: AlertRule) -> Optional[CompiledRule]:
+    """Compile a rule, or None if it is inactive or of an unknown type."""
+    if not rule.is_active or rule.rule_type not in STATELESS_TYPES | STATEFUL_TYPES:
+        return None
+
+    conditions = rule.conditions or {}
+    subject_ids = {str(subject_id) for subject_id in conditions.get("subject_ids") or []}
+    subject_types = set(conditions.get("subject_types") or [])
+    exclude_types = set(conditions.get("exclude_types") or [])
+    predicates = filter_predicates(conditions)
+    window = {
+        name: float(conditions[name]) if conditions.get(name) is not None else default
+        for name, default in WINDOW_DEFAULTS.get(rule.rule_type, {}).items()
+    }
+
+    if rule.rule_type in ("crowd", "tailgating"):
+        # Everyone at the camera counts; for tailgating the listed subjects
+        # are the ones allowed through, which the window engine tells apart
+        window.update({"subject_ids": subject_ids, "subject_types": subject_types})
+        subject_ids, subject_types = set(), set()
+    else:
+        # Listed subjects and types are filters an event must match, as in
+        # AlertRule.should_trigger, whitelist rules included
+        if rule.rule_type == "blacklist":
+            predicates.append(lambda event: event.subject_id is not None)
+        if subject_ids:
+            predicates.append(lambda event: event.subject_id in subject_ids)
+        if subject_types:
+            predicates.append(lambda event: event.subject_type in subject_types)
+
+    if exclude_types:
+        predicates.append(lambda event: event.subject_type not in exclude_types)
+
+    return CompiledRule(
+        rule_id=str(rule.rule_id),
+        name=rule.name,
+        rule_type=rule.rule_type,
+        priority=rule.priority or 5,
+        cooldown_seconds=rule.cooldown_seconds or 0,
+        conditions=conditions,
+        actions=rule.actions or {},
+        predicates=predicates,
+        subject_ids=subject_ids,
+        cameras={str(camera_id) for camera_id in conditions.get("cameras") or []},
+        subject_types=subject_types,
+        window=window
+    )
+
+
+class RuleIndex:
+    """Compiled rules filed under their most selective condition."""
+
+    def __init__(self):
+        self.rules: Dict[str, CompiledRule] = {}
+        self.by_subject: Dict[str, Dict[str, CompiledRule]] = {}
+        self.by_camera: Dict[str, Dict[str, CompiledRule]] = {}
+        self.by_type: Dict[str, Dict[str, CompiledRule]] = {}
+        self.unindexed: Dict[str, CompiledRule] = {}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _buckets(self, rule: CompiledRule) -> List[Dict[str, CompiledRule]]:
+        if rule.subject_ids:
+            return [self.by_subject.setdefault(key, {}) for key in rule.subject_ids]
+        if rule.cameras:
+            return [self.by_camera.setdefault(key, {}) for key in rule.cameras]
+        if rule.subject_types:
+            return [self.by_type.setdefault(key, {}) for key in rule.subject_types]
+        return [self.unindexed]
+
+    def add(self, rule: CompiledRule) -> None:
+        self.remove(rule.rule_id)
+        self.rules[rule.rule_id] = rule
+        for bucket in self._buckets(rule):
+            bucket[rule.rule_id] = rule
+
+    def remove(self, rule_id: str) -> None:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return
+        for bucket in self._buckets(rule):
+            bucket.pop(rule_id, None)
+
+    def replace(self, rules: Iterable[CompiledRule]) -> None:
+        """Swap in a freshly loaded rule set."""
+        for rule_id in list(self.rules):
+            self.remove(rule_id)
+        for rule in rules:
+            self.add(rule)
+
+    def candidates(self, event: SightingEvent) -> List[CompiledRule]:
+        """Rules that could match the event; each still has to check its predicates."""
+        found: Dict[str, CompiledRule] = dict(self.unindexed)
+        if event.subject_id:
+            found.update(self.by_subject.get(event.subject_id, {}))
+        found.update(self.by_camera.get(event.camera_id, {}))
+        if event.subject_type:
+            found.update(self.by_type.get(event.subject_type, {}))
+        return list(found.values())
+
+    def match(self, event: SightingEvent) -> List[CompiledRule]:
+        """Rules triggered by the event, highest priority first."""
+        matched = [rule for rule in self.candidates(event) if rule.matches(event)]
+        return sorted(matched, key=lambda rule: -rule.priority)
+
+
+async def notify_rule_change(rule_id: str, action: str) -> None:
+    """Tell alert engines to recompile a rule."""
+    try:
+        await publish(RULES_CHANNEL, {"rule_id": rule_id, "action": action})
+    except Exception as e:
+        logger.warning("Failed to announce rule change", rule_id=rule_id, error=str(e))
@@ -0,0 +1,245 @@
+"""
+Load-adaptive per-camera frame sampling.
+
+The detection worker reports how many faces each camera's frames yield.
+`SamplingController` turns that yield, together with the backlog waiting
+in the pipeline streams, into a sample rate per camera and publishes it.
+Ingestion workers follow the published rates live through `SampleRates`.
+"""
+
+import asyncio
+import os
+import socket
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import select
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.codec import CodecError, decode
+from app.core.redis import get_redis, get_redis_binary, publish_message
+from app.models.camera import Camera
+
+logger = structlog.get_logger()
+
+RATES_KEY = "sampling:rates"
+FRAMES_KEY = "sampling:frames"
+FACES_KEY = "sampling:faces"
+LEADER_KEY = "sampling:leader"
+UPDATES_CHANNEL = "sampling:updates"
+
+# Extend the leadership of ARGV[1]; returns 0 if another replica holds it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def rate_bounds(stream_config: Optional[Dict[str, Any]]) -> Tuple[float, float]:
+    """(min, max) sample rate for a camera, never above its native fps."""
+    config = stream_config or {}
+    fps = float(config.get("fps") or 15)
+    max_rate = min(float(config.get("max_sample_rate") or fps), fps)
+    min_rate = min(float(config.get("min_sample_rate") or settings.SAMPLING_MIN_RATE), max_rate)
+    return min_rate, max_rate
+
+
+def clamp_rate(rate: float, bounds: Tuple[float, float]) -> float:
+    return max(bounds[0], min(bounds[1], rate))
+
+
+def default_rate(stream_config: Optional[Dict[str, Any]]) -> float:
+    """Rate used before the controller has published one."""
+    return clamp_rate(float(settings.STREAM_FRAME_SAMPLE_RATE), rate_bounds(stream_config))
+
+
+def target_rate(face_yield: float, pressure: float, bounds: Tuple[float, float]) -> float:
+    """
+    Scale between min and max by how busy the camera is, then throttle
+    by global pipeline pressure (1.0 = no backlog). Bounds always win.
+    """
+    min_rate, max_rate = bounds
+    activity = min(1.0, face_yield / settings.SAMPLING_TARGET_YIELD)
+    return clamp_rate((min_rate + (max_rate - min_rate) * activity) * pressure, bounds)
+
+
+async def record_detection_yield(camera_id: str, faces: int) -> None:
+    """Count one sampled frame and the faces found in it."""
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hincrby(FRAMES_KEY, camera_id, 1)
+    pipe.hincrby(FACES_KEY, camera_id, faces)
+    await pipe.execute()
+
+
+async def pipeline_backlog() -> int:
+    """Entries not yet processed by consumer groups of the frame and face streams."""
+    redis = get_redis()
+    backlog = 0
+    for stream in (settings.STREAM_FRAMES, settings.STREAM_FACES):
+        try:
+            groups = await redis.xinfo_groups(stream)
+        except Exception:
+            continue
+        for group in groups:
+            backlog += int(group.get("lag") or 0) + int(group.get("pending") or 0)
+    return backlog
+
+
+class SamplingController:
+    """Periodically recomputes per-camera sample rates."""
+
+    def __init__(self):
+        self.instance_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.yields: Dict[str, float] = {}
+        self.rates: Dict[str, float] = {}
+        self.leading = False
+
+    async def load_rates(self) -> None:
+        """Resume from the rates currently in effect."""
+        stored = await get_redis().hgetall(RATES_KEY)
+        self.rates = {camera_id: float(rate) for camera_id, rate in stored.items()}
+
+    async def is_leader(self) -> bool:
+        """Only one controller replica publishes rates at a time."""
+        redis = get_redis()
+        ttl = settings.SAMPLING_INTERVAL * 3000
+        if await redis.set(LEADER_KEY, self.instance_id, nx=True, px=ttl):
+            return True
+        return bool(await redis.eval(RENEW_SCRIPT, 1, LEADER_KEY, self.instance_id, ttl))
+
+    async def _active_cameras(self) -> Dict[str, Dict[str, Any]]:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Camera.camera_id, Camera.stream_config)
+                .where(Camera.is_active == True)
+            )
+            return {str(row.camera_id): row.stream_config for row in result}
+
+    async def _collect_yield(self) -> Dict[str, Tuple[int, int]]:
+        """Read and reset the (frames, faces) counters atomically."""
+        pipe = get_redis().pipeline(transaction=True)
+        pipe.hgetall(FRAMES_KEY)
+        pipe.hgetall(FACES_KEY)
+        pipe.delete(FRAMES_KEY, FACES_KEY)
+        frames, faces, _ = await pipe.execute()
+        return {
+            camera_id: (int(count), int(faces.get(camera_id, 0)))
+            for camera_id, count in frames.items()
+        }
+
+    async def step(self) -> Dict[str, float]:
+        """Run one control iteration. Returns the rates that changed."""
+        cameras = await self._active_cameras()
+        counts = await self._collect_yield()
+        backlog = await pipeline_backlog()
+        pressure = min(1.0, settings.SAMPLING_LAG_TARGET / max(backlog, 1))
+
+        alpha = settings.SAMPLING_YIELD_SMOOTHING
+        max_step = settings.SAMPLING_MAX_STEP
+        changed: Dict[str, float] = {}
+
+        for camera_id, stream_config in cameras.items():
+            frames, faces = counts.get(camera_id, (0, 0))
+            if frames:
+                observed = faces / frames
+                previous = self.yields.get(camera_id, observed)
+                self.yields[camera_id] = previous + alpha * (observed - previous)
+
+            bounds = rate_bounds(stream_config)
+            current = self.rates.get(camera_id)
+            if current is None or camera_id not in self.yields:
+                new_rate = clamp_rate(current or default_rate(stream_config), bounds)
+            else:
+                target = target_rate(self.yields[camera_id], pressure, bounds)
+                # Limit the change per step so rates do not oscillate with the backlog
+                new_rate = clamp_rate(max(current / max_step, min(current * max_step, target)), bounds)
+
+            if current is None or abs(new_rate - current) > 0.05 * current:
+                changed[camera_id] = round(new_rate, 3)
+                self.rates[camera_id] = round(new_rate, 3)
+
+        removed = [camera_id for camera_id in self.rates if camera_id not in cameras]
+        for camera_id in removed:
+            self.rates.pop(camera_id)
+            self.yields.pop(camera_id, None)
+
+        redis = get_redis()
+        if removed:
+            await redis.hdel(RATES_KEY, *removed)
+        if changed:
+            await redis.hset(RATES_KEY, mapping=changed)
+        if changed or removed:
+            await publish_message(UPDATES_CHANNEL, "sampling_rates", {"rates": changed, "removed": removed})
+
+        logger.debug(
+            "Sampling rates updated",
+            cameras=len(cameras),
+            changed=len(changed),
+            backlog=backlog,
+            pressure=round(pressure, 3)
+        )
+        return changed
+
+    async def run(self, stopping: asyncio.Event) -> None:
+        """Control loop; iterations are skipped while another replica leads."""
+        while not stopping.is_set():
+            try:
+                leading = await self.is_leader()
+                if leading and not self.leading:
+                    # Another replica may have changed the rates while this one stood by
+                    await self.load_rates()
+                    self.yields.clear()
+                    logger.info("Sampling controller took over", instance_id=self.instance_id)
+                self.leading = leading
+                if leading:
+                    await self.step()
+            except Exception as e:
+                logger.error("Sampling controller step failed", error=str(e))
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=settings.SAMPLING_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+class SampleRates:
+    """Live view of published sample rates for ingestion workers."""
+
+    def __init__(self):
+        self.rates: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._pubsub = get_redis_binary().pubsub()
+        await self._pubsub.subscribe(UPDATES_CHANNEL)
+        # Load after subscribing so no update can fall in between
+        stored = await get_redis().hgetall(RATES_KEY)
+        self.rates = {camera_id: float(rate) for camera_id, rate in stored.items()}
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+            await self._pubsub.unsubscribe(UPDATES_CHANNEL)
+
+    def get(self, camera_id: str, stream_config: Optional[Dict[str, Any]]) -> float:
+        """Current rate for a camera, clamped to its configured bounds."""
+        rate = self.rates.get(camera_id)
+        if rate is None:
+            return default_rate(stream_config)
+        return clamp_rate(rate, rate_bounds(stream_config))
+
+    async def _listen(self) -> None:
+        async for message in self._pubsub.listen():
+            if message["type"] != "message":
+                continue
+            try:
+                _, update = decode(message["data"])
+            except CodecError:
+                continue
+            self.rates.update({k: float(v) for k, v in update.get("rates", {}).items()})
+            for camera_id in update.get("removed", []):
+                self.rates.pop(camera_id, None)
@@ -0,0 +1,229 @@
+"""
+Camera-to-worker scheduling for ingestion replicas.
+
+Every ingestion worker heartbeats into a Redis sorted set and computes the
+same assignment from the live membership and the active cameras: a
+consistent hash ring with bounded loads, where each camera weighs in by its
+native fps and resolution. Assignment alone does not start a decoder; a
+worker must also hold the camera's lease (`SET NX PX`, renewed on every
+heartbeat), so a camera is decoded by at most one worker even while
+replicas disagree during a rebalance. Leases of departed workers expire,
+and releases and camera edits are announced on `CHANGES_CHANNEL` so peers
+react without waiting for the next heartbeat.
+"""
+
+import bisect
+import hashlib
+import os
+import socket
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis, publish
+
+logger = structlog.get_logger()
+
+WORKERS_KEY = "ingestion:workers"
+LEASE_PREFIX = "ingestion:lease:"
+CHANGES_CHANNEL = "cameras:changes"
+
+# Reference load: one 1080p stream at 15 fps
+REFERENCE_PIXELS = 1920 * 1080
+REFERENCE_FPS = 15
+
+# Renew the leases still owned by ARGV[1]; returns the keys that were lost
+RENEW_SCRIPT = """
+local lost = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+    else
+        table.insert(lost, key)
+    end
+end
+return lost
+"""
+
+# Delete the leases still owned by ARGV[1]
+RELEASE_SCRIPT = """
+local released = 0
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[1] then
+        redis.call('DEL', key)
+        released = released + 1
+    end
+end
+return released
+"""
+
+
+def camera_weight(stream_config: Optional[Dict[str, Any]]) -> float:
+    """Relative decode cost of a camera, 1.0 for 1080p at 15 fps."""
+    config = stream_config or {}
+    fps = float(config.get("fps") or REFERENCE_FPS)
+    try:
+        width, height = (int(part) for part in str(config.get("resolution", "")).lower().split("x"))
+        pixels = width * height
+    except ValueError:
+        pixels = REFERENCE_PIXELS
+    return max(0.05, (fps / REFERENCE_FPS) * (pixels / REFERENCE_PIXELS))
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes and bounded loads."""
+
+    def __init__(self, workers: Iterable[str], replicas: Optional[int] = None):
+        replicas = replicas or settings.SCHEDULER_VIRTUAL_NODES
+        points = sorted(
+            (_hash(f"{worker}#{i}"), worker)
+            for worker in workers
+            for i in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._workers = [worker for _, worker in points]
+        self._count = len(set(self._workers))
+
+    def candidates(self, key: str) -> List[str]:
+        """Distinct workers in ring order starting at the key's position."""
+        seen: List[str] = []
+        if not self._keys:
+            return seen
+        start = bisect.bisect(self._keys, _hash(key))
+        for i in range(len(self._keys)):
+            worker = self._workers[(start + i) % len(self._keys)]
+            if worker not in seen:
+                seen.append(worker)
+                if len(seen) == self._count:
+                    break
+        return seen
+
+    def assign(self, weights: Dict[str, float]) -> Dict[str, str]:
+        """
+        Map camera ids to workers. A worker takes a camera only while its
+        load stays within SCHEDULER_LOAD_FACTOR of the mean, otherwise the
+        camera moves on to the next worker on the ring. The result depends
+        only on the inputs, so every replica computes the same mapping.
+        """
+        workers = set(self._workers)
+        if not workers:
+            return {}
+
+        capacity = settings.SCHEDULER_LOAD_FACTOR * sum(weights.values()) / len(workers)
+        loads: Dict[str, float] = {worker: 0.0 for worker in workers}
+        assignment: Dict[str, str] = {}
+
+        # Heaviest first so large streams are not left without room
+        for camera_id in sorted(weights, key=lambda c: (-weights[c], c)):
+            weight = weights[camera_id]
+            candidates = self.candidates(camera_id)
+            chosen = next(
+                (w for w in candidates if loads[w] + weight <= capacity),
+                min(candidates, key=lambda w: loads[w])
+            )
+            loads[chosen] += weight
+            assignment[camera_id] = chosen
+        return assignment
+
+
+class CameraScheduler:
+    """Membership, assignment and camera leases for one ingestion worker."""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.leases: Set[str] = set()
+
+    @property
+    def lease_ttl_ms(self) -> int:
+        return int(settings.SCHEDULER_LEASE_TTL * 1000)
+
+    async def heartbeat(self) -> List[str]:
+        """Refresh this worker's membership and return the live workers."""
+        redis = get_redis()
+        now = time.time()
+        pipe = redis.pipeline(transaction=True)
+        pipe.zadd(WORKERS_KEY, {self.worker_id: now + settings.SCHEDULER_LEASE_TTL})
+        pipe.zremrangebyscore(WORKERS_KEY, "-inf", now)
+        pipe.zrange(WORKERS_KEY, 0, -1)
+        _, _, workers = await pipe.execute()
+        return sorted(workers)
+
+    async def leave(self) -> None:
+        """Drop out of the membership and hand back every lease."""
+        await get_redis().zrem(WORKERS_KEY, self.worker_id)
+        await self.release(list(self.leases))
+
+    async def assign(self, cameras: Dict[str, Optional[Dict[str, Any]]]) -> Set[str]:
+        """
+        Heartbeat and compute which of the active cameras, given as
+        {camera_id: stream_config}, belong to this worker.
+        """
+        workers = await self.heartbeat()
+        weights = {camera_id: camera_weight(config) for camera_id, config in cameras.items()}
+        assignment = HashRing(workers).assign(weights)
+        mine = {camera_id for camera_id, worker in assignment.items() if worker == self.worker_id}
+        logger.debug("Cameras assigned", worker_id=self.worker_id, workers=len(workers), assigned=len(mine))
+        return mine
+
+    async def claim(self, mine: Set[str]) -> Set[str]:
+        """
+        Release leases on cameras no longer assigned, renew the rest and try
+        to take the newly assigned ones. Callers must have stopped decoding
+        the released cameras. Returns the cameras this worker may decode.
+        """
+        # Hand over first so the new owner can pick the camera up right away
+        await self.release([camera_id for camera_id in self.leases if camera_id not in mine])
+        await self._renew()
+        await self._acquire([camera_id for camera_id in mine if camera_id not in self.leases])
+        return set(self.leases)
+
+    async def release(self, camera_ids: List[str]) -> None:
+        if not camera_ids:
+            return
+        await get_redis().eval(
+            RELEASE_SCRIPT,
+            len(camera_ids),
+            *[LEASE_PREFIX + camera_id for camera_id in camera_ids],
+            self.worker_id
+        )
+        self.leases.difference_update(camera_ids)
+        await notify_camera_change(None, "released")
+
+    async def _renew(self) -> None:
+        if not self.leases:
+            return
+        lost = await get_redis().eval(
+            RENEW_SCRIPT,
+            len(self.leases),
+            *[LEASE_PREFIX + camera_id for camera_id in self.leases],
+            self.worker_id,
+            self.lease_ttl_ms
+        )
+        for key in lost:
+            camera_id = key[len(LEASE_PREFIX):]
+            self.leases.discard(camera_id)
+            logger.warning("Camera lease lost", worker_id=self.worker_id, camera_id=camera_id)
+
+    async def _acquire(self, camera_ids: List[str]) -> None:
+        if not camera_ids:
+            return
+        pipe = get_redis().pipeline(transaction=False)
+        for camera_id in camera_ids:
+            pipe.set(LEASE_PREFIX + camera_id, self.worker_id, nx=True, px=self.lease_ttl_ms)
+        for camera_id, acquired in zip(camera_ids, await pipe.execute()):
+            if acquired:
+                self.leases.add(camera_id)
+
+
+async def notify_camera_change(camera_id: Optional[str], action: str) -> None:
+    """Tell ingestion workers to reschedule now instead of at the next heartbeat."""
+    try:
+        await publish(CHANGES_CHANNEL, {"camera_id": camera_id, "action": action})
+    except Exception as e:
+        logger.warning("Failed to announce camera change", camera_id=camera_id, error=str(e))
@@ -0,0 +1,225 @@
+"""
+Write-behind buffer for sightings.
+
+The recognition worker hands every matched face to `SightingWriter`, which
+holds the rows until the batch is large or old enough and then writes them
+in one transaction: a COPY moved into `sightings` plus a single `last_seen` update
+per subject. Each flush appends one message to the aggregate detections
+feed and one to the feed of each camera in the batch (see
+`detections_feed`), and every sighting to STREAM_SIGHTINGS for the alert
+engines. The stream entries behind the buffered rows are returned from
+`flush()` so the caller ACKs them only once the rows are committed and
+on STREAM_SIGHTINGS.
+
+The feeds are best effort, STREAM_SIGHTINGS is not: if appending fails,
+`flush()` raises and the entries are redelivered. Sighting ids are
+derived from the entry they came from (`sighting_id`), rows that already
+exist are skipped and sightings already on the stream are not added
+again, so a redelivered entry completes its flush without duplicates.
+"""
+
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import UUID, uuid4, uuid5
+
+import numpy as np
+import structlog
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.redis import detections_feed, publish_detections, stream_add_once
+from app.core.tracing import mark
+from app.models.sighting import Sighting
+
+logger = structlog.get_logger()
+
+COPY_COLUMNS = [
+    "sighting_id",
+    "subject_id",
+    "camera_id",
+    "detection_confidence",
+    "recognition_confidence",
+    "match_distance",
+    "scene_analysis",
+    "detected_at",
+    "processed_at",
+]
+
+# Rows go through a temporary table so ones written before can be skipped
+CREATE_BATCH = "CREATE TEMP TABLE sightings_batch (LIKE sightings INCLUDING DEFAULTS) ON COMMIT DROP"
+INSERT_BATCH = f"""
+    INSERT INTO sightings ({", ".join(COPY_COLUMNS)})
+    SELECT {", ".join(COPY_COLUMNS)} FROM sightings_batch
+    ON CONFLICT DO NOTHING
+    RETURNING sighting_id
+"""
+
+# Namespace of the sighting ids derived from stream entries
+SIGHTING_NAMESPACE = UUID("5d7c5f0e-5b1e-4c55-9a43-6f0d2f4b8e21")
+
+# GREATEST ignores NULL, so a subject never seen before takes the batch value
+UPDATE_LAST_SEEN = """
+    UPDATE subjects AS s
+    SET last_seen = GREATEST(s.last_seen, v.last_seen)
+    FROM unnest($1::uuid[], $2::timestamptz[]) AS v(subject_id, last_seen)
+    WHERE s.subject_id = v.subject_id
+"""
+
+
+class SightingWriter:
+    """Buffers sightings and flushes them on size or age."""
+
+    def __init__(self, max_size: Optional[int] = None, max_delay: Optional[float] = None):
+        self.max_size = max_size or settings.SIGHTING_BATCH_SIZE
+        self.max_delay = max_delay or settings.SIGHTING_FLUSH_INTERVAL
+        self.sightings: List[Sighting] = []
+        self.embeddings: List[np.ndarray] = []
+        self.traces: List[Optional[Dict]] = []
+        self.message_ids: List[str] = []
+        self._oldest: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.sightings)
+
+    def add(
+        self,
+        message_id: str,
+        sighting: Sighting,
+        embedding: np.ndarray,
+        trace: Optional[Dict] = None
+    ) -> None:
+        """Buffer a sighting produced from the given stream entry."""
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self.sightings.append(sighting)
+        self.embeddings.append(embedding)
+        self.traces.append(trace)
+        self.message_ids.append(message_id)
+
+    def due(self) -> bool:
+        """True once the buffer is full or its oldest row has waited long enough."""
+        if not self.sightings:
+            return False
+        return (
+            len(self.sightings) >= self.max_size
+            or time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    def discard(self) -> None:
+        """Drop buffered rows; their stream entries stay pending for redelivery."""
+        self.sightings = []
+        self.embeddings = []
+        self.traces = []
+        self.message_ids = []
+        self._oldest = None
+
+    async def flush(self) -> List[str]:
+        """
+        Write buffered sightings in one transaction and publish them.
+        Returns the stream entry ids that are now safe to ACK.
+        """
+        if not self.sightings:
+            return []
+
+        sightings, embeddings, traces = self.sightings, self.embeddings, self.traces
+        message_ids = self.message_ids
+        started = time.monotonic()
+
+        written = await self._write(sightings)
+        for sighting, trace in zip(sightings, traces):
+            mark(trace, str(sighting.camera_id), "write")
+
+        # Rows are committed; losing live notifications must not cause a rewrite
+        try:
+            await self._publish([
+                (sighting, trace) for sighting, trace in zip(sightings, traces) if str(sighting.sighting_id) in written
+            ])
+        except Exception as e:
+            logger.warning("Failed to publish sightings", count=len(sightings), error=str(e))
+
+        # The alert engines only see what is on the stream, so this must not be lost
+        await stream_add_once(
+            settings.STREAM_SIGHTINGS,
+            "sighting",
+            [
+                (str(sighting.sighting_id), {"sighting": sighting.to_dict(), "embedding": embedding, "trace": trace})
+                for sighting, embedding, trace in zip(sightings, embeddings, traces)
+            ],
+            maxlen=settings.STREAM_MAX_LENGTH
+        )
+        self.discard()
+
+        logger.debug(
+            "Sightings flushed",
+            count=len(sightings),
+            duration_ms=round((time.monotonic() - started) * 1000, 1)
+        )
+        return message_ids
+
+    async def _write(self, sightings: List[Sighting]) -> Set[str]:
+        """Write the rows and update `last_seen`; returns the ids of rows that were new."""
+        last_seen: Dict = {}
+        for sighting in sightings:
+            if sighting.subject_id and (
+                sighting.subject_id not in last_seen
+                or sighting.detected_at > last_seen[sighting.subject_id]
+            ):
+                last_seen[sighting.subject_id] = sighting.detected_at
+
+        records = [
+            (
+                sighting.sighting_id,
+                sighting.subject_id,
+                sighting.camera_id,
+                sighting.detection_confidence,
+                sighting.recognition_confidence,
+                sighting.match_distance,
+                json.dumps(sighting.scene_analysis),
+                sighting.detected_at,
+                sighting.processed_at,
+            )
+            for sighting in sightings
+        ]
+
+        async with engine.connect() as connection:
+            raw = await connection.get_raw_connection()
+            driver = raw.driver_connection
+            async with driver.transaction():
+                await driver.execute(CREATE_BATCH)
+                await driver.copy_records_to_table("sightings_batch", records=records, columns=COPY_COLUMNS)
+                written = {str(row["sighting_id"]) for row in await driver.fetch(INSERT_BATCH)}
+                if last_seen:
+                    await driver.execute(UPDATE_LAST_SEEN, list(last_seen), list(last_seen.values()))
+        return written
+
+    async def _publish(self, sightings: List[Tuple[Sighting, Optional[Dict]]]) -> None:
+        """Append new sightings to the detections feeds."""
+        if not sightings:
+            return
+        data = [sighting.to_dict() for sighting, _ in sightings]
+        traces = [trace for _, trace in sightings]
+
+        by_camera = defaultdict(list)
+        for item in data:
+            by_camera[item["camera_id"]].append(item)
+        await publish_detections([(detections_feed(), {"type": "detections", "data": data})] + [
+            (detections_feed(camera_id), {"type": "detections", "data": items})
+            for camera_id, items in by_camera.items()
+        ])
+        for item, trace in zip(data, traces):
+            mark(trace, item["camera_id"], "publish")
+
+
+def sighting_id(stream: str, message_id: str) -> UUID:
+    """Id of the sighting made from a stream entry, the same on every delivery."""
+    return uuid5(SIGHTING_NAMESPACE, f"{stream}:{message_id}")
+
+
+def new_sighting(**values) -> Sighting:
+    """Sighting with the id and timestamp the database would otherwise default."""
+    values.setdefault("sighting_id", uuid4())
+    values.setdefault("processed_at", datetime.now(timezone.utc))
+    return Sighting(**values)
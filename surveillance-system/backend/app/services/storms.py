@@ -0,0 +1,192 @@
+"""
+Alert storm coalescing.
+
+Alerts are counted per rule and camera in fixed windows of
+ALERT_STORM_WINDOW seconds. The first ALERT_STORM_THRESHOLD of a window
+are raised as usual; past that the window is a storm and the rest fold
+into a single digest alert carrying the count and a sample of sighting
+ids, so a noisy camera or a mis-tuned rule costs one row, one WebSocket
+message and one notification instead of hundreds. A digest that reaches
+ALERT_STORM_ESCALATE alerts is escalated.
+
+Counting is one Lua call per rule and camera, so engine replicas agree on
+which alerts fold and on which of them creates the digest; a batch that
+fails to store is counted out again before it is redelivered. Once a window
+has closed, whichever replica claims it from STORMS_KEY writes the final
+count to its digest.
+"""
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+KEY_PREFIX = "alerts:storm:"
+# Storm windows with a digest, scored by when the window closes (epoch ms)
+STORMS_KEY = "alerts:storm:open"
+
+# Priority given to escalated digests, the top of the 1-10 scale
+ESCALATED_PRIORITY = 10
+
+# KEYS: window hash, samples list, open storms
+# ARGV: alerts, threshold, proposed digest id, window end ms, storm member,
+#       max samples, ttl ms, then the sighting id of each alert in order
+COUNT_SCRIPT = """
+local n = tonumber(ARGV[1])
+local threshold = tonumber(ARGV[2])
+local count = redis.call('HINCRBY', KEYS[1], 'count', n)
+local before = count - n
+if before == 0 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[7])
+end
+local raised = math.max(0, math.min(n, threshold - before))
+local created = 0
+if count > threshold then
+    if redis.call('HSETNX', KEYS[1], 'digest', ARGV[3]) == 1 then
+        created = 1
+        redis.call('ZADD', KEYS[3], ARGV[4], ARGV[5])
+    end
+    for i = 8 + raised, #ARGV do
+        if ARGV[i] ~= '' then
+            redis.call('RPUSH', KEYS[2], ARGV[i])
+        end
+    end
+    redis.call('LTRIM', KEYS[2], 0, tonumber(ARGV[6]) - 1)
+    redis.call('PEXPIRE', KEYS[2], ARGV[7])
+end
+return {before, raised, redis.call('HGET', KEYS[1], 'digest') or '', created}
+"""
+
+# (rule id, camera id)
+StormKey = Tuple[str, str]
+
+
+@dataclass
+class StormCount:
+    """Where a batch of one rule's alerts at one camera falls in its window."""
+    window: int
+    before: int
+    count: int
+    # Leading alerts of the batch to raise individually; the rest fold
+    raised: int
+    digest_id: Optional[str]
+    # Whether this batch started the storm and must store the digest
+    created: bool
+    # Sighting ids of the folded alerts, pushed to the window's samples
+    samples: List[str] = field(default_factory=list)
+
+    @property
+    def escalates(self) -> bool:
+        """Whether this batch took the window past the escalation threshold."""
+        return self.before < settings.ALERT_STORM_ESCALATE <= self.count
+
+
+@dataclass
+class ClosedStorm:
+    rule_id: str
+    camera_id: str
+    window: int
+    digest_id: str
+    count: int
+    sample_ids: List[str] = field(default_factory=list)
+
+
+def window_bounds(window: int) -> Tuple[datetime, datetime]:
+    length = settings.ALERT_STORM_WINDOW
+    return (
+        datetime.fromtimestamp(window * length, tz=timezone.utc),
+        datetime.fromtimestamp((window + 1) * length, tz=timezone.utc),
+    )
+
+
+def _keys(rule_id: str, camera_id: str, window: int) -> Tuple[str, str]:
+    base = f"{KEY_PREFIX}{rule_id}:{camera_id}:{window}"
+    return base, f"{base}:samples"
+
+
+async def count_alerts(
+    groups: Dict[StormKey, Sequence[Optional[str]]],
+    digest_ids: Dict[StormKey, str]
+) -> Dict[StormKey, StormCount]:
+    """
+    Count a batch of alerts, given as their sighting ids per rule and
+    camera, into the current windows. `digest_ids` proposes the id a digest
+    gets if the batch starts a storm.
+    """
+    length = settings.ALERT_STORM_WINDOW
+    window = int(time.time() // length)
+    window_end = (window + 1) * length * 1000
+    ttl = length * 2 * 1000
+
+    # All or nothing, so a failed call has counted nothing
+    pipe = get_redis().pipeline(transaction=True)
+    for (rule_id, camera_id), sighting_ids in groups.items():
+        counts_key, samples_key = _keys(rule_id, camera_id, window)
+        pipe.eval(
+            COUNT_SCRIPT, 3, counts_key, samples_key, STORMS_KEY,
+            len(sighting_ids), settings.ALERT_STORM_THRESHOLD, digest_ids[(rule_id, camera_id)],
+            window_end, f"{rule_id}:{camera_id}:{window}", settings.ALERT_STORM_SAMPLES, ttl,
+            *[sighting_id or "" for sighting_id in sighting_ids]
+        )
+    results = await pipe.execute()
+
+    counts = {}
+    for key, (before, raised, digest_id, created) in zip(groups, results):
+        before, raised = int(before), int(raised)
+        counts[key] = StormCount(
+            window=window,
+            before=before,
+            count=before + len(groups[key]),
+            raised=raised,
+            digest_id=digest_id or None,
+            created=bool(int(created)),
+            samples=[sighting_id for sighting_id in groups[key][raised:] if sighting_id] if digest_id else []
+        )
+    return counts
+
+
+async def uncount_alerts(storms: Sequence[Tuple[StormKey, StormCount]]) -> None:
+    """
+    Take a batch that failed to store back out of its windows, so its
+    redelivery is not counted twice, and undo the digests it claimed.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    for (rule_id, camera_id), storm in storms:
+        counts_key, samples_key = _keys(rule_id, camera_id, storm.window)
+        pipe.hincrby(counts_key, "count", storm.before - storm.count)
+        for sighting_id in storm.samples:
+            pipe.lrem(samples_key, -1, sighting_id)
+        if storm.created:
+            pipe.hdel(counts_key, "digest")
+            pipe.zrem(STORMS_KEY, f"{rule_id}:{camera_id}:{storm.window}")
+    await pipe.execute()
+
+
+async def closed_storms(limit: int = 100) -> List[ClosedStorm]:
+    """Claim storm windows that have closed; each is returned to one replica only."""
+    redis = get_redis()
+    members = await redis.zrangebyscore(STORMS_KEY, 0, int(time.time() * 1000), start=0, num=limit)
+    storms = []
+    for member in members:
+        if not await redis.zrem(STORMS_KEY, member):
+            continue
+        rule_id, camera_id, window = member.split(":")
+        counts_key, samples_key = _keys(rule_id, camera_id, int(window))
+        pipe = redis.pipeline(transaction=False)
+        pipe.hgetall(counts_key)
+        pipe.lrange(samples_key, 0, -1)
+        pipe.delete(counts_key, samples_key)
+        counts, samples, _ = await pipe.execute()
+        if counts.get("digest"):
+            storms.append(ClosedStorm(
+                rule_id=rule_id,
+                camera_id=camera_id,
+                window=int(window),
+                digest_id=counts["digest"],
+                count=int(counts.get("count", 0)),
+                sample_ids=samples
+            ))
+    return storms
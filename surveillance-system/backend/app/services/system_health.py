@@ -0,0 +1,251 @@
+"""
+System health snapshots for the /ws/system channel.
+
+One `HealthCollector` per API process samples, every
+SYSTEM_HEALTH_INTERVAL seconds, the database pool, Redis, the pipeline
+stream backlogs and consumers, ingestion worker heartbeats, camera frame
+freshness and this process's API latency percentiles. It hands the
+snapshot to every registered listener, which fan it out to the process's
+system sockets. The collector only runs while at least one system socket
+is open in the process, so the cost depends on the interval, not on how
+many operators are watching.
+"""
+
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, text
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.redis import get_redis
+from app.models.camera import Camera
+from app.services.scheduler import WORKERS_KEY
+
+logger = structlog.get_logger()
+
+# Cameras without a frame for this long are stale (as on the camera health endpoint)
+FRESH_SECONDS = 300
+STALE_CAMERAS_LISTED = 20
+
+# Consumers idle for longer than this are counted as idle
+CONSUMER_IDLE_MS = 60000
+
+# Requests kept for the API latency percentiles, and over how long
+LATENCY_SAMPLES = 4096
+LATENCY_WINDOW_SECONDS = 60
+
+PIPELINE_STREAMS = (
+    settings.STREAM_FRAMES,
+    settings.STREAM_FACES,
+    settings.STREAM_SIGHTINGS,
+    settings.STREAM_ACTIONS,
+)
+
+Listener = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class RequestLatency:
+    """Recent request durations of this process."""
+
+    def __init__(self):
+        # (monotonic time, seconds)
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=LATENCY_SAMPLES)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append((time.monotonic(), seconds))
+
+    def percentiles(self) -> Dict[str, Any]:
+        cutoff = time.monotonic() - LATENCY_WINDOW_SECONDS
+        durations = sorted(seconds for at, seconds in self.samples if at >= cutoff)
+        if not durations:
+            return {"requests": 0}
+
+        def at(q: float) -> float:
+            return round(durations[min(len(durations) - 1, int(q * len(durations)))] * 1000, 1)
+
+        return {"requests": len(durations), "p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+
+request_latency = RequestLatency()
+
+
+class HealthCollector:
+    """Samples system health while someone in this process is watching."""
+
+    def __init__(self):
+        self.viewers = 0
+        self.listeners: List[Listener] = []
+        self.latest: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def watch(self) -> None:
+        self.viewers += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def unwatch(self) -> None:
+        self.viewers = max(0, self.viewers - 1)
+
+    async def _run(self) -> None:
+        while self.viewers:
+            self.latest = await self.collect()
+            for listener in self.listeners:
+                try:
+                    await listener(self.latest)
+                except Exception as e:
+                    logger.warning("Failed to send health snapshot", error=str(e))
+            await asyncio.sleep(settings.SYSTEM_HEALTH_INTERVAL)
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def collect(self) -> Dict[str, Any]:
+        """One snapshot; a part that cannot be sampled reports its error."""
+        parts = {
+            "database": self._database,
+            "redis": self._redis,
+            "streams": self._streams,
+            "workers": self._workers,
+            "cameras": self._cameras,
+        }
+        results = await asyncio.gather(*(sample() for sample in parts.values()), return_exceptions=True)
+
+        snapshot: Dict[str, Any] = {
+            "type": "health",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+        for name, result in zip(parts, results):
+            snapshot[name] = {"error": str(result)} if isinstance(result, Exception) else result
+        snapshot["api"] = request_latency.percentiles()
+        snapshot["status"] = _status(snapshot)
+        return snapshot
+
+    async def _database(self) -> Dict[str, Any]:
+        pool = engine.sync_engine.pool
+        started = time.perf_counter()
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        return {
+            "ping_ms": round((time.perf_counter() - started) * 1000, 1),
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        }
+
+    async def _redis(self) -> Dict[str, Any]:
+        redis = get_redis()
+        started = time.perf_counter()
+        await redis.ping()
+        ping_ms = round((time.perf_counter() - started) * 1000, 1)
+        memory = await redis.info("memory")
+        return {"ping_ms": ping_ms, "used_memory_mb": round(int(memory.get("used_memory", 0)) / 2 ** 20, 1)}
+
+    async def _groups(self) -> Dict[str, List[Dict[str, Any]]]:
+        redis = get_redis()
+        groups = {}
+        for stream in PIPELINE_STREAMS:
+            try:
+                groups[stream] = await redis.xinfo_groups(stream)
+            except Exception:
+                # Stream not created yet
+                groups[stream] = []
+        return groups
+
+    async def _streams(self) -> Dict[str, Any]:
+        redis = get_redis()
+        pipe = redis.pipeline(transaction=False)
+        for stream in PIPELINE_STREAMS:
+            pipe.xlen(stream)
+        lengths = await pipe.execute()
+        groups = await self._groups()
+        return {
+            stream: {
+                "length": length,
+                "groups": {
+                    group["name"]: {"lag": group.get("lag"), "pending": group.get("pending")}
+                    for group in groups[stream]
+                },
+            }
+            for stream, length in zip(PIPELINE_STREAMS, lengths)
+        }
+
+    async def _workers(self) -> Dict[str, Any]:
+        redis = get_redis()
+        groups = await self._groups()
+        pipe = redis.pipeline(transaction=False)
+        pipe.zcount(WORKERS_KEY, time.time(), "+inf")
+        names = []
+        for stream, stream_groups in groups.items():
+            for group in stream_groups:
+                pipe.xinfo_consumers(stream, group["name"])
+                names.append(f"{stream}/{group['name']}")
+        ingestion, *consumers = await pipe.execute()
+        return {
+            "ingestion": ingestion,
+            "consumers": {
+                name: {
+                    "total": len(members),
+                    "active": sum(1 for member in members if int(member.get("idle", 0)) < CONSUMER_IDLE_MS),
+                }
+                for name, members in zip(names, consumers)
+            },
+        }
+
+    async def _cameras(self) -> Dict[str, Any]:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=FRESH_SECONDS)
+        stale = or_(Camera.last_frame_at.is_(None), Camera.last_frame_at < cutoff)
+        async with AsyncSessionLocal() as session:
+            active, fresh = (await session.execute(
+                select(
+                    func.count().filter(Camera.is_active),
+                    func.count().filter(Camera.is_active, Camera.last_frame_at >= cutoff),
+                )
+            )).one()
+            rows = (await session.execute(
+                select(Camera.camera_id, Camera.name, Camera.last_frame_at)
+                .where(Camera.is_active, stale)
+                .order_by(Camera.last_frame_at.asc().nullsfirst())
+                .limit(STALE_CAMERAS_LISTED)
+            )).all()
+        return {
+            "active": active,
+            "fresh": fresh,
+            "stale": active - fresh,
+            "stale_cameras": [
+                {
+                    "camera_id": str(camera_id),
+                    "name": name,
+                    "last_frame_at": last_frame_at.isoformat() if last_frame_at else None,
+                }
+                for camera_id, name, last_frame_at in rows
+            ],
+        }
+
+
+def _status(snapshot: Dict[str, Any]) -> str:
+    if "error" in snapshot["database"] or "error" in snapshot["redis"]:
+        return "unhealthy"
+    cameras = snapshot["cameras"]
+    backlog = sum(
+        int(group.get("lag") or 0) + int(group.get("pending") or 0)
+        for stream in snapshot["streams"].values() if isinstance(stream, dict) and "groups" in stream
+        for group in stream["groups"].values()
+    )
+    if cameras.get("stale") or "error" in cameras or backlog > settings.SAMPLING_LAG_TARGET:
+        return "degraded"
+    return "healthy"
+
+
+health = HealthCollector()
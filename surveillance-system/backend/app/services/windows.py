@@ -0,0 +1,217 @@
+"""
+Windowed state for the stateful alert rule types.
+
+    loitering         a subject stays at a camera for `dwell_seconds`, with
+                      no gap longer than `gap_seconds` between sightings
+    time_restriction  someone is seen while the rule's schedule applies, for
+                      `dwell_seconds` if set (subjects only), else at once
+    crowd             `max_occupancy` or more people at a camera within
+                      `window_seconds`: the distinct subjects plus the most
+                      unknown faces seen in a single frame
+    tailgating        someone not allowed through follows an allowed subject
+                      past a camera within `window_seconds`; without allowed
+                      subjects or types, any known subject leads
+
+State lives in memory per rule and camera (dwell timers also per subject)
+and is advanced by each sighting in stream order using the sighting's own
+timestamp, so no history is ever queried back. It is bounded: timers and
+windows expire with their rule's time limits, a window keeps at most
+`max_events` sightings and at most `max_tracks` timers are kept, dropping
+the least recently seen. `snapshot()` and `restore()` turn it into JSON for
+checkpoints.
+"""
+
+from collections import Counter, deque
+from dataclasses import replace
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.services.rules import CompiledRule, SightingEvent
+
+# Track: [first seen, last seen, expires], event time in epoch seconds
+Track = List[float]
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class SlidingWindow:
+    """Sightings at one camera within the last `seconds`, with running counts."""
+
+    def __init__(self, seconds: float, max_events: int):
+        self.seconds = seconds
+        # (event time, subject id or None)
+        self.entries: Deque[Tuple[float, Optional[str]]] = deque()
+        self.max_events = max_events
+        self.subjects: Counter = Counter()
+        # Unknown faces per frame; faces of one frame share its capture time
+        self.unknown: Counter = Counter()
+
+    def add(self, timestamp: float, subject_id: Optional[str]) -> None:
+        self.entries.append((timestamp, subject_id))
+        self._count(timestamp, subject_id, 1)
+        while len(self.entries) > self.max_events:
+            self._pop()
+        self.expire(timestamp)
+
+    def expire(self, now: float) -> None:
+        while self.entries and self.entries[0][0] < now - self.seconds:
+            self._pop()
+
+    def occupancy(self) -> int:
+        return len(self.subjects) + max(self.unknown.values(), default=0)
+
+    def _pop(self) -> None:
+        timestamp, subject_id = self.entries.popleft()
+        self._count(timestamp, subject_id, -1)
+
+    def _count(self, timestamp: float, subject_id: Optional[str], step: int) -> None:
+        counter, key = (self.subjects, subject_id) if subject_id else (self.unknown, timestamp)
+        counter[key] += step
+        if counter[key] <= 0:
+            del counter[key]
+
+
+class WindowState:
+    """In-memory state of every stateful rule, advanced one sighting at a time."""
+
+    def __init__(self, max_tracks: int, max_events: int):
+        self.max_tracks = max_tracks
+        self.max_events = max_events
+        # (rule, camera, subject) -> dwell timer
+        self.tracks: Dict[Tuple[str, str, str], Track] = {}
+        # (rule, camera) -> recent sightings, for crowd rules
+        self.windows: Dict[Tuple[str, str], SlidingWindow] = {}
+        # (rule, camera) -> (when an allowed subject last passed, expires), for tailgating
+        self.leaders: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        # Latest event time seen, which drives expiry
+        self.clock = 0.0
+
+    def evaluate(self, rule: CompiledRule, event: SightingEvent) -> Optional[Dict[str, Any]]:
+        """
+        Advance the rule's state with an event its predicates matched.
+        Returns details for the alert when the rule fires, else None.
+        """
+        timestamp = event.detected_at.timestamp()
+        self.clock = max(self.clock, timestamp)
+        if rule.rule_type == "crowd":
+            return self._crowd(rule, event, timestamp)
+        if rule.rule_type == "tailgating":
+            return self._tailgating(rule, event, timestamp)
+        if rule.rule_type == "time_restriction" and not rule.window["dwell_seconds"]:
+            return {}
+        return self._dwell(rule, event, timestamp)
+
+    def _dwell(self, rule: CompiledRule, event: SightingEvent, timestamp: float) -> Optional[Dict[str, Any]]:
+        # Unknown faces cannot be followed from one sighting to the next
+        if not event.subject_id:
+            return None
+        key = (rule.rule_id, event.camera_id, event.subject_id)
+        track = self.tracks.get(key)
+        if track is None or timestamp > track[1] + rule.window["gap_seconds"]:
+            if key not in self.tracks and len(self.tracks) >= self.max_tracks:
+                self._evict()
+            track = self.tracks[key] = [timestamp, timestamp, timestamp]
+        track[0] = min(track[0], timestamp)
+        track[1] = max(track[1], timestamp)
+        track[2] = track[1] + rule.window["gap_seconds"]
+
+        dwell = track[1] - track[0]
+        if dwell < rule.window["dwell_seconds"]:
+            return None
+        # Staying on only fires again after another full dwell
+        since, track[0] = track[0], track[1]
+        return {"dwell_seconds": round(dwell, 1), "since": _iso(since)}
+
+    def _crowd(self, rule: CompiledRule, event: SightingEvent, timestamp: float) -> Optional[Dict[str, Any]]:
+        key = (rule.rule_id, event.camera_id)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = SlidingWindow(rule.window["window_seconds"], self.max_events)
+        window.seconds = rule.window["window_seconds"]
+        window.add(timestamp, event.subject_id)
+
+        occupancy = window.occupancy()
+        if occupancy < rule.window["max_occupancy"]:
+            return None
+        return {"occupancy": occupancy, "window_seconds": window.seconds}
+
+    def _tailgating(self, rule: CompiledRule, event: SightingEvent, timestamp: float) -> Optional[Dict[str, Any]]:
+        key = (rule.rule_id, event.camera_id)
+        allowed_ids, allowed_types = rule.window["subject_ids"], rule.window["subject_types"]
+        if allowed_ids or allowed_types:
+            allowed = event.subject_id in allowed_ids or event.subject_type in allowed_types
+        else:
+            allowed = event.subject_id is not None
+
+        if allowed:
+            passed = max(timestamp, self.leaders.get(key, (0.0, 0.0))[0])
+            self.leaders[key] = (passed, passed + rule.window["window_seconds"])
+            return None
+
+        passed, _ = self.leaders.get(key, (None, None))
+        if passed is None or not 0 <= timestamp - passed <= rule.window["window_seconds"]:
+            return None
+        return {"following_seconds": round(timestamp - passed, 2), "leader_seen_at": _iso(passed)}
+
+    def _evict(self) -> None:
+        """
+        Drop expired timers, then the least recently seen tenth of the cap,
+        so a full table is not sorted again on every new subject.
+        """
+        self.expire()
+        if len(self.tracks) >= self.max_tracks:
+            oldest = sorted(self.tracks, key=lambda key: self.tracks[key][1])
+            for key in oldest[:len(self.tracks) - self.max_tracks * 9 // 10]:
+                del self.tracks[key]
+
+    def expire(self) -> None:
+        """Forget state that can no longer contribute to an alert."""
+        self.tracks = {key: track for key, track in self.tracks.items() if track[2] >= self.clock}
+        for key, window in list(self.windows.items()):
+            window.expire(self.clock)
+            if not window.entries:
+                del self.windows[key]
+        self.leaders = {key: leader for key, leader in self.leaders.items() if leader[1] >= self.clock}
+
+    def prune(self, rule_ids: Iterable[str]) -> None:
+        """Forget the state of rules that were deleted or deactivated."""
+        keep = set(rule_ids)
+        self.tracks = {key: track for key, track in self.tracks.items() if key[0] in keep}
+        self.windows = {key: window for key, window in self.windows.items() if key[0] in keep}
+        self.leaders = {key: leader for key, leader in self.leaders.items() if key[0] in keep}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "clock": self.clock,
+            "tracks": [[*key, *track] for key, track in self.tracks.items()],
+            "windows": [
+                [*key, window.seconds, [list(entry) for entry in window.entries]]
+                for key, window in self.windows.items()
+            ],
+            "leaders": [[*key, *leader] for key, leader in self.leaders.items()],
+        }
+
+    def restore(self, data: Dict[str, Any]) -> None:
+        self.clock = data.get("clock", 0.0)
+        self.tracks = {
+            (rule_id, camera_id, subject_id): [first, last, expires]
+            for rule_id, camera_id, subject_id, first, last, expires in data.get("tracks", [])
+        }
+        self.windows = {}
+        for rule_id, camera_id, seconds, entries in data.get("windows", []):
+            window = self.windows[(rule_id, camera_id)] = SlidingWindow(seconds, self.max_events)
+            for timestamp, subject_id in entries:
+                window.add(timestamp, subject_id)
+        self.leaders = {
+            (rule_id, camera_id): (passed, expires)
+            for rule_id, camera_id, passed, expires in data.get("leaders", [])
+        }
+
+
+def alert_event(rule: CompiledRule, event: SightingEvent) -> SightingEvent:
+    """The event an alert is attributed to; crowds belong to no one subject."""
+    if rule.rule_type == "crowd":
+        return replace(event, subject_id=None, subject_type=None)
+    return event
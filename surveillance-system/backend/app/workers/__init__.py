@@ -0,0 +1,4 @@
+"""
+Pipeline workers: ingestion, detection, recognition and alerting.
+Each module is runnable with `python -m app.workers.<name>`.
+"""
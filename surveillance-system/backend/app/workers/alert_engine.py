@@ -0,0 +1,395 @@
+"""
+Alert engine worker.
+Evaluates new sightings against the compiled alert rules, records the
+resulting alerts, folding storms into digests (app.services.storms), and
+publishes them to the alerts feed. Stateful rule types are evaluated by
+app.workers.alert_windows on the same base.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import select, update
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, close_db
+from app.core.redis import get_redis, publish_alert_update
+from app.core.tracing import mark
+from app.models.alert import AlertLog, AlertRule
+from app.models.subject import Subject
+from app.services.actions import action_jobs, enqueue_actions, outbox_rows, relay_outbox
+from app.services.cooldowns import claim_cooldowns, release_cooldowns
+from app.services.rules import RULES_CHANNEL, CompiledRule, RuleIndex, SightingEvent, compile_rule
+from app.services.storms import (
+    ESCALATED_PRIORITY, ClosedStorm, StormCount, StormKey, closed_storms, count_alerts, uncount_alerts, window_bounds
+)
+from app.workers.base import StreamWorker
+
+logger = structlog.get_logger()
+
+# (rule, event, trace, window details) of a rule that fired
+Triggered = Tuple[CompiledRule, SightingEvent, Optional[dict], Optional[dict]]
+
+
+class SubjectTypes:
+    """Short-lived cache of subject types so rules can filter on them."""
+
+    def __init__(self):
+        self._types: Dict[str, Tuple[Optional[str], float]] = {}
+
+    async def resolve(self, subject_ids: List[str]) -> Dict[str, Optional[str]]:
+        now = time.monotonic()
+        missing = {
+            subject_id for subject_id in subject_ids
+            if subject_id not in self._types or self._types[subject_id][1] < now
+        }
+        if missing:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(Subject.subject_id, Subject.subject_type)
+                    .where(Subject.subject_id.in_([UUID(subject_id) for subject_id in missing]))
+                )
+                expires = now + settings.ALERT_SUBJECT_CACHE_TTL
+                found = {str(row.subject_id): row.subject_type for row in result}
+            for subject_id in missing:
+                self._types[subject_id] = (found.get(subject_id), expires)
+        return {subject_id: self._types[subject_id][0] for subject_id in subject_ids}
+
+
+def _event(sighting: dict, subject_type: Optional[str]) -> SightingEvent:
+    detected_at = datetime.fromisoformat(sighting["detected_at"])
+    if detected_at.tzinfo is None:
+        detected_at = detected_at.replace(tzinfo=timezone.utc)
+    return SightingEvent(
+        sighting_id=sighting.get("sighting_id"),
+        camera_id=sighting["camera_id"],
+        subject_id=sighting.get("subject_id"),
+        subject_type=subject_type,
+        recognition_confidence=sighting.get("recognition_confidence"),
+        detection_confidence=sighting["detection_confidence"],
+        detected_at=detected_at,
+        data=sighting
+    )
+
+
+class RuleEvaluator(StreamWorker):
+    """
+    Keeps a compiled, hot-reloaded index of the rules a worker evaluates
+    and records the alerts they raise.
+    """
+
+    stream = settings.STREAM_SIGHTINGS
+    batch_size = settings.ALERT_BATCH_SIZE
+    # Whether this worker evaluates the stateful (windowed) rule types
+    stateful = False
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.rules = RuleIndex()
+        self.subjects = SubjectTypes()
+        await self.load_rules()
+        self._watcher = asyncio.create_task(self._watch_rules())
+        self._storms = asyncio.create_task(self._close_storms())
+        self._outbox = asyncio.create_task(self._relay_outbox())
+
+    async def teardown(self) -> None:
+        self._watcher.cancel()
+        self._storms.cancel()
+        self._outbox.cancel()
+        await close_db()
+        await super().teardown()
+
+    def _compile(self, rule: AlertRule) -> Optional[CompiledRule]:
+        compiled = compile_rule(rule)
+        return compiled if compiled and compiled.stateful == self.stateful else None
+
+    async def load_rules(self) -> None:
+        """Compile every active rule from scratch."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(AlertRule).where(AlertRule.is_active == True))
+            compiled = [self._compile(rule) for rule in result.scalars()]
+        self.rules.replace(rule for rule in compiled if rule)
+        self._loaded_at = time.monotonic()
+        logger.info("Alert rules loaded", count=len(self.rules), stateful=self.stateful)
+
+    async def reload_rule(self, rule_id: str) -> None:
+        """Recompile one rule after it was created, changed or deleted."""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(AlertRule).where(AlertRule.rule_id == UUID(rule_id)))
+            rule = result.scalar_one_or_none()
+        compiled = self._compile(rule) if rule else None
+        if compiled:
+            self.rules.add(compiled)
+        else:
+            self.rules.remove(rule_id)
+        logger.info("Alert rule reloaded", rule_id=rule_id, active=compiled is not None)
+
+    async def _watch_rules(self) -> None:
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(RULES_CHANNEL)
+                # Changes made while unsubscribed would otherwise be missed
+                await self.load_rules()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self.reload_rule(json.loads(message["data"])["rule_id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Rule change listener failed", error=str(e))
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def idle(self) -> None:
+        # Safety net in case a change notification was lost
+        if time.monotonic() - self._loaded_at >= settings.ALERT_RULES_REFRESH_INTERVAL:
+            await self.load_rules()
+
+    async def events(self, messages: List[Tuple[str, dict]]) -> List[SightingEvent]:
+        """Sighting events of a batch, with their subjects' types resolved."""
+        sightings = [payload["sighting"] for _, payload in messages]
+        subject_types = await self.subjects.resolve(
+            list({s["subject_id"] for s in sightings if s.get("subject_id")})
+        )
+        return [_event(sighting, subject_types.get(sighting.get("subject_id"))) for sighting in sightings]
+
+    async def record(self, triggered: List[Triggered]) -> None:
+        """
+        Claim cooldowns for triggered rules, fold alert storms into digests,
+        store what is left in one commit, then publish the alerts and queue
+        their actions.
+        """
+        if not triggered:
+            return
+
+        alerts = [self._alert(rule, event, details) for rule, event, _, details in triggered]
+        claims = [(rule, event, str(alert.alert_id)) for alert, (rule, event, _, _) in zip(alerts, triggered)]
+        allowed = await claim_cooldowns(claims)
+        recorded = [
+            (alert, rule, event, trace)
+            for alert, (rule, event, trace, _), ok in zip(alerts, triggered, allowed) if ok
+        ]
+        claims = [claim for claim, ok in zip(claims, allowed) if ok]
+        if not recorded:
+            return
+
+        # Only what was counted before a failure is counted out again
+        counted: List[Tuple[StormKey, StormCount]] = []
+        escalations: List[Tuple[CompiledRule, StormCount]] = []
+        try:
+            if settings.ALERT_STORM_THRESHOLD:
+                kept, counted, escalations = await self._coalesce(recorded)
+            else:
+                kept = [(alert, rule, trace) for alert, rule, _, trace in recorded]
+
+            published, jobs = [], []
+            for alert, rule, trace in kept:
+                data = self._payload(alert, rule)
+                published.append((alert, data, trace))
+                jobs.extend(action_jobs(rule.actions, data))
+            for rule, storm in escalations:
+                data = {
+                    "alert_id": storm.digest_id,
+                    "rule_id": rule.rule_id,
+                    "rule_name": rule.name,
+                    "rule_type": rule.rule_type,
+                    "status": "escalated",
+                    "priority": ESCALATED_PRIORITY,
+                    "trigger_data": {"digest": {"count": storm.count}}
+                }
+                jobs.extend(action_jobs(rule.actions, data))
+
+            async with AsyncSessionLocal() as session:
+                session.add_all([alert for alert, _, _ in kept])
+                # Stored with the alerts, so their notifications survive a failure to queue them
+                session.add_all(outbox_rows(jobs))
+                if escalations:
+                    await session.execute(
+                        update(AlertLog)
+                        .where(AlertLog.alert_id.in_([UUID(storm.digest_id) for _, storm in escalations]))
+                        .where(AlertLog.status == "open")
+                        .values(status="escalated", priority=ESCALATED_PRIORITY)
+                    )
+                await session.commit()
+        except Exception:
+            # The batch will be redelivered; it must not find its own cooldowns
+            await release_cooldowns(claims)
+            if counted:
+                await uncount_alerts(counted)
+            raise
+
+        for alert, data, trace in published:
+            await publish_alert_update({"type": "alert", "data": data})
+            mark(trace, str(alert.camera_id), "alert")
+        for _, storm in escalations:
+            await publish_alert_update({"type": "escalated", "alert_id": storm.digest_id, "count": storm.count})
+        try:
+            await enqueue_actions(jobs)
+        except Exception as e:
+            # The jobs stay in the outbox and are queued by relay_outbox()
+            logger.warning("Failed to queue alert actions", count=len(jobs), error=str(e))
+
+    async def _coalesce(self, recorded: List[Tuple[AlertLog, CompiledRule, SightingEvent, Optional[dict]]]):
+        """
+        Split a batch into alerts raised on their own and new storm digests,
+        and find the digests it escalates. Also returns where each rule and
+        camera of the batch was counted, to undo if the batch is not stored.
+        """
+        groups: Dict[StormKey, List[Tuple[AlertLog, CompiledRule, SightingEvent, Optional[dict]]]] = {}
+        for item in recorded:
+            groups.setdefault((item[1].rule_id, item[2].camera_id), []).append(item)
+        counts = await count_alerts(
+            {key: [event.sighting_id for _, _, event, _ in items] for key, items in groups.items()},
+            {key: str(uuid4()) for key in groups}
+        )
+
+        kept: List[Tuple[AlertLog, CompiledRule, Optional[dict]]] = []
+        escalations: List[Tuple[CompiledRule, StormCount]] = []
+        for key, items in groups.items():
+            storm = counts[key]
+            kept.extend((alert, rule, trace) for alert, rule, _, trace in items[:storm.raised])
+            folded = items[storm.raised:]
+            if not folded:
+                continue
+            _, rule, event, trace = folded[0]
+            if storm.created:
+                sighting_ids = [event.sighting_id for _, _, event, _ in folded]
+                kept.append((self._digest(rule, event, storm, sighting_ids), rule, trace))
+            elif storm.digest_id and storm.escalates:
+                escalations.append((rule, storm))
+        return kept, list(counts.items()), escalations
+
+    def _digest(
+        self,
+        rule: CompiledRule,
+        event: SightingEvent,
+        storm: StormCount,
+        sighting_ids: List[Optional[str]]
+    ) -> AlertLog:
+        """The aggregate alert standing for a storm window."""
+        start, end = window_bounds(storm.window)
+        escalated = storm.count >= settings.ALERT_STORM_ESCALATE
+        return AlertLog(
+            alert_id=UUID(storm.digest_id),
+            rule_id=UUID(rule.rule_id),
+            camera_id=UUID(event.camera_id),
+            sighting_id=UUID(event.sighting_id) if event.sighting_id else None,
+            trigger_data={
+                "rule_name": rule.name,
+                "rule_type": rule.rule_type,
+                "sighting": event.data,
+                "digest": {
+                    "count": storm.count,
+                    "sample_ids": [s for s in sighting_ids if s][:settings.ALERT_STORM_SAMPLES],
+                    "window_start": start.isoformat(),
+                    "window_end": end.isoformat()
+                }
+            },
+            status="escalated" if escalated else "open",
+            priority=ESCALATED_PRIORITY if escalated else rule.priority,
+            created_at=datetime.now(timezone.utc)
+        )
+
+    async def _close_storms(self) -> None:
+        """Write final counts to the digests of storm windows that have closed."""
+        while True:
+            await asyncio.sleep(5)
+            try:
+                for storm in await closed_storms():
+                    await self._finish_digest(storm)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Failed to close alert storms", error=str(e))
+
+    async def _relay_outbox(self) -> None:
+        """Queue the notifications of alerts whose jobs did not reach the stream."""
+        while True:
+            await asyncio.sleep(10)
+            try:
+                queued = await relay_outbox()
+                if queued:
+                    logger.info("Queued alert actions from the outbox", count=queued)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Failed to relay alert action outbox", error=str(e))
+
+    async def _finish_digest(self, storm: ClosedStorm) -> None:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(AlertLog).where(AlertLog.alert_id == UUID(storm.digest_id)))
+            digest = result.scalar_one_or_none()
+            if digest is None:
+                return
+            trigger_data = dict(digest.trigger_data or {})
+            summary = dict(trigger_data.get("digest") or {})
+            samples = list(summary.get("sample_ids") or [])
+            samples += [s for s in storm.sample_ids if s not in samples]
+            summary.update(count=storm.count, sample_ids=samples[:settings.ALERT_STORM_SAMPLES], closed=True)
+            trigger_data["digest"] = summary
+            digest.trigger_data = trigger_data
+            if storm.count >= settings.ALERT_STORM_ESCALATE and digest.status == "open":
+                digest.status = "escalated"
+                digest.priority = ESCALATED_PRIORITY
+            await session.commit()
+
+        await publish_alert_update({
+            "type": "digest",
+            "alert_id": storm.digest_id,
+            "count": storm.count,
+            "status": digest.status
+        })
+
+    def _alert(self, rule: CompiledRule, event: SightingEvent, details: Optional[dict] = None) -> AlertLog:
+        trigger_data = {
+            "rule_name": rule.name,
+            "rule_type": rule.rule_type,
+            "subject_type": event.subject_type,
+            "sighting": event.data
+        }
+        if details:
+            trigger_data["window"] = details
+        return AlertLog(
+            alert_id=uuid4(),
+            rule_id=UUID(rule.rule_id),
+            subject_id=UUID(event.subject_id) if event.subject_id else None,
+            camera_id=UUID(event.camera_id),
+            sighting_id=UUID(event.sighting_id) if event.sighting_id else None,
+            trigger_data=trigger_data,
+            status="open",
+            priority=rule.priority,
+            created_at=datetime.now(timezone.utc)
+        )
+
+    def _payload(self, alert: AlertLog, rule: CompiledRule) -> dict:
+        data = alert.to_dict()
+        data.update({"rule_name": rule.name, "rule_type": rule.rule_type})
+        return data
+
+
+class AlertEngine(RuleEvaluator):
+    """
+    Turns sightings into alerts for the rule types decided by one sighting.
+    Replicas share the stream through the consumer group.
+    """
+
+    group = "alerts"
+
+    async def handle(self, messages: List[Tuple[str, dict]]) -> None:
+        triggered: List[Triggered] = []
+        for (_, payload), event in zip(messages, await self.events(messages)):
+            for rule in self.rules.match(event):
+                triggered.append((rule, event, payload.get("trace"), None))
+            mark(payload.get("trace"), event.camera_id, "evaluate")
+        await self.record(triggered)
+
+
+if __name__ == "__main__":
+    asyncio.run(AlertEngine().run())
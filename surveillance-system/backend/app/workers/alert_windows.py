@@ -0,0 +1,189 @@
+"""
+Windowed alert worker.
+
+Evaluates the stateful rule types (see app.services.windows). They need
+every sighting of a camera in order, so where the stateless engine shares
+the sightings stream between replicas, one replica here holds LEADER_KEY
+and evaluates everything while the others wait as standbys.
+
+The window state is checkpointed to Redis every WINDOW_CHECKPOINT_INTERVAL
+seconds and stream entries are only ACKed once a checkpoint covering them
+has been written. A standby taking over restores the checkpoint, claims
+the entries its predecessor left pending and replays them on top of it;
+alerts raised again by the replay are held back by the rule cooldowns.
+"""
+
+import asyncio
+import json
+import time
+from typing import List, Optional, Tuple
+
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis, stream_create_group
+from app.core.tracing import mark
+from app.services.scheduler import RELEASE_SCRIPT, RENEW_SCRIPT
+from app.services.windows import WindowState, alert_event
+from app.workers.alert_engine import RuleEvaluator, Triggered
+
+logger = structlog.get_logger()
+
+LEADER_KEY = "alerts:windows:leader"
+CHECKPOINT_KEY = "alerts:windows:checkpoint"
+
+
+def _stream_position(message_id: str) -> Tuple[int, int]:
+    milliseconds, _, sequence = message_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class WindowEngine(RuleEvaluator):
+    """Single active evaluator of the stateful rule types."""
+
+    group = "alerts-windows"
+    auto_ack = False
+    stateful = True
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.state = WindowState(settings.WINDOW_MAX_TRACKS, settings.WINDOW_MAX_EVENTS)
+        self.leader = False
+        self.unacked: List[str] = []
+        self.last_id = "0-0"
+        self._checkpoint: Optional[str] = None
+        self._checkpointed_at = time.monotonic()
+        self._renewer: Optional[asyncio.Task] = None
+
+        await self._acquire()
+        if not self.leader:
+            return
+        self._renewer = asyncio.create_task(self._renew())
+        await stream_create_group(self.stream, self.group)
+        await self._take_over()
+        await self._restore()
+
+    async def teardown(self) -> None:
+        if self._renewer:
+            self._renewer.cancel()
+        if self.leader:
+            try:
+                await self.checkpoint()
+                await get_redis().eval(RELEASE_SCRIPT, 1, LEADER_KEY, self.consumer)
+            except Exception as e:
+                logger.warning("Failed to hand over window state", error=str(e))
+        await super().teardown()
+
+    async def _acquire(self) -> None:
+        """Wait as a standby until this replica becomes the leader or is stopped."""
+        ttl = int(settings.WINDOW_LEASE_TTL * 1000)
+        logged = False
+        while not self._stopping.is_set():
+            if await get_redis().set(LEADER_KEY, self.consumer, nx=True, px=ttl):
+                self.leader = True
+                logger.info("Took window engine leadership", consumer=self.consumer)
+                return
+            if not logged:
+                logger.info("Window engine on standby", consumer=self.consumer)
+                logged = True
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.WINDOW_LEASE_TTL / 3)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew(self) -> None:
+        ttl = int(settings.WINDOW_LEASE_TTL * 1000)
+        while True:
+            await asyncio.sleep(settings.WINDOW_LEASE_TTL / 3)
+            try:
+                lost = await get_redis().eval(RENEW_SCRIPT, 1, LEADER_KEY, self.consumer, ttl)
+            except Exception as e:
+                logger.warning("Failed to renew window engine leadership", error=str(e))
+                continue
+            if lost:
+                # A standby may already be replaying; stop rather than race it
+                logger.error("Lost window engine leadership", consumer=self.consumer)
+                self.leader = False
+                self.stop()
+                return
+
+    async def _take_over(self) -> None:
+        """Move entries a previous leader read but never ACKed to this consumer."""
+        redis = get_redis()
+        start, claimed = "0-0", 0
+        while True:
+            response = await redis.execute_command(
+                "XAUTOCLAIM", self.stream, self.group, self.consumer, 0, start, "COUNT", 1000, "JUSTID"
+            )
+            start, ids = response[0], response[1]
+            claimed += len(ids)
+            if start == "0-0":
+                break
+        if claimed:
+            logger.info("Claimed pending sightings", count=claimed)
+
+    async def _restore(self) -> None:
+        self._checkpoint = await get_redis().get(CHECKPOINT_KEY)
+        if self._checkpoint:
+            self._load(self._checkpoint)
+            logger.info("Window state restored", last_id=self.last_id, tracks=len(self.state.tracks))
+
+    def _load(self, checkpoint: str) -> None:
+        data = json.loads(checkpoint)
+        self.state = WindowState(settings.WINDOW_MAX_TRACKS, settings.WINDOW_MAX_EVENTS)
+        self.state.restore(data["state"])
+        self.last_id = data["last_id"]
+
+    async def checkpoint(self) -> None:
+        """Save the window state, then ACK the entries it covers."""
+        if not self.leader:
+            return
+        self.state.prune(self.rules.rules)
+        self.state.expire()
+        checkpoint = json.dumps({"last_id": self.last_id, "state": self.state.snapshot()})
+        await get_redis().set(CHECKPOINT_KEY, checkpoint)
+        self._checkpoint = checkpoint
+        self._checkpointed_at = time.monotonic()
+        unacked, self.unacked = self.unacked, []
+        await self.ack(unacked)
+
+    async def _checkpoint_if_due(self) -> None:
+        if time.monotonic() - self._checkpointed_at >= settings.WINDOW_CHECKPOINT_INTERVAL:
+            await self.checkpoint()
+
+    async def handle(self, messages: List[Tuple[str, dict]]) -> None:
+        # Entries replayed after a takeover may already be in the checkpoint
+        position = _stream_position(self.last_id)
+        fresh = [(message_id, payload) for message_id, payload in messages if _stream_position(message_id) > position]
+        self.unacked.extend(message_id for message_id, _ in messages)
+
+        if fresh:
+            triggered: List[Triggered] = []
+            for (_, payload), event in zip(fresh, await self.events(fresh)):
+                for rule in self.rules.match(event):
+                    details = self.state.evaluate(rule, event)
+                    if details is not None:
+                        triggered.append((rule, alert_event(rule, event), payload.get("trace"), details))
+                mark(payload.get("trace"), event.camera_id, "evaluate")
+            self.last_id = fresh[-1][0]
+            await self.record(triggered)
+
+        await self._checkpoint_if_due()
+
+    async def recover(self) -> None:
+        # Everything since the last checkpoint is still pending and will be
+        # read again, so rewind the state to that checkpoint
+        self.unacked = []
+        if self._checkpoint:
+            self._load(self._checkpoint)
+        else:
+            self.state = WindowState(settings.WINDOW_MAX_TRACKS, settings.WINDOW_MAX_EVENTS)
+            self.last_id = "0-0"
+
+    async def idle(self) -> None:
+        await super().idle()
+        await self._checkpoint_if_due()
+
+
+if __name__ == "__main__":
+    asyncio.run(WindowEngine().run())
@@ -0,0 +1,30 @@
+"""
+Alert archival process.
+Keeps alert_logs partitioned and moves closed alerts past the retention
+threshold to MinIO; see app.services.archival.
+"""
+
+import asyncio
+import signal
+
+from app.core.database import close_db
+from app.core.minio_client import init_minio, close_minio
+from app.services.archival import AlertArchiver
+
+
+async def main() -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await init_minio()
+    try:
+        await AlertArchiver().run(stopping)
+    finally:
+        await close_db()
+        await close_minio()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,270 @@
+"""
+Shared consumer-group loop for pipeline workers reading Redis Streams.
+
+A failed batch stays pending and is retried one entry at a time, so an
+entry that keeps failing is found on its own. Once it has failed on its own
+STREAM_MAX_DELIVERIES times it is copied to `<stream>:dead` and ACKed, and
+the entries behind it move on. Only errors the entry itself causes count:
+connection and availability errors of Redis or Postgres (see
+`is_transient`) are retried with backoff for as long as they last.
+
+Consumers are named after their host and process, so a replacement never
+reads what its predecessor left pending. Every worker therefore claims
+the pending entries of consumers that have not read for STREAM_CLAIM_IDLE
+seconds and processes them as its own.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Tuple
+
+import aioredis
+import asyncpg
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+import structlog
+
+from app.core.config import settings
+from app.core.redis import (
+    init_redis,
+    close_redis,
+    get_redis_binary,
+    stream_read,
+    stream_ack,
+    stream_claim_abandoned,
+    stream_create_group,
+)
+from app.core.tracing import close_tracing
+
+logger = structlog.get_logger()
+
+# How often to look for consumers that died with entries pending
+RECLAIM_INTERVAL = 30.0
+
+# Errors that say nothing about the entry being processed
+TRANSIENT_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    aioredis.ConnectionError,
+    aioredis.TimeoutError,
+    OperationalError,
+    InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.InsufficientResourcesError,
+    asyncpg.OperatorInterventionError,
+)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an error comes from an outage rather than from the entry itself."""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def _backoff(failures: int) -> float:
+    """Seconds to wait after the given number of consecutive failures."""
+    return min(2.0 ** (failures - 1), 30.0)
+
+
+class StreamWorker:
+    """
+    Base class for workers consuming one stream through a consumer group.
+    Subclasses implement `handle()`; messages are ACKed once it returns,
+    unless `auto_ack` is off and the subclass ACKs them itself later.
+    """
+
+    stream: str = ""
+    group: str = ""
+    batch_size: int = 10
+    block_ms: int = 1000
+    auto_ack: bool = True
+
+    def __init__(self):
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping = asyncio.Event()
+        # message id -> times it failed on its own, while isolating
+        self._failed: Dict[str, int] = {}
+
+    async def setup(self) -> None:
+        """Open connections and resources the worker needs."""
+        await init_redis()
+
+    async def teardown(self) -> None:
+        """Release resources opened in setup()."""
+        await close_tracing()
+        await close_redis()
+
+    async def handle(self, messages: List[Tuple[str, dict]]) -> None:
+        """Process a batch of (message_id, payload) entries."""
+        raise NotImplementedError
+
+    async def ack(self, message_ids: List[str]) -> None:
+        """Acknowledge processed messages."""
+        if message_ids:
+            await stream_ack(self.stream, self.group, *message_ids)
+
+    def stop(self) -> None:
+        """Request a graceful shutdown after the current batch."""
+        self._stopping.set()
+
+    async def run(self) -> None:
+        """Consume the stream until stopped."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        await self.setup()
+        try:
+            await stream_create_group(self.stream, self.group)
+            logger.info(
+                "Worker started",
+                worker=type(self).__name__,
+                stream=self.stream,
+                group=self.group,
+                consumer=self.consumer
+            )
+
+            # Start with entries delivered to this consumer but never ACKed
+            pending = True
+            cursor = "0"
+            # Retry pending entries one at a time after a failed batch
+            isolate = False
+            # Consecutive failures, for the backoff before retrying
+            failures = 0
+            reclaimed_at = 0.0
+
+            while not self._stopping.is_set():
+                claimed = []
+                if time.monotonic() - reclaimed_at >= RECLAIM_INTERVAL:
+                    claimed = await self.reclaim()
+                    reclaimed_at = time.monotonic()
+
+                if claimed:
+                    entries = claimed
+                else:
+                    response = await stream_read(
+                        self.stream,
+                        group=self.group,
+                        consumer=self.consumer,
+                        count=1 if isolate else self.batch_size,
+                        block=None if pending else self.block_ms,
+                        last_id=cursor if pending else ">"
+                    )
+                    entries = [entry for _, stream_entries in response for entry in stream_entries]
+                    if not entries:
+                        pending = False
+                        isolate = False
+                        self._failed.clear()
+                        try:
+                            await self.idle()
+                        except Exception as e:
+                            # Whatever idle() was finishing is still pending
+                            failures += 1
+                            pending = True
+                            cursor = "0"
+                            await self.recover()
+                            logger.error("Failed to finish idle work", worker=type(self).__name__, error=str(e))
+                            await asyncio.sleep(_backoff(failures))
+                        continue
+                    if pending:
+                        # Entries handed out but not yet ACKed must not be read twice
+                        cursor = entries[-1][0]
+
+                # Deleted or undecodable entries can never be processed
+                await self.ack([message_id for message_id, payload in entries if not payload])
+                messages = [(message_id, payload) for message_id, payload in entries if payload]
+                if not messages:
+                    continue
+
+                try:
+                    await self.handle(messages)
+                except Exception as e:
+                    # Leave the batch pending and retry it on the next read
+                    failures += 1
+                    pending = True
+                    cursor = "0"
+                    await self.recover()
+                    logger.error(
+                        "Failed to process batch",
+                        worker=type(self).__name__,
+                        count=len(messages),
+                        error=str(e)
+                    )
+                    if self.transient(e):
+                        # An outage: no entry is to blame, keep backing off
+                        pass
+                    elif len(messages) == 1:
+                        await self._retire_if_poison(messages[0][0], str(e))
+                    else:
+                        isolate = True
+                    await asyncio.sleep(_backoff(failures))
+                    continue
+                failures = 0
+                if self._failed:
+                    for message_id, _ in messages:
+                        self._failed.pop(message_id, None)
+
+                if self.auto_ack:
+                    await self.ack([message_id for message_id, _ in messages])
+        finally:
+            await self.teardown()
+            logger.info("Worker stopped", worker=type(self).__name__)
+
+    async def reclaim(self) -> List[Tuple[str, dict]]:
+        """Take over entries left pending by consumers that stopped reading."""
+        try:
+            claimed = await stream_claim_abandoned(
+                self.stream, self.group, self.consumer, settings.STREAM_CLAIM_IDLE * 1000, self.batch_size
+            )
+        except Exception as e:
+            logger.warning("Failed to reclaim pending entries", worker=type(self).__name__, error=str(e))
+            return []
+        if claimed:
+            logger.info("Reclaimed pending entries", worker=type(self).__name__, count=len(claimed))
+        return claimed
+
+    def transient(self, error: BaseException) -> bool:
+        """
+        Whether a failed batch should be retried without counting against its
+        entries; override to classify errors of a worker's own dependencies.
+        """
+        return is_transient(error)
+
+    async def _retire_if_poison(self, message_id: str, error: str) -> None:
+        """Dead-letter an entry that failed on its own too many times."""
+        self._failed[message_id] = self._failed.get(message_id, 0) + 1
+        if self._failed[message_id] >= settings.STREAM_MAX_DELIVERIES:
+            del self._failed[message_id]
+            await self.dead_letter(message_id, error)
+
+    async def dead_letter(self, message_id: str, error: str) -> None:
+        """Copy an entry to the stream's dead-letter stream and ACK it."""
+        redis = get_redis_binary()
+        entries = await redis.xrange(self.stream, min=message_id, max=message_id, count=1)
+        if entries:
+            fields = dict(entries[0][1])
+            fields[b"source_id"] = message_id
+            fields[b"error"] = error[:1000]
+            await redis.xadd(
+                f"{self.stream}:dead", fields, maxlen=settings.STREAM_MAX_LENGTH, approximate=True
+            )
+        await self.ack([message_id])
+        logger.error(
+            "Entry moved to dead-letter stream",
+            worker=type(self).__name__,
+            stream=self.stream,
+            message_id=message_id,
+            error=error
+        )
+
+    async def idle(self) -> None:
+        """Hook called when a read returns no messages."""
+        return None
+
+    async def recover(self) -> None:
+        """Hook called after a failed batch, before pending entries are re-read."""
+        return None
@@ -0,0 +1,77 @@
+"""
+Face detection worker.
+Consumes sampled frames, runs YOLOv8-face on the inference engine and
+publishes one face crop per detection for the recognition worker.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import List, Tuple
+
+import structlog
+
+from app.core.config import settings
+from app.core.inference import init_inference, close_inference
+from app.core.redis import stream_add
+from app.core.tracing import mark
+from app.services.faces import FaceAnalyzer, crop_face, decode_image, encode_jpeg
+from app.services.sampling import record_detection_yield
+from app.workers.base import StreamWorker
+
+logger = structlog.get_logger()
+
+
+class DetectionWorker(StreamWorker):
+    """Detects faces in frames from the ingestion stream."""
+
+    stream = settings.STREAM_FRAMES
+    group = "detection"
+
+    async def setup(self) -> None:
+        await super().setup()
+        engine = await init_inference(models=["detection"])
+        self.analyzer = FaceAnalyzer(engine)
+        # Enough frames in flight to keep every detection slot busy
+        self.batch_size = engine.workers * engine.slots_per_worker
+
+    async def teardown(self) -> None:
+        await close_inference()
+        await super().teardown()
+
+    async def handle(self, messages: List[Tuple[str, dict]]) -> None:
+        await asyncio.gather(*(self._process(frame) for _, frame in messages))
+
+    async def _process(self, frame: dict) -> None:
+        camera_id = frame["camera_id"]
+        trace = frame.get("trace")
+        image = decode_image(frame["image"])
+        mark(trace, camera_id, "decode")
+        faces = await self.analyzer.detect(image)
+        detected_at = datetime.utcnow()
+        mark(trace, camera_id, "detect")
+        await record_detection_yield(camera_id, len(faces))
+
+        for box in faces:
+            crop = crop_face(image, box)
+            await stream_add(settings.STREAM_FACES, "face", {
+                "camera_id": camera_id,
+                "frame_id": frame["frame_id"],
+                "captured_at": frame["captured_at"],
+                "detected_at": detected_at,
+                "bbox": box.to_dict(),
+                "detection_confidence": box.confidence,
+                "face": encode_jpeg(crop),
+                "trace": trace
+            }, maxlen=settings.STREAM_MAX_LENGTH)
+
+        if faces:
+            logger.debug(
+                "Faces detected",
+                camera_id=camera_id,
+                frame_id=frame["frame_id"],
+                count=len(faces)
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(DetectionWorker().run())
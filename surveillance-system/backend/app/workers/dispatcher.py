@@ -0,0 +1,154 @@
+"""
+Alert action dispatcher.
+Delivers the webhook, email and SMS jobs queued by the alert engines
+(see app.services.actions).
+
+Jobs are delivered concurrently, up to ACTION_MAX_IN_FLIGHT at a time, and
+an entry is only ACKed once its delivery succeeded or was settled another
+way. Failed deliveries are queued again on the same stream with a later
+`not_before` and one more attempt; entries not yet due are held here
+unACKed, so they survive a restart as pending entries. Jobs for rules with
+`actions.batch` that are due together are sent to their destination in a
+single call of up to ACTION_BATCH_SIZE alerts. After ACTION_MAX_ATTEMPTS
+attempts, or on an error retrying cannot fix, jobs go to
+STREAM_ACTIONS_DEAD.
+"""
+
+import asyncio
+import heapq
+import json
+import time
+from typing import Dict, List, Set, Tuple
+
+import structlog
+
+from app.core.config import settings
+from app.core.redis import stream_add
+from app.services.actions import ActionSender, Delivery, Outcome, backoff
+from app.workers.base import StreamWorker
+
+logger = structlog.get_logger()
+
+
+def _destination(job: dict) -> str:
+    return f"{job['channel']}:{json.dumps(job['target'], sort_keys=True)}"
+
+
+class ActionDispatcher(StreamWorker):
+    """Delivers alert notifications without holding up the alert path."""
+
+    stream = settings.STREAM_ACTIONS
+    group = "dispatch"
+    batch_size = 100
+    auto_ack = False
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.sender = ActionSender()
+        # (due, message id, job) of entries waiting for their retry time
+        self.delayed: List[Tuple[float, str, dict]] = []
+        self.in_flight: Set[asyncio.Task] = set()
+        self._pools_checked = time.monotonic()
+
+    async def teardown(self) -> None:
+        if self.in_flight:
+            # Unfinished deliveries stay pending and are retried after a restart
+            await asyncio.wait(self.in_flight, timeout=settings.WEBHOOK_TIMEOUT)
+        await self.sender.close()
+        await super().teardown()
+
+    async def handle(self, messages: List[Tuple[str, dict]]) -> None:
+        for message_id, job in messages:
+            heapq.heappush(self.delayed, (job.get("not_before") or 0.0, message_id, job))
+        await self.dispatch_due()
+
+    async def idle(self) -> None:
+        await self.dispatch_due()
+        if time.monotonic() - self._pools_checked >= 60:
+            self._pools_checked = time.monotonic()
+            await self.sender.close_idle()
+
+    async def dispatch_due(self) -> None:
+        """Start deliveries for every job whose time has come."""
+        now = time.time()
+        due: List[Tuple[str, dict]] = []
+        while self.delayed and self.delayed[0][0] <= now:
+            _, message_id, job = heapq.heappop(self.delayed)
+            due.append((message_id, job))
+
+        for delivery in self._deliveries(due):
+            while len(self.in_flight) >= settings.ACTION_MAX_IN_FLIGHT:
+                await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+            task = asyncio.create_task(self._deliver(delivery))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    def _deliveries(self, due: List[Tuple[str, dict]]) -> List[Delivery]:
+        """Turn due jobs into requests, merging batchable jobs per destination."""
+        deliveries: List[Delivery] = []
+        batches: Dict[Tuple[str, int], Delivery] = {}
+        for message_id, job in due:
+            attempt = job.get("attempt") or 0
+            key = (_destination(job), attempt)
+            delivery = batches.get(key) if job.get("batch") else None
+            if delivery is None or len(delivery.alerts) + len(job["alerts"]) > settings.ACTION_BATCH_SIZE:
+                delivery = Delivery(job["channel"], job["target"], [], attempt=attempt)
+                deliveries.append(delivery)
+                if job.get("batch"):
+                    batches[key] = delivery
+            delivery.alerts.extend(job["alerts"])
+            delivery.message_ids.append(message_id)
+        return deliveries
+
+    async def _deliver(self, delivery: Delivery) -> None:
+        try:
+            outcome = await self.sender.send(delivery)
+        except Exception as e:
+            outcome = Outcome(ok=False, retry=True, error=str(e))
+
+        try:
+            if not outcome.ok:
+                await self._settle_failure(delivery, outcome)
+            await self.ack(delivery.message_ids)
+        except Exception as e:
+            # Left pending; delivered again after a restart
+            logger.error("Failed to settle action delivery", channel=delivery.channel, error=str(e))
+
+    async def _settle_failure(self, delivery: Delivery, outcome: Outcome) -> None:
+        attempt = delivery.attempt if outcome.deferred else delivery.attempt + 1
+        job = {
+            "channel": delivery.channel,
+            "target": delivery.target,
+            "alerts": delivery.alerts,
+            "batch": len(delivery.alerts) > 1,
+            "attempt": attempt,
+            "error": outcome.error
+        }
+
+        if outcome.retry and attempt < settings.ACTION_MAX_ATTEMPTS:
+            delay = max(outcome.retry_after or 0.0, 0.0 if outcome.deferred else backoff(delivery.attempt))
+            job["not_before"] = time.time() + delay
+            await stream_add(settings.STREAM_ACTIONS, "action", job, maxlen=settings.ACTION_QUEUE_MAX_LENGTH)
+            if not outcome.deferred:
+                logger.warning(
+                    "Action delivery failed, will retry",
+                    channel=delivery.channel,
+                    alerts=len(delivery.alerts),
+                    attempt=attempt,
+                    delay=round(delay, 1),
+                    error=outcome.error
+                )
+            return
+
+        await stream_add(settings.STREAM_ACTIONS_DEAD, "action", job, maxlen=settings.ACTION_QUEUE_MAX_LENGTH)
+        logger.error(
+            "Action delivery abandoned",
+            channel=delivery.channel,
+            alerts=len(delivery.alerts),
+            attempts=attempt,
+            error=outcome.error
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(ActionDispatcher().run())
@@ -0,0 +1,257 @@
+"""
+Stream ingestion worker.
+Decodes camera streams with FFmpeg and publishes sampled JPEG frames to the
+frames stream at each camera's current adaptive sample rate. Replicas share
+the cameras through `app.services.scheduler`.
+"""
+
+import asyncio
+import signal
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from sqlalchemy import select, update
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, close_db
+from app.core.redis import init_redis, close_redis, get_redis, stream_add
+from app.core.tracing import new_trace
+from app.models.camera import Camera
+from app.services.sampling import SampleRates, rate_bounds
+from app.services.scheduler import CHANGES_CHANNEL, CameraScheduler
+
+logger = structlog.get_logger()
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+
+
+class CameraReader:
+    """Reads one camera through an FFmpeg subprocess and samples its frames."""
+
+    def __init__(self, camera_id: str, rtsp_url: str, stream_config: Optional[Dict[str, Any]], rates: SampleRates):
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.stream_config = stream_config or {}
+        self.rates = rates
+        self.frames_sent = 0
+        self._last_sample = 0.0
+        self._last_health = 0.0
+
+    def ffmpeg_args(self) -> list:
+        """FFmpeg command emitting MJPEG frames at the camera's max sample rate."""
+        _, max_rate = rate_bounds(self.stream_config)
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        if self.rtsp_url.startswith("rtsp://"):
+            args += ["-rtsp_transport", "tcp"]
+        return args + [
+            "-i", self.rtsp_url,
+            "-an",
+            "-vf", f"fps={max_rate}",
+            "-f", "image2pipe",
+            "-c:v", "mjpeg",
+            "-q:v", "5",
+            "pipe:1"
+        ]
+
+    async def run(self) -> None:
+        """Read until cancelled, reconnecting with exponential backoff."""
+        attempts = 0
+        while True:
+            started = time.monotonic()
+            try:
+                code = await self._read_stream()
+                logger.warning("Camera stream ended", camera_id=self.camera_id, code=code)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Camera stream failed", camera_id=self.camera_id, error=str(e))
+
+            # A stream that ran for a while counts as a fresh start
+            if time.monotonic() - started > 60:
+                attempts = 0
+            attempts += 1
+            await self._set_health("disconnected" if attempts <= settings.STREAM_RECONNECT_ATTEMPTS else "error")
+
+            delay = settings.STREAM_RECONNECT_DELAY * 2 ** min(attempts - 1, 6)
+            logger.info("Reconnecting camera", camera_id=self.camera_id, attempt=attempts, delay=delay)
+            await asyncio.sleep(delay)
+
+    async def _read_stream(self) -> int:
+        """Forward frames until FFmpeg exits; returns its exit code."""
+        process = await asyncio.create_subprocess_exec(
+            *self.ffmpeg_args(),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        buffer = bytearray()
+        try:
+            while True:
+                chunk = await process.stdout.read(65536)
+                if not chunk:
+                    return await process.wait()
+                buffer += chunk
+
+                while True:
+                    start = buffer.find(JPEG_START)
+                    end = buffer.find(JPEG_END, start + 2) if start >= 0 else -1
+                    if end < 0:
+                        break
+                    frame = bytes(buffer[start:end + 2])
+                    del buffer[:end + 2]
+                    await self.on_frame(frame)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def on_frame(self, frame: bytes) -> None:
+        """Forward the frame if it is due under the current sample rate."""
+        now = time.monotonic()
+        rate = self.rates.get(self.camera_id, self.stream_config)
+        if now - self._last_sample < 1.0 / rate:
+            return
+        self._last_sample = now
+
+        await self.publish(frame)
+
+        if now - self._last_health >= settings.STREAM_HEALTH_INTERVAL:
+            self._last_health = now
+            await self._set_health("healthy")
+
+    async def publish(self, frame: bytes) -> None:
+        """Add a JPEG frame to the frames stream."""
+        await stream_add(settings.STREAM_FRAMES, "frame", {
+            "camera_id": self.camera_id,
+            "frame_id": str(uuid4()),
+            "captured_at": datetime.utcnow(),
+            "image": frame,
+            "trace": new_trace()
+        }, maxlen=settings.STREAM_MAX_LENGTH)
+        self.frames_sent += 1
+
+    async def _set_health(self, status: str) -> None:
+        values = {"health_status": status}
+        if status == "healthy":
+            values["last_frame_at"] = datetime.utcnow()
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(Camera).where(Camera.camera_id == self.camera_id).values(**values)
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning("Failed to update camera health", camera_id=self.camera_id, error=str(e))
+
+
+class IngestionWorker:
+    """
+    Runs a `CameraReader` for every active camera leased to this replica.
+    Cameras are spread over replicas by `CameraScheduler`.
+    """
+
+    def __init__(self):
+        self.rates = SampleRates()
+        self.scheduler = CameraScheduler()
+        self.readers: Dict[str, asyncio.Task] = {}
+        self._configs: Dict[str, tuple] = {}
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    async def _active_cameras(self) -> Dict[str, tuple]:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Camera.camera_id, Camera.rtsp_url, Camera.stream_config)
+                .where(Camera.is_active == True)
+            )
+            return {
+                str(row.camera_id): (row.rtsp_url, row.stream_config)
+                for row in result
+            }
+
+    async def sync_cameras(self, cameras: Dict[str, tuple]) -> None:
+        """Start, restart or stop readers to match the given cameras."""
+        stopped = []
+        for camera_id in list(self.readers):
+            if cameras.get(camera_id) != self._configs.get(camera_id):
+                task = self.readers.pop(camera_id)
+                task.cancel()
+                stopped.append(task)
+                self._configs.pop(camera_id, None)
+                logger.info("Camera reader stopped", camera_id=camera_id)
+        # Make sure FFmpeg is gone before the camera's lease is handed over
+        await asyncio.gather(*stopped, return_exceptions=True)
+
+        for camera_id, (rtsp_url, stream_config) in cameras.items():
+            if camera_id not in self.readers:
+                reader = CameraReader(camera_id, rtsp_url, stream_config, self.rates)
+                self.readers[camera_id] = asyncio.create_task(reader.run())
+                self._configs[camera_id] = (rtsp_url, stream_config)
+                logger.info("Camera reader started", camera_id=camera_id)
+
+    async def schedule(self) -> None:
+        """One scheduling round: stop what moved away, then claim and start."""
+        cameras = await self._active_cameras()
+        mine = await self.scheduler.assign({
+            camera_id: stream_config for camera_id, (_, stream_config) in cameras.items()
+        })
+        await self.sync_cameras({
+            camera_id: cameras[camera_id]
+            for camera_id in self.readers
+            if camera_id in mine and camera_id in self.scheduler.leases
+        })
+        leased = await self.scheduler.claim(mine)
+        await self.sync_cameras({camera_id: cameras[camera_id] for camera_id in leased})
+
+    async def _watch_changes(self) -> None:
+        """Wake the scheduling loop on camera edits and lease releases."""
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(CHANGES_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._wake.set()
+        finally:
+            await pubsub.unsubscribe(CHANGES_CHANNEL)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        await init_redis()
+        await self.rates.start()
+        watcher = asyncio.create_task(self._watch_changes())
+        logger.info("Ingestion worker started", worker_id=self.scheduler.worker_id)
+        try:
+            while not self._stopping.is_set():
+                self._wake.clear()
+                try:
+                    await self.schedule()
+                except Exception as e:
+                    logger.error("Failed to schedule cameras", error=str(e))
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=settings.SCHEDULER_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            watcher.cancel()
+            await self.sync_cameras({})
+            try:
+                await self.scheduler.leave()
+            except Exception as e:
+                logger.warning("Failed to release camera leases", error=str(e))
+            await self.rates.stop()
+            await close_db()
+            await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(IngestionWorker().run())
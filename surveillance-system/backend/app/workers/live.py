@@ -0,0 +1,294 @@
+"""
+Live view relay worker.
+Pulls every camera someone is watching exactly once and remuxes it into the
+LL-HLS parts and playlists the API serves; see app.services.live. Replicas
+share the cameras through per-camera leases, so a camera that only accepts
+a few concurrent sessions is never opened more than once for viewers,
+however many are watching.
+
+Any FFmpeg input works as a camera URL, so the relay can be tried without a
+camera: a camera whose rtsp_url is a local file path is played in real
+time, looped.
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import select
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, close_db
+from app.core.redis import init_redis, close_redis, get_redis, get_redis_binary
+from app.models.camera import Camera
+from app.services.live import (
+    LEASE_PREFIX,
+    VIEWERS_KEY,
+    LivePlaylist,
+    Track,
+    init_key,
+    media_ttl,
+    parse_fragment,
+    parse_init,
+    segment_key,
+    state_key,
+)
+from app.services.scheduler import RELEASE_SCRIPT, RENEW_SCRIPT
+
+logger = structlog.get_logger()
+
+POLL_INTERVAL = 1.0
+
+
+async def read_box(stream: asyncio.StreamReader) -> Optional[bytes]:
+    """The next whole MP4 box from FFmpeg's output, or None at the end."""
+    try:
+        header = await stream.readexactly(8)
+        size = struct.unpack(">I", header[:4])[0]
+        if size == 1:
+            header += await stream.readexactly(8)
+            size = struct.unpack(">Q", header[8:])[0]
+        elif size == 0:
+            return header + await stream.read()
+        return header + await stream.readexactly(size - len(header))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class CameraRelay:
+    """Remuxes one camera into its LL-HLS parts until cancelled."""
+
+    def __init__(self, camera_id: str, url: str):
+        self.camera_id = camera_id
+        self.url = url
+        self.generation = str(int(time.time() * 1000))
+        self.playlist = LivePlaylist(self.generation)
+
+    def ffmpeg_args(self) -> list:
+        """FFmpeg command copying the video track into fragmented MP4."""
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        if self.url.startswith("rtsp://"):
+            args += ["-rtsp_transport", "tcp"]
+        elif "://" not in self.url:
+            # A local file stands in for a camera
+            args += ["-re", "-stream_loop", "-1"]
+        return args + [
+            "-i", self.url,
+            "-map", "0:v:0",
+            "-c", "copy",
+            "-f", "mp4",
+            # A fragment at every keyframe and at least every part duration
+            "-movflags", "empty_moov+default_base_moof+frag_keyframe",
+            "-frag_duration", str(int(settings.LIVE_PART_SECONDS * 1000000)),
+            "pipe:1"
+        ]
+
+    async def run(self) -> None:
+        """Relay until cancelled, reconnecting with exponential backoff."""
+        attempts = 0
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    code = await self._relay()
+                    logger.warning("Live upstream ended", camera_id=self.camera_id, code=code)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Live upstream failed", camera_id=self.camera_id, error=str(e))
+
+                if time.monotonic() - started > 60:
+                    attempts = 0
+                attempts += 1
+                self.playlist.new_run()
+                delay = settings.STREAM_RECONNECT_DELAY * 2 ** min(attempts - 1, 6)
+                await asyncio.sleep(delay)
+        finally:
+            await self._clear()
+
+    async def _relay(self) -> int:
+        """Publish parts until FFmpeg exits; returns its exit code."""
+        process = await asyncio.create_subprocess_exec(
+            *self.ffmpeg_args(),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        init = b""
+        track: Optional[Track] = None
+        moof: Optional[bytes] = None
+        try:
+            while True:
+                box = await read_box(process.stdout)
+                if box is None:
+                    return await process.wait()
+                kind = box[4:8]
+                if track is None:
+                    # ftyp and moov
+                    init += box
+                    if kind == b"moov":
+                        track = parse_init(init)
+                        await self._publish_init(init)
+                elif kind == b"moof":
+                    moof = box
+                elif kind == b"mdat" and moof is not None:
+                    await self._publish_part(moof + box, track)
+                    moof = None
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def _publish_init(self, init: bytes) -> None:
+        key = init_key(self.camera_id, self.generation, self.playlist.run)
+        await get_redis_binary().set(key, init, ex=media_ttl(self.playlist.target_duration))
+
+    async def _publish_part(self, fragment: bytes, track: Track) -> None:
+        duration, independent = parse_fragment(fragment, track)
+        position, dropped = self.playlist.add(duration, independent)
+        if position is None:
+            return
+        msn, _ = position
+        ttl = media_ttl(self.playlist.target_duration)
+        # The edge is only published with a playlist, so an API request that
+        # sees one can count on the other
+        playlist = self.playlist.render()
+
+        pipe = get_redis_binary().pipeline(transaction=True)
+        key = segment_key(self.camera_id, self.generation, msn)
+        pipe.rpush(key, fragment)
+        pipe.expire(key, ttl)
+        for run in {segment.run for segment in self.playlist.segments}:
+            pipe.expire(init_key(self.camera_id, self.generation, run), ttl)
+        for old in dropped:
+            pipe.delete(segment_key(self.camera_id, self.generation, old))
+        if playlist:
+            pipe.hset(state_key(self.camera_id), mapping={**self.playlist.edge(), "playlist": playlist})
+            pipe.expire(state_key(self.camera_id), ttl)
+        await pipe.execute()
+
+    async def _clear(self) -> None:
+        keys = [state_key(self.camera_id)]
+        keys += [segment_key(self.camera_id, self.generation, segment.msn) for segment in self.playlist.segments]
+        keys += [init_key(self.camera_id, self.generation, run) for run in range(self.playlist.run + 1)]
+        try:
+            await get_redis().delete(*keys)
+        except Exception as e:
+            logger.warning("Failed to clear live relay", camera_id=self.camera_id, error=str(e))
+
+
+class LiveWorker:
+    """Runs a `CameraRelay` for every watched camera leased to this replica."""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.relays: Dict[str, asyncio.Task] = {}
+        self.lease_ttl_ms = int(settings.SCHEDULER_LEASE_TTL * 1000)
+
+    async def _watched(self) -> Set[str]:
+        """Cameras whose playlist was fetched within the idle grace period."""
+        redis = get_redis()
+        cutoff = time.time() - settings.LIVE_IDLE_GRACE
+        await redis.zremrangebyscore(VIEWERS_KEY, "-inf", f"({cutoff}")
+        return set(await redis.zrangebyscore(VIEWERS_KEY, cutoff, "+inf"))
+
+    async def sync(self) -> None:
+        """Stop relays nobody watches, keep the rest and pick up new cameras."""
+        watched = await self._watched()
+        await self._stop([camera_id for camera_id in self.relays if camera_id not in watched])
+        await self._renew()
+        await self._start(watched - self.relays.keys())
+
+    async def _start(self, camera_ids: Set[str]) -> None:
+        if not camera_ids:
+            return
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Camera.camera_id, Camera.rtsp_url)
+                .where(Camera.camera_id.in_([UUID(camera_id) for camera_id in camera_ids]), Camera.is_active == True)
+            )
+            urls = {str(row.camera_id): row.rtsp_url for row in result}
+        unknown = camera_ids - urls.keys()
+        if unknown:
+            await get_redis().zrem(VIEWERS_KEY, *unknown)
+
+        redis = get_redis()
+        for camera_id, url in urls.items():
+            if await redis.set(LEASE_PREFIX + camera_id, self.worker_id, nx=True, px=self.lease_ttl_ms):
+                relay = CameraRelay(camera_id, url)
+                self.relays[camera_id] = asyncio.create_task(relay.run())
+                logger.info("Live relay started", camera_id=camera_id, generation=relay.generation)
+
+    async def _stop(self, camera_ids: List[str]) -> None:
+        """Stop the relays, then hand their leases back."""
+        if not camera_ids:
+            return
+        tasks = [self.relays.pop(camera_id) for camera_id in camera_ids]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await get_redis().eval(
+            RELEASE_SCRIPT,
+            len(camera_ids),
+            *[LEASE_PREFIX + camera_id for camera_id in camera_ids],
+            self.worker_id
+        )
+        logger.info("Live relays stopped", cameras=camera_ids)
+
+    async def _renew(self) -> None:
+        if not self.relays:
+            return
+        lost = await get_redis().eval(
+            RENEW_SCRIPT,
+            len(self.relays),
+            *[LEASE_PREFIX + camera_id for camera_id in self.relays],
+            self.worker_id,
+            self.lease_ttl_ms
+        )
+        for key in lost:
+            camera_id = key[len(LEASE_PREFIX):]
+            logger.warning("Live relay lease lost", worker_id=self.worker_id, camera_id=camera_id)
+            task = self.relays.pop(camera_id)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def run(self, stopping: asyncio.Event) -> None:
+        logger.info("Live relay worker started", worker_id=self.worker_id)
+        try:
+            while not stopping.is_set():
+                try:
+                    await self.sync()
+                except Exception as e:
+                    logger.error("Failed to sync live relays", error=str(e))
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            try:
+                await self._stop(list(self.relays))
+            except Exception as e:
+                logger.warning("Failed to release live relay leases", error=str(e))
+
+
+async def main() -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await init_redis()
+    try:
+        await LiveWorker().run(stopping)
+    finally:
+        await close_db()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
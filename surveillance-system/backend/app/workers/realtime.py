@@ -0,0 +1,98 @@
+"""
+Realtime relay process.
+Reads the alert and detection feeds that Socket.IO clients follow and
+emits each entry once to its room; see app.services.realtime. Run a
+single instance: a second one would deliver everything twice.
+
+A feed that gains followers is read from a few seconds back, so entries
+added between a client's replay and the relay noticing the room are not
+lost; clients drop messages with an id they have already seen.
+"""
+
+import asyncio
+import signal
+import time
+from typing import Dict
+
+import socketio
+import structlog
+
+from app.core.config import settings
+from app.core.redis import init_redis, close_redis, get_redis, get_redis_binary
+from app.services.realtime import EVENT, ROOMS_KEY, feed_frame, feed_namespace, feed_room, room_feed
+
+logger = structlog.get_logger()
+
+READ_COUNT = 200
+BLOCK_MS = 1000
+# How far back a newly followed feed is read
+FOLLOW_BACK_MS = 5000
+
+
+class FeedRelay:
+    """Emits feed entries to the Socket.IO rooms following them."""
+
+    def __init__(self):
+        self.emitter = socketio.AsyncRedisManager(settings.REDIS_URL, write_only=True)
+        # Feed -> id of the last entry emitted
+        self.cursors: Dict[str, str] = {}
+
+    async def run(self, stopping: asyncio.Event) -> None:
+        while not stopping.is_set():
+            try:
+                rooms = await self._rooms()
+                self._follow(rooms)
+                if not self.cursors:
+                    try:
+                        await asyncio.wait_for(stopping.wait(), timeout=BLOCK_MS / 1000)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                response = await get_redis_binary().xread(dict(self.cursors), count=READ_COUNT, block=BLOCK_MS)
+                for name, entries in response or []:
+                    feed = name.decode()
+                    for entry_id, fields in entries:
+                        self.cursors[feed] = entry_id.decode()
+                        await self._emit(feed, self.cursors[feed], fields, rooms)
+            except Exception as e:
+                logger.error("Realtime relay failed", error=str(e))
+                await asyncio.sleep(1)
+
+    async def _rooms(self) -> Dict[str, int]:
+        counts = await get_redis().hgetall(ROOMS_KEY)
+        return {room: int(count) for room, count in counts.items() if int(count) > 0}
+
+    def _follow(self, rooms: Dict[str, int]) -> None:
+        """Start reading feeds that gained followers; drop the rest."""
+        feeds = {room_feed(room) for room in rooms} - {None}
+        since = f"{int(time.time() * 1000) - FOLLOW_BACK_MS}-0"
+        for feed in feeds - self.cursors.keys():
+            self.cursors[feed] = since
+        for feed in self.cursors.keys() - feeds:
+            del self.cursors[feed]
+
+    async def _emit(self, feed: str, entry_id: str, fields: dict, rooms: Dict[str, int]) -> None:
+        for binary in (False, True):
+            room = feed_room(feed, binary)
+            if room not in rooms:
+                continue
+            frame = feed_frame(entry_id, fields, binary)
+            if frame is not None:
+                await self.emitter.emit(EVENT, frame, room=room, namespace=feed_namespace(feed))
+
+
+async def main() -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await init_redis()
+    try:
+        await FeedRelay().run(stopping)
+    finally:
+        await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
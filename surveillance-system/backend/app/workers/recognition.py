@@ -0,0 +1,102 @@
+"""
+Face recognition worker.
+Embeds detected faces with ArcFace, matches them against enrolled subjects
+with pgvector and records the resulting sightings in batches.
+"""
+
+import asyncio
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, close_db
+from app.core.inference import init_inference, close_inference
+from app.core.tracing import mark
+from app.services.faces import FaceAnalyzer, decode_image, embedding_literal
+from app.services.sighting_writer import SightingWriter, new_sighting, sighting_id
+from app.workers.base import StreamWorker
+
+logger = structlog.get_logger()
+
+
+class RecognitionWorker(StreamWorker):
+    """
+    Turns detected faces into sightings.
+    Sightings are written behind through `SightingWriter`; face entries stay
+    pending until the flush holding their sighting has committed and reached
+    STREAM_SIGHTINGS.
+    """
+
+    stream = settings.STREAM_FACES
+    group = "recognition"
+    batch_size = settings.RECOGNITION_BATCH_SIZE
+    auto_ack = False
+
+    async def setup(self) -> None:
+        await super().setup()
+        self.analyzer = FaceAnalyzer(await init_inference(models=["recognition"]))
+        self.writer = SightingWriter()
+
+    async def teardown(self) -> None:
+        try:
+            await self.ack(await self.writer.flush())
+        except Exception as e:
+            logger.error("Failed to flush sightings on shutdown", count=len(self.writer), error=str(e))
+        await close_inference()
+        await close_db()
+        await super().teardown()
+
+    async def handle(self, messages: List[Tuple[str, dict]]) -> None:
+        faces = [decode_image(face["face"]) for _, face in messages]
+        embeddings = await self.analyzer.embed(faces)
+        for _, face in messages:
+            mark(face.get("trace"), face["camera_id"], "embed")
+
+        async with AsyncSessionLocal() as session:
+            for (message_id, face), embedding in zip(messages, embeddings):
+                match = await self._match(session, embedding)
+                mark(face.get("trace"), face["camera_id"], "search")
+                sighting = new_sighting(
+                    sighting_id=sighting_id(self.stream, message_id),
+                    subject_id=match[0] if match else None,
+                    camera_id=UUID(face["camera_id"]),
+                    detection_confidence=face["detection_confidence"],
+                    recognition_confidence=match[1] if match else None,
+                    match_distance=1 - match[1] if match else None,
+                    scene_analysis={"bbox": face["bbox"]},
+                    detected_at=face["captured_at"]
+                )
+                self.writer.add(message_id, sighting, embedding, face.get("trace"))
+
+        if self.writer.due():
+            await self.ack(await self.writer.flush())
+
+    async def idle(self) -> None:
+        # Nothing else is arriving, so there is no batch worth waiting for
+        await self.ack(await self.writer.flush())
+
+    async def recover(self) -> None:
+        # Buffered entries are still pending and will be read again
+        self.writer.discard()
+
+    async def _match(self, session, embedding) -> Optional[Tuple[UUID, float]]:
+        """Best matching subject above RECOGNITION_THRESHOLD, as (subject_id, similarity)."""
+        result = await session.execute(
+            text(
+                "SELECT subject_id, similarity FROM "
+                "search_subjects_by_face(CAST(:embedding AS vector), :threshold, 1)"
+            ),
+            {
+                "embedding": embedding_literal(embedding),
+                "threshold": settings.RECOGNITION_THRESHOLD
+            }
+        )
+        row = result.fetchone()
+        return (row.subject_id, float(row.similarity)) if row else None
+
+
+if __name__ == "__main__":
+    asyncio.run(RecognitionWorker().run())
@@ -0,0 +1,304 @@
+"""
+Offline replay of recorded footage through the pipeline.
+
+Local video files and image directories are registered as inactive
+pseudo-cameras (so ingestion replicas never pick them up) and their frames
+are fed into the frames stream exactly like live ones, either paced in real
+time or as fast as the pipeline drains them. When everything has been
+processed a throughput and latency report per stage is printed:
+
+    python -m app.workers.replay /recordings/lobby.mp4 /recordings/door/ --fps 5
+
+Latencies are measured from frame capture to the end of each stage.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+import structlog
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, close_db
+from app.core.redis import init_redis, close_redis, stream_read
+from app.models.alert import AlertLog
+from app.models.camera import Camera
+from app.models.sighting import Sighting
+from app.services.faces import decode_image, encode_jpeg
+from app.services.sampling import pipeline_backlog
+from app.workers.ingestion import CameraReader
+
+logger = structlog.get_logger()
+
+REPLAY_LOCATION = "replay"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+class ReplayReader(CameraReader):
+    """Reads one recording instead of a live stream."""
+
+    def __init__(self, camera_id: str, source: Path, fps: float, realtime: bool, max_backlog: int):
+        super().__init__(camera_id, str(source), {"fps": fps}, rates=None)
+        self.source = source
+        self.fps = fps
+        self.realtime = realtime
+        self.max_backlog = max_backlog
+
+    def ffmpeg_args(self) -> list:
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+        if self.realtime:
+            args.append("-re")
+        return args + [
+            "-i", self.rtsp_url,
+            "-an",
+            "-vf", f"fps={self.fps}",
+            "-f", "image2pipe",
+            "-c:v", "mjpeg",
+            "-q:v", "5",
+            "pipe:1"
+        ]
+
+    async def run(self) -> None:
+        """Replay the source once."""
+        if self.source.is_dir():
+            await self._read_images()
+            return
+        code = await self._read_stream()
+        if code != 0:
+            raise RuntimeError(f"ffmpeg exited with code {code} for {self.source}")
+
+    async def _read_images(self) -> None:
+        paths = sorted(p for p in self.source.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        started = time.monotonic()
+        for index, path in enumerate(paths):
+            if self.realtime:
+                delay = started + index / self.fps - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            data = path.read_bytes()
+            if path.suffix.lower() not in (".jpg", ".jpeg"):
+                data = encode_jpeg(decode_image(data))
+            await self.on_frame(data)
+
+    async def on_frame(self, frame: bytes) -> None:
+        """Forward every frame; FFmpeg or the image list already set the rate."""
+        if not self.realtime:
+            await self._throttle()
+        await self.publish(frame)
+
+    async def _throttle(self) -> None:
+        # The streams are capped, so outrunning the workers would drop frames
+        if self.frames_sent % 25:
+            return
+        while await pipeline_backlog() > self.max_backlog:
+            await asyncio.sleep(0.1)
+
+
+class StageStats:
+    """Completions and capture-to-completion latencies of one stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.latencies: List[float] = []
+
+    def record(self, latency: Optional[float] = None) -> None:
+        self.count += 1
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "count": self.count,
+            "per_second": round(self.count / elapsed, 2) if elapsed > 0 else 0.0
+        }
+        if self.latencies:
+            values = np.array(self.latencies) * 1000
+            report.update({
+                "p50_ms": round(float(np.percentile(values, 50)), 1),
+                "p95_ms": round(float(np.percentile(values, 95)), 1),
+                "p99_ms": round(float(np.percentile(values, 99)), 1),
+                "max_ms": round(float(values.max()), 1)
+            })
+        return report
+
+
+def _parse_time(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _entry_time(message_id: str) -> datetime:
+    """Time Redis accepted a stream entry, from its id."""
+    return datetime.fromtimestamp(int(message_id.split("-")[0]) / 1000, tz=timezone.utc)
+
+
+class ReplayRun:
+    """Feeds recordings through the pipeline and measures each stage."""
+
+    def __init__(self, sources: List[Path], fps: float, realtime: bool, max_backlog: int, drain_timeout: float):
+        self.sources = sources
+        self.fps = fps
+        self.realtime = realtime
+        self.max_backlog = max_backlog
+        self.drain_timeout = drain_timeout
+        self.cameras: Dict[str, Path] = {}
+        self.stages = {name: StageStats(name) for name in ("ingest", "detect", "record", "alert")}
+
+    async def register_cameras(self) -> None:
+        """Reuse or create one inactive pseudo-camera per source."""
+        async with AsyncSessionLocal() as session:
+            for source in self.sources:
+                path = str(source.resolve())
+                result = await session.execute(
+                    select(Camera).where(Camera.rtsp_url == path, Camera.location == REPLAY_LOCATION)
+                )
+                camera = result.scalars().first()
+                if camera is None:
+                    camera = Camera(
+                        name=f"Replay: {source.name}",
+                        location=REPLAY_LOCATION,
+                        rtsp_url=path,
+                        stream_config={"protocol": "file", "fps": self.fps},
+                        is_active=False
+                    )
+                    session.add(camera)
+                    await session.flush()
+                self.cameras[str(camera.camera_id)] = source
+            await session.commit()
+
+    async def _tail(self, stream: str, stage: StageStats, handler) -> None:
+        """Record entries of replayed cameras as they appear on a stream."""
+        last_id = "$"
+        while True:
+            for _, entries in await stream_read(stream, count=500, block=1000, last_id=last_id):
+                for message_id, payload in entries:
+                    last_id = message_id
+                    if payload:
+                        handler(stage, message_id, payload)
+
+    def _on_face(self, stage: StageStats, message_id: str, face: Dict[str, Any]) -> None:
+        if face["camera_id"] in self.cameras:
+            stage.record((face["detected_at"] - face["captured_at"]).total_seconds())
+
+    def _on_sighting(self, stage: StageStats, message_id: str, payload: Dict[str, Any]) -> None:
+        sighting = payload["sighting"]
+        if sighting.get("camera_id") in self.cameras:
+            # Sighting entries are added right after the flush that wrote them commits
+            written = _entry_time(message_id)
+            stage.record((written - _parse_time(sighting["detected_at"])).total_seconds())
+
+    async def _drain(self) -> None:
+        """Wait until the detection and recognition groups have caught up."""
+        deadline = time.monotonic() + self.drain_timeout
+        idle_checks = 0
+        while time.monotonic() < deadline and idle_checks < 3:
+            idle_checks = idle_checks + 1 if await pipeline_backlog() == 0 else 0
+            await asyncio.sleep(max(1.0, settings.SIGHTING_FLUSH_INTERVAL))
+        if idle_checks < 3:
+            logger.warning("Pipeline did not drain before timeout", timeout=self.drain_timeout)
+
+    async def _collect_alerts(self, started_at: datetime) -> None:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(AlertLog.created_at, Sighting.detected_at)
+                .join(Sighting, Sighting.sighting_id == AlertLog.sighting_id)
+                .where(AlertLog.camera_id.in_(list(self.cameras)))
+                .where(AlertLog.created_at >= started_at)
+            )
+            for created_at, detected_at in result:
+                self.stages["alert"].record((_parse_time(created_at) - _parse_time(detected_at)).total_seconds())
+
+    async def run(self) -> Dict[str, Any]:
+        await self.register_cameras()
+        started_at = datetime.now(timezone.utc)
+        started = time.monotonic()
+
+        tails = [
+            asyncio.create_task(self._tail(settings.STREAM_FACES, self.stages["detect"], self._on_face)),
+            asyncio.create_task(self._tail(settings.STREAM_SIGHTINGS, self.stages["record"], self._on_sighting))
+        ]
+        readers = [
+            ReplayReader(camera_id, source, self.fps, self.realtime, self.max_backlog)
+            for camera_id, source in self.cameras.items()
+        ]
+        try:
+            results = await asyncio.gather(*(reader.run() for reader in readers), return_exceptions=True)
+            for reader, result in zip(readers, results):
+                if isinstance(result, Exception):
+                    logger.error("Replay source failed", source=str(reader.source), error=str(result))
+                self.stages["ingest"].count += reader.frames_sent
+            ingest_elapsed = time.monotonic() - started
+            await self._drain()
+        finally:
+            for task in tails:
+                task.cancel()
+            await asyncio.gather(*tails, return_exceptions=True)
+
+        await self._collect_alerts(started_at)
+        elapsed = time.monotonic() - started
+
+        return {
+            "mode": "realtime" if self.realtime else "fast",
+            "sources": {camera_id: str(source) for camera_id, source in self.cameras.items()},
+            "elapsed_seconds": round(elapsed, 2),
+            "stages": {
+                # Ingest throughput is measured while frames were being fed only
+                name: stage.summary(ingest_elapsed if name == "ingest" else elapsed)
+                for name, stage in self.stages.items()
+            }
+        }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Replay ({report['mode']}) of {len(report['sources'])} source(s) in {report['elapsed_seconds']}s")
+    print(f"  {'stage':<8} {'count':>8} {'per sec':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stage in report["stages"].items():
+        latencies = " ".join(
+            f"{stage[key]:>9.1f}" if key in stage else f"{'-':>9}"
+            for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")
+        )
+        print(f"  {name:<8} {stage['count']:>8} {stage['per_second']:>9.2f} {latencies}")
+
+
+async def _main(args: argparse.Namespace) -> None:
+    await init_redis()
+    try:
+        replay = ReplayRun(
+            [Path(source) for source in args.sources],
+            fps=args.fps,
+            realtime=args.realtime,
+            max_backlog=args.max_backlog,
+            drain_timeout=args.drain_timeout
+        )
+        report = await replay.run()
+    finally:
+        await close_db()
+        await close_redis()
+
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded video through the pipeline")
+    parser.add_argument("sources", nargs="+", help="Video files or directories of images")
+    parser.add_argument("--fps", type=float, default=float(settings.STREAM_FRAME_SAMPLE_RATE),
+                        help="Frames per second taken from each source")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Pace sources at recorded speed instead of as fast as possible")
+    parser.add_argument("--max-backlog", type=int, default=settings.STREAM_MAX_LENGTH // 2,
+                        help="Pipeline backlog at which fast mode waits")
+    parser.add_argument("--drain-timeout", type=float, default=60.0,
+                        help="Seconds to wait for the pipeline to catch up after the last frame")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,30 @@
+"""
+Frame sampling controller process.
+Publishes per-camera sample rates derived from detection yield and
+pipeline backlog; see app.services.sampling.
+"""
+
+import asyncio
+import signal
+
+from app.core.database import close_db
+from app.core.redis import init_redis, close_redis
+from app.services.sampling import SamplingController
+
+
+async def main() -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await init_redis()
+    try:
+        await SamplingController().run(stopping)
+    finally:
+        await close_db()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Action delivery against a local stub HTTP server."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.actions import ActionSender, Delivery
+from app.workers import dispatcher
+from app.workers.dispatcher import ActionDispatcher
+
+
+class StubServer:
+    """Answers each POST with the next scripted (status, headers) and keeps the bodies."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.bodies = []
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/hook"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        # httpx keeps the connection open between requests
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            length = 0
+            for line in head.decode().split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            self.bodies.append(json.loads(await reader.readexactly(length)))
+            status, headers = self.responses.pop(0)
+            lines = [f"HTTP/1.1 {status} Stub", "Content-Length: 0"] + [f"{k}: {v}" for k, v in headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+            await writer.drain()
+        writer.close()
+
+
+def _alert(n):
+    return {"alert_id": str(n), "rule_name": "Door", "rule_type": "blacklist", "priority": 5}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status, retry", [(500, True), (503, True), (408, True), (429, True), (400, False), (404, False)])
+async def test_failed_statuses_retry_only_when_worth_it(status, retry):
+    async with StubServer([(status, {})]) as stub, ActionSender() as sender:
+        outcome = await sender.send(Delivery("webhook", stub.url, [_alert(1)]))
+    assert not outcome.ok
+    assert outcome.retry is retry
+    assert outcome.error == f"HTTP {status}"
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured(monkeypatch):
+    async with StubServer([(429, {"Retry-After": "30"}), (200, {})]) as stub, ActionSender() as sender:
+        throttled = await sender.send(Delivery("webhook", stub.url, [_alert(1)]))
+        delivered = await sender.send(Delivery("webhook", stub.url, [_alert(1)]))
+    assert throttled.retry and throttled.retry_after == 30.0
+    assert delivered.ok
+
+    requeued = []
+
+    async def stream_add(stream, kind, job, maxlen=None):
+        requeued.append((stream, job))
+
+    monkeypatch.setattr(dispatcher, "stream_add", stream_add)
+    await ActionDispatcher()._settle_failure(Delivery("webhook", stub.url, [_alert(1)]), throttled)
+    (stream, job), = requeued
+    assert stream == settings.STREAM_ACTIONS
+    assert job["attempt"] == 1
+    # The destination's wait wins over the shorter backoff
+    assert job["not_before"] >= time.time() + 29
+
+
+@pytest.mark.asyncio
+async def test_batched_jobs_go_out_in_one_call():
+    engine = ActionDispatcher()
+    jobs = [
+        (f"1-{n}", {"channel": "webhook", "target": "http://127.0.0.1/hook", "alerts": [_alert(n)], "batch": True})
+        for n in range(settings.ACTION_BATCH_SIZE + 1)
+    ]
+    jobs.append(("2-0", {"channel": "webhook", "target": "http://127.0.0.1/hook", "alerts": [_alert(99)], "batch": False}))
+    deliveries = engine._deliveries(jobs)
+    assert [len(delivery.alerts) for delivery in deliveries] == [settings.ACTION_BATCH_SIZE, 1, 1]
+    assert deliveries[0].message_ids == [f"1-{n}" for n in range(settings.ACTION_BATCH_SIZE)]
+
+    async with StubServer([(200, {})]) as stub, ActionSender() as sender:
+        deliveries[0].target = stub.url
+        assert (await sender.send(deliveries[0])).ok
+    body, = stub.bodies
+    assert body["type"] == "alerts"
+    assert len(body["data"]) == settings.ACTION_BATCH_SIZE
@@ -0,0 +1,21 @@
+"""Bulk alert operations refuse selections that would match every alert."""
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints.alerts import _bulk_update
+from app.schemas.alert import AlertBulkRequest
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body", [
+    {},
+    {"filter": {}},
+    {"alert_ids": []},
+    {"alert_ids": [], "filter": {}},
+])
+async def test_bulk_update_refuses_empty_selection(body):
+    with pytest.raises(HTTPException) as refused:
+        # Refused before the database is touched
+        await _bulk_update(None, AlertBulkRequest(**body), ("open",), {"status": "resolved"}, "resolve", None)
+    assert refused.value.status_code == 400
@@ -0,0 +1,21 @@
+"""Malformed stream messages are reported as CodecError."""
+
+import msgpack
+import pytest
+
+from app.core.codec import CodecError, decode
+
+
+@pytest.mark.parametrize("envelope", [
+    {"t": "sighting", "v": "1", "d": {}},
+    {"t": "sighting", "v": None, "d": {}},
+    {"t": "sighting", "v": 1.5, "d": {}},
+    {"t": "sighting", "v": True, "d": {}},
+    {"t": ["sighting"], "v": 1, "d": {}},
+    {"t": 7, "v": 1, "d": {}},
+    {"t": "sighting", "v": 1, "d": [1, 2]},
+    ["sighting", 1, {}],
+])
+def test_decode_rejects_malformed_envelopes(envelope):
+    with pytest.raises(CodecError):
+        decode(msgpack.packb(envelope, use_bin_type=True))
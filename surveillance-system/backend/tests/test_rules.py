@@ -0,0 +1,43 @@
+"""Compiled rules keep the filter semantics of AlertRule.should_trigger."""
+
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from app.models.alert import AlertRule
+from app.services.rules import RuleIndex, SightingEvent, compile_rule
+
+ENTRANCE = "550e8400-e29b-41d4-a716-446655440000"
+
+
+def _event(subject_type, subject_id="s1", confidence=0.9, camera_id=ENTRANCE):
+    return SightingEvent(
+        sighting_id=str(uuid4()),
+        camera_id=camera_id,
+        subject_id=subject_id,
+        subject_type=subject_type,
+        recognition_confidence=confidence,
+        detection_confidence=0.99,
+        detected_at=datetime.now(timezone.utc)
+    )
+
+
+def test_whitelist_matches_listed_subject_types_only():
+    # The seeded "VIP Arrival" rule
+    rule = compile_rule(AlertRule(
+        rule_id=uuid4(),
+        name="VIP Arrival",
+        rule_type="whitelist",
+        conditions={"subject_types": ["vip"], "cameras": [ENTRANCE], "min_confidence": 0.85},
+        is_active=True,
+        priority=3,
+        cooldown_seconds=0
+    ))
+    index = RuleIndex()
+    index.add(rule)
+
+    assert rule.subject_types == {"vip"}
+    assert index.match(_event("vip")) == [rule]
+    assert index.match(_event("employee")) == []
+    assert index.match(_event(None, subject_id=None)) == []
+    assert index.match(_event("vip", confidence=0.5)) == []
+    assert index.match(_event("vip", camera_id=str(uuid4()))) == []
@@ -47,6 +47,6 @@ CREATE TRIGGER update_cameras_updated_at
 
 -- Comments
 COMMENT ON TABLE cameras IS 'IPTV surveillance camera configuration and metadata';
-COMMENT ON COLUMN cameras.stream_config IS 'JSON configuration: protocol, resolution, fps, codec, auth_type';
+COMMENT ON COLUMN cameras.stream_config IS 'JSON configuration: protocol, resolution, fps, codec, auth_type, min_sample_rate, max_sample_rate';
 COMMENT ON COLUMN cameras.detection_zones IS 'Array of polygon coordinates defining regions of interest';
 COMMENT ON COLUMN cameras.health_status IS 'Current stream health: healthy, degraded, disconnected, unknown, error';
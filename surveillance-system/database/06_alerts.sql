@@ -24,8 +24,10 @@ CREATE TABLE alert_rules (
 );
 
 -- Alert Logs Table
+-- Partitioned by month; closed alerts past ALERT_ARCHIVE_AFTER_DAYS are
+-- exported to MinIO and removed by the archival worker
 CREATE TABLE alert_logs (
-    alert_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    alert_id UUID NOT NULL DEFAULT uuid_generate_v4(),
     rule_id UUID REFERENCES alert_rules(rule_id) ON DELETE SET NULL,
     subject_id UUID REFERENCES subjects(subject_id) ON DELETE SET NULL,
     camera_id UUID REFERENCES cameras(camera_id) ON DELETE SET NULL,
@@ -37,11 +39,43 @@ CREATE TABLE alert_logs (
     acknowledged_at TIMESTAMP WITH TIME ZONE,
     resolved_at TIMESTAMP WITH TIME ZONE,
     notes TEXT,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    
+    -- The partition key has to be part of the primary key
+    PRIMARY KEY (alert_id, created_at),
     
     -- Constraints
     CONSTRAINT valid_alert_status CHECK (status IN ('open', 'acknowledged', 'resolved', 'false_positive', 'escalated'))
-);
+) PARTITION BY RANGE (created_at);
+
+-- Monthly partitions; create_alert_logs_partition() adds the following ones
+CREATE TABLE alert_logs_y2026m01 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-01-01') TO ('2026-02-01');
+CREATE TABLE alert_logs_y2026m02 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-02-01') TO ('2026-03-01');
+CREATE TABLE alert_logs_y2026m03 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-03-01') TO ('2026-04-01');
+CREATE TABLE alert_logs_y2026m04 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-04-01') TO ('2026-05-01');
+CREATE TABLE alert_logs_y2026m05 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-05-01') TO ('2026-06-01');
+CREATE TABLE alert_logs_y2026m06 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-06-01') TO ('2026-07-01');
+CREATE TABLE alert_logs_y2026m07 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-07-01') TO ('2026-08-01');
+CREATE TABLE alert_logs_y2026m08 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-08-01') TO ('2026-09-01');
+CREATE TABLE alert_logs_y2026m09 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-09-01') TO ('2026-10-01');
+CREATE TABLE alert_logs_y2026m10 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-10-01') TO ('2026-11-01');
+CREATE TABLE alert_logs_y2026m11 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-11-01') TO ('2026-12-01');
+CREATE TABLE alert_logs_y2026m12 PARTITION OF alert_logs
+    FOR VALUES FROM ('2026-12-01') TO ('2027-01-01');
+
+-- Default partition for any data outside defined ranges
+CREATE TABLE alert_logs_default PARTITION OF alert_logs DEFAULT;
 
 -- Indexes for alert_rules
 CREATE INDEX idx_alert_rules_active ON alert_rules(is_active);
@@ -60,6 +94,26 @@ CREATE INDEX idx_alert_logs_status_created ON alert_logs(status, created_at DESC
 CREATE INDEX idx_alert_logs_open ON alert_logs(created_at DESC)
     WHERE status = 'open';
 
+-- Alert list order (priority, then newest) with the keyset tie-breaker, per
+-- status and for the default listing of active alerts. Alerts without a
+-- priority sort as priority 0, after all others
+CREATE INDEX idx_alert_logs_status_priority ON alert_logs(status, (COALESCE(priority, 0)) DESC, created_at DESC, alert_id DESC);
+CREATE INDEX idx_alert_logs_active_priority ON alert_logs((COALESCE(priority, 0)) DESC, created_at DESC, alert_id DESC)
+    WHERE status IN ('open', 'acknowledged', 'escalated');
+CREATE INDEX idx_alert_logs_camera_priority ON alert_logs(camera_id, (COALESCE(priority, 0)) DESC, created_at DESC, alert_id DESC)
+    WHERE status IN ('open', 'acknowledged', 'escalated');
+
+-- Notification jobs of committed alerts, written in the same transaction
+-- and deleted once they are on the actions stream; whatever is left over
+-- is queued again by the alert engines
+CREATE TABLE alert_action_outbox (
+    job_id UUID PRIMARY KEY,
+    job JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX idx_alert_action_outbox_created ON alert_action_outbox(created_at);
+
 -- Trigger to update updated_at on alert_rules
 CREATE TRIGGER update_alert_rules_updated_at
     BEFORE UPDATE ON alert_rules
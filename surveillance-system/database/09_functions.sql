@@ -144,6 +144,34 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Function to create monthly partition for alert_logs
+CREATE OR REPLACE FUNCTION create_alert_logs_partition(
+    year INTEGER,
+    month INTEGER
+)
+RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT;
+    start_date TEXT;
+    end_date TEXT;
+BEGIN
+    partition_name := 'alert_logs_y' || year || 'm' || LPAD(month::TEXT, 2, '0');
+    start_date := year || '-' || LPAD(month::TEXT, 2, '0') || '-01';
+    end_date := year || '-' || LPAD((month + 1)::TEXT, 2, '0') || '-01';
+    
+    IF month = 12 THEN
+        end_date := (year + 1) || '-01-01';
+    END IF;
+    
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF alert_logs FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_date, end_date
+    );
+    
+    RETURN partition_name;
+END;
+$$ language 'plpgsql';
+
 -- View for active alerts with details
 CREATE VIEW active_alerts AS
 SELECT 
@@ -237,3 +265,4 @@ COMMENT ON FUNCTION search_subjects_by_face IS 'Vector similarity search for fac
 COMMENT ON FUNCTION get_subject_timeline IS 'Get chronological movement history for a subject';
 COMMENT ON FUNCTION get_camera_stats IS 'Get detection statistics for a camera';
 COMMENT ON FUNCTION create_sightings_partition IS 'Create monthly partition for sightings table';
+COMMENT ON FUNCTION create_alert_logs_partition IS 'Create monthly partition for alert_logs table';